@@ -0,0 +1,111 @@
+"""Список диалогов при большом числе одновременных запросов: sync-обработчик против async.
+
+Sync-вариант — прежний путь: get_db + get_current_user в пуле потоков
+(по умолчанию 40 потоков anyio), async — /api/messenger/threads на
+AsyncSession. Оба вызывают один и тот же messenger.thread_list, так что
+разница только в том, где ждут ввода-вывода БД. Когда потоков больше, чем
+соединений в пуле, sync-путь может встать: зависимость уже держит
+соединение, а обработчик ждёт свободный поток — такие запросы падают по
+pool_timeout и считаются ошибками. Запуск из каталога backend:
+    python benchmarks/bench_async.py --concurrency 200 --requests 3000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import Scale  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+
+async def run(client, url: str, tokens: List[dict], requests: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in remaining:
+            started = time.perf_counter()
+            response = await client.get(url, headers=tokens[i % len(tokens)])
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "rps": requests / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "errors": errors,
+    }
+
+
+async def bench(args: argparse.Namespace) -> None:
+    import anyio
+    import httpx
+    from fastapi import Depends
+    from sqlalchemy.orm import Session
+
+    import main
+    from config import settings
+    from database import SessionLocal, get_db
+    from db_migrations import recreate_database
+    from datagen import generate
+    from dependencies import get_current_user
+    from messenger import thread_list
+    from models import User
+    from settings import create_access_token, user_claims
+    from user_cache import user_cache
+
+    settings.SLOW_QUERY_MS = 0
+    # схема — миграциями, как у рабочей базы (с её индексами)
+    recreate_database()
+    db = SessionLocal()
+    try:
+        data = generate(db, Scale(students=args.students))
+        tokens = [
+            {"Authorization": f"Bearer {create_access_token(user_claims(user))}"}
+            for user in db.query(User).filter(User.id.in_(data.student_ids))
+        ]
+    finally:
+        db.close()
+
+    @main.app.get("/bench/sync-threads")
+    def sync_threads(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+        return thread_list(db, current_user)
+
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    print(f"потоков в пуле: {limiter.total_tokens}, одновременных запросов: {args.concurrency}")
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, url in (("sync", "/bench/sync-threads"), ("async", "/api/messenger/threads")):
+            user_cache.clear()
+            await run(client, url, tokens, min(args.requests, 200), args.concurrency)  # прогрев
+            r = await run(client, url, tokens, args.requests, args.concurrency)
+            print(
+                f"{name:6} {r['rps']:8.1f} запросов/с  p50 {r['p50']:7.1f} мс  "
+                f"p95 {r['p95']:7.1f} мс  ошибок {r['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--pool-timeout", type=int, default=5, help="DB_POOL_TIMEOUT_SECONDS, с")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix="fenix-bench-async-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(db_dir, 'app.db')}"
+    os.environ["DB_POOL_TIMEOUT_SECONDS"] = str(args.pool_timeout)
+    asyncio.run(bench(args))
@@ -0,0 +1,86 @@
+"""Бенчмарк авторизованных запросов: GET /api/auth/me без кеша пользователей и с ним.
+
+Запросы идут в приложение напрямую через ASGI (без сети), по --concurrency
+одновременно. Запуск из каталога backend:
+    python benchmarks/bench_auth.py --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# отдельная временная БД, чтобы не трогать fenix.db
+_db_dir = tempfile.mkdtemp(prefix="fenix-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import User, UserRole, UserStatus  # noqa: E402
+from settings import create_access_token, get_password_hash, user_claims  # noqa: E402
+from user_cache import user_cache  # noqa: E402
+
+
+def create_user() -> User:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = User(
+            email="bench@fenixedu.ru",
+            full_name="Бенчмарк",
+            hashed_password=get_password_hash("bench123"),
+            role=UserRole.STUDENT,
+            status=UserStatus.ACTIVE,
+            group="Б9121",
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        return user
+    finally:
+        db.close()
+
+
+async def run(client: httpx.AsyncClient, headers: dict, requests: int, concurrency: int) -> float:
+    async def worker(count: int) -> None:
+        for _ in range(count):
+            response = await client.get("/api/auth/me", headers=headers)
+            assert response.status_code == 200, response.text
+
+    per_worker = requests // concurrency
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+    return per_worker * concurrency / (time.perf_counter() - started)
+
+
+async def bench(requests: int, concurrency: int) -> None:
+    user = create_user()
+    headers = {"Authorization": f"Bearer {create_access_token(user_claims(user))}"}
+
+    async with httpx.AsyncClient(app=main.app, base_url="http://bench") as client:
+        await run(client, headers, 100, concurrency)  # прогрев
+
+        max_size = user_cache.max_size
+        user_cache.max_size = 0
+        user_cache.clear()
+        without_cache = await run(client, headers, requests, concurrency)
+
+        user_cache.max_size = max_size
+        with_cache = await run(client, headers, requests, concurrency)
+
+    print(f"без кеша пользователей: {without_cache:8.1f} запросов/с")
+    print(f"с кешем пользователей:  {with_cache:8.1f} запросов/с")
+    print(f"ускорение:              {with_cache / without_cache:8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(bench(args.requests, args.concurrency))
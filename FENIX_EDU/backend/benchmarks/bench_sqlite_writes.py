@@ -0,0 +1,159 @@
+"""Параллельные запись и чтение в SQLite: прежний движок против create_db_engine.
+
+Потоки повторяют то, что делают обработчики в час пик: ответ в диалог
+(сообщение + счётчик непрочитанных), сдача задания (upsert + версия) и
+чтение списка диалогов. Считаются ошибки "database is locked", пропускная
+способность и p95. Запуск из каталога backend:
+    python benchmarks/bench_sqlite_writes.py --threads 64 --operations 60
+
+Код выхода 1 — у настроенного движка были ошибки блокировки. Регрессию
+(блокировки и таймауты пула) ловит tests/test_database_pool.py.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+_db_dir = tempfile.mkdtemp(prefix="fenix-sqlite-writes-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'app.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, exc, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from config import settings  # noqa: E402
+from database import Base, create_db_engine  # noqa: E402
+from messenger import register_incoming_message  # noqa: E402
+from models import Assignment, Course, Message, MessageThread, User, UserRole, UserStatus  # noqa: E402
+from submissions import upsert_submission  # noqa: E402
+
+
+def legacy_engine(url: str):
+    # прежние настройки SQLite (журнал DELETE, ожидание блокировки 5 с) при том
+    # же размере пула — сравнивается только режим SQLite, а не очередь за пулом
+    return create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+    )
+
+
+def seed(Session, students: int) -> dict:
+    db = Session()
+    try:
+        now = datetime.utcnow()
+        db.execute(insert(User), [
+            {
+                "email": f"u{i}@bench.fenixedu.ru", "full_name": f"u{i}", "hashed_password": "-",
+                "role": UserRole.TEACHER if i == 0 else UserRole.STUDENT,
+                "status": UserStatus.ACTIVE, "created_at": now,
+            }
+            for i in range(students + 1)
+        ])
+        teacher_id = db.query(User.id).filter(User.role == UserRole.TEACHER).scalar()
+        student_ids = [row[0] for row in db.query(User.id).filter(User.role == UserRole.STUDENT).order_by(User.id)]
+        course = Course(name="bench")
+        db.add(course)
+        db.flush()
+        assignment = Assignment(course_id=course.id, subsection_id=1, title="bench", created_by=teacher_id)
+        db.add(assignment)
+        db.execute(insert(MessageThread), [
+            {"student_id": sid, "teacher_id": teacher_id, "last_message_at": now} for sid in student_ids
+        ])
+        db.commit()
+        threads = dict(db.query(MessageThread.student_id, MessageThread.id))
+        return {"assignment_id": assignment.id, "students": student_ids, "threads": threads}
+    finally:
+        db.close()
+
+
+def reply(Session, thread_id: int, sender_id: int) -> None:
+    db = Session()
+    try:
+        thread = db.query(MessageThread).filter(MessageThread.id == thread_id).first()
+        db.add(Message(thread_id=thread_id, sender_id=sender_id, content="ответ"))
+        register_incoming_message(thread, sender_id)
+        thread.last_message_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+def submit(Session, assignment_id: int, student_id: int) -> None:
+    db = Session()
+    try:
+        upsert_submission(db, assignment_id, student_id, "решение", None)
+        db.commit()
+    finally:
+        db.close()
+
+
+def inbox(Session, student_id: int) -> None:
+    db = Session()
+    try:
+        db.query(MessageThread).filter(MessageThread.student_id == student_id).all()
+        db.query(Message).join(MessageThread).filter(MessageThread.student_id == student_id).count()
+    finally:
+        db.close()
+
+
+def run(name: str, engine, threads: int, operations: int) -> int:
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    data = seed(Session, threads)
+
+    latencies, errors = [], {"locked": 0, "other": 0}
+    lock = threading.Lock()
+
+    def worker(student_id: int) -> None:
+        for i in range(operations):
+            kind = i % 3
+            started = time.perf_counter()
+            try:
+                if kind == 0:
+                    reply(Session, data["threads"][student_id], student_id)
+                elif kind == 1:
+                    submit(Session, data["assignment_id"], student_id)
+                else:
+                    inbox(Session, student_id)
+            except exc.OperationalError as e:
+                with lock:
+                    errors["locked" if "locked" in str(e) else "other"] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    pool = [threading.Thread(target=worker, args=(sid,)) for sid in data["students"]]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0
+    total = threads * operations
+    print(
+        f"{name:8} операций: {total:6}  'database is locked': {errors['locked']:5}  "
+        f"прочие ошибки: {errors['other']:3}  {total / elapsed:8.1f} оп/с  p95 {p95:8.1f} мс"
+    )
+    engine.dispose()
+    return errors["locked"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--operations", type=int, default=60, help="операций на поток")
+    args = parser.parse_args()
+    settings.SLOW_QUERY_MS = 0  # ожидание блокировок здесь ожидаемо — не засоряем вывод
+
+    run("прежний", legacy_engine(f"sqlite:///{os.path.join(_db_dir, 'legacy.db')}"), args.threads, args.operations)
+    locked = run("новый", create_db_engine(f"sqlite:///{os.path.join(_db_dir, 'tuned.db')}", name="bench"),
+                 args.threads, args.operations)
+    sys.exit(1 if locked else 0)
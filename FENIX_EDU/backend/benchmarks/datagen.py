@@ -0,0 +1,235 @@
+"""Генератор синтетических данных для нагрузочных тестов.
+
+Создаёт преподавателей, студентов по группам, курсы со структурой, диалоги
+с сообщениями, обсуждения и задания со сдачами. Вставка идёт пачками
+(INSERT ... VALUES на много строк), пароль у всех один — bcrypt считается один раз.
+
+Отдельный запуск заполняет указанную БД (таблицы пересоздаются!):
+    python benchmarks/datagen.py --database-url sqlite:///./bench.db --students 500
+"""
+import argparse
+import os
+import random
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_PASSWORD = "bench123"
+BATCH = 1000
+
+
+@dataclass
+class Scale:
+    teachers: int = 10
+    groups: int = 10
+    students: int = 300
+    courses: int = 10
+    sections_per_course: int = 5
+    subsections_per_section: int = 4
+    threads_per_student: int = 2
+    messages_per_thread: int = 20
+    comments_per_subsection: int = 10
+    replies_per_comment: int = 3
+    assignments_per_course: int = 3
+    seed: int = 42
+
+
+@dataclass
+class Dataset:
+    """id созданных объектов — по ним сценарии выбирают, кого и что запрашивать"""
+
+    teacher_ids: List[int] = field(default_factory=list)
+    student_ids: List[int] = field(default_factory=list)
+    student_emails: Dict[int, str] = field(default_factory=dict)
+    student_course: Dict[int, int] = field(default_factory=dict)
+    course_ids: List[int] = field(default_factory=list)
+    course_subsections: Dict[int, List[int]] = field(default_factory=dict)
+    course_assignments: Dict[int, List[int]] = field(default_factory=dict)
+
+
+def _insert(db, model, rows: List[dict]) -> None:
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), BATCH):
+        db.execute(insert(model), rows[start:start + BATCH])
+
+
+def _ids(db, model, **filters) -> List[int]:
+    query = db.query(model.id)
+    for name, value in filters.items():
+        query = query.filter(getattr(model, name) == value)
+    return [row[0] for row in query.order_by(model.id)]
+
+
+def generate(db, scale: Scale) -> Dataset:
+    """Заполнить пустую БД данными масштаба scale"""
+    from models import (
+        Assignment, AssignmentSubmission, Course, CourseSection, CourseStructureModel,
+        CourseSubsection, DiscussionComment, DiscussionReply, Message, MessageThread,
+        User, UserRole, UserStatus,
+    )
+    from settings import get_password_hash
+
+    rnd = random.Random(scale.seed)
+    now = datetime.utcnow()
+    password = get_password_hash(BENCH_PASSWORD)
+    data = Dataset()
+
+    def user_row(email, name, role, group=None):
+        return {
+            "email": email, "full_name": name, "hashed_password": password,
+            "role": role, "status": UserStatus.ACTIVE, "group": group, "created_at": now,
+        }
+
+    groups = [f"Б{9100 + g}" for g in range(scale.groups)]
+    _insert(db, User, [
+        user_row(f"teacher{i}@bench.fenixedu.ru", f"Преподаватель {i}", UserRole.TEACHER)
+        for i in range(scale.teachers)
+    ])
+    _insert(db, User, [
+        user_row(f"student{i}@bench.fenixedu.ru", f"Студент {i}", UserRole.STUDENT, groups[i % scale.groups])
+        for i in range(scale.students)
+    ])
+    data.teacher_ids = _ids(db, User, role=UserRole.TEACHER)
+    students = db.query(User.id, User.email, User.group).filter(User.role == UserRole.STUDENT).order_by(User.id).all()
+    data.student_ids = [s.id for s in students]
+    data.student_emails = {s.id: s.email for s in students}
+
+    # курсы: по одному на группу по кругу
+    _insert(db, Course, [
+        {"name": f"Курс {c}", "description": "Нагрузочный тест", "target_group": groups[c % scale.groups], "created_at": now}
+        for c in range(scale.courses)
+    ])
+    courses = db.query(Course.id, Course.target_group).order_by(Course.id).all()
+    data.course_ids = [c.id for c in courses]
+    course_by_group = {}
+    for c in courses:
+        course_by_group.setdefault(c.target_group, c.id)
+    for s in students:
+        data.student_course[s.id] = course_by_group.get(s.group, data.course_ids[0])
+
+    _insert(db, CourseStructureModel, [{"course_id": cid, "data": {}, "version": 1} for cid in data.course_ids])
+    _insert(db, CourseSection, [
+        {"course_id": cid, "number": n + 1, "title": f"Раздел {n + 1}", "position": n}
+        for cid in data.course_ids for n in range(scale.sections_per_course)
+    ])
+    sections = db.query(CourseSection.id, CourseSection.course_id).order_by(CourseSection.id).all()
+    _insert(db, CourseSubsection, [
+        {
+            "course_id": s.course_id, "section_id": s.id, "icon": "📄", "title": f"Тема {n + 1}",
+            "status": "", "status_icon": "", "position": n,
+        }
+        for s in sections for n in range(scale.subsections_per_section)
+    ])
+    for sub_id, course_id in db.query(CourseSubsection.id, CourseSubsection.course_id).order_by(CourseSubsection.id):
+        data.course_subsections.setdefault(course_id, []).append(sub_id)
+
+    # диалоги студент — преподаватель с историей сообщений
+    threads = []
+    for sid in data.student_ids:
+        for teacher_id in rnd.sample(data.teacher_ids, min(scale.threads_per_student, len(data.teacher_ids))):
+            threads.append({
+                "student_id": sid, "teacher_id": teacher_id, "last_message_at": now,
+                "student_unread_count": 0, "teacher_unread_count": 0,
+                "student_last_read_id": 0, "teacher_last_read_id": 0, "is_archived": False,
+            })
+    _insert(db, MessageThread, threads)
+    messages = []
+    for thread_id, student_id, teacher_id in db.query(
+        MessageThread.id, MessageThread.student_id, MessageThread.teacher_id
+    ).order_by(MessageThread.id):
+        start = now - timedelta(days=30)
+        for n in range(scale.messages_per_thread):
+            messages.append({
+                "thread_id": thread_id, "sender_id": student_id if n % 2 == 0 else teacher_id,
+                "content": f"Сообщение {n}", "is_read": True, "created_at": start + timedelta(minutes=n),
+            })
+    _insert(db, Message, messages)
+
+    # обсуждения подразделов
+    authors = data.student_ids + data.teacher_ids
+    _insert(db, DiscussionComment, [
+        {
+            "course_id": cid, "subsection_id": sub_id, "author_id": rnd.choice(authors),
+            "content": f"Вопрос {n}", "created_at": now - timedelta(hours=scale.comments_per_subsection - n),
+        }
+        for cid, subs in data.course_subsections.items() for sub_id in subs
+        for n in range(scale.comments_per_subsection)
+    ])
+    _insert(db, DiscussionReply, [
+        {
+            "comment_id": comment_id, "author_id": rnd.choice(authors), "content": f"Ответ {n}",
+            "created_at": created_at + timedelta(minutes=n + 1),
+        }
+        for comment_id, created_at in db.query(DiscussionComment.id, DiscussionComment.created_at)
+        for n in range(scale.replies_per_comment)
+    ])
+
+    # задания: дедлайн через минуту, часть студентов уже сдала
+    _insert(db, Assignment, [
+        {
+            "course_id": cid, "subsection_id": data.course_subsections[cid][0], "title": f"Задание {n + 1}",
+            "description": "", "deadline": now + timedelta(minutes=1),
+            "created_by": data.teacher_ids[0], "created_at": now,
+        }
+        for cid in data.course_ids for n in range(scale.assignments_per_course)
+    ])
+    for aid, cid in db.query(Assignment.id, Assignment.course_id).order_by(Assignment.id):
+        data.course_assignments.setdefault(cid, []).append(aid)
+    _insert(db, AssignmentSubmission, [
+        {
+            "assignment_id": aid, "student_id": sid, "content": "черновик", "version": 1,
+            "created_at": now, "updated_at": now,
+        }
+        for sid in data.student_ids[::2]
+        for aid in data.course_assignments[data.student_course[sid]]
+    ])
+
+    db.commit()
+    return data
+
+
+def counts(db) -> Dict[str, int]:
+    from models import (
+        AssignmentSubmission, Course, CourseSubsection, DiscussionComment, DiscussionReply,
+        Message, MessageThread, User,
+    )
+
+    return {
+        model.__tablename__: db.query(model).count()
+        for model in (User, Course, CourseSubsection, MessageThread, Message,
+                      DiscussionComment, DiscussionReply, AssignmentSubmission)
+    }
+
+
+def add_scale_arguments(parser: argparse.ArgumentParser) -> None:
+    for name, value in asdict(Scale()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=value)
+
+
+def scale_from_args(args: argparse.Namespace) -> Scale:
+    return Scale(**{name: getattr(args, name) for name in asdict(Scale())})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True)
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    from database import SessionLocal
+    from db_migrations import recreate_database
+
+    # схема — миграциями, как у рабочей базы (с её индексами)
+    recreate_database()
+    session = SessionLocal()
+    try:
+        generate(session, scale_from_args(args))
+        for table, count in counts(session).items():
+            print(f"{table:28} {count:8}")
+    finally:
+        session.close()
@@ -0,0 +1,268 @@
+"""Нагрузочные сценарии API: вход, опрос входящих, открытие обсуждения, сдача в последнюю минуту.
+
+Приложение из main.py вызывается напрямую через ASGI (без сети), база —
+временная SQLite или переданная через --database-url (например, Postgres;
+таблицы в ней пересоздаются миграциями!), данные — из benchmarks/datagen.py.
+
+По каждому сценарию выводятся p50/p95/p99 задержки, запросов в секунду и
+SQL-запросов на HTTP-запрос. Запуск из каталога backend:
+    python benchmarks/loadtest.py                       # сравнить с baselines.json
+    python benchmarks/loadtest.py --update-baseline     # записать новую базу
+    python benchmarks/loadtest.py --scenario inbox_polling --requests 2000
+
+Код выхода 1 — есть регрессия относительно базы: ошибок больше, чем в базе
+(с допуском 1% запросов), p95 выше базы больше, чем на --latency-tolerance, rps
+ниже базы больше, чем на неё же, или SQL-запросов на HTTP-запрос больше, чем
+допускает --query-tolerance. Задержки зависят от машины — базу стоит
+записывать на той же, где идёт сравнение; число SQL-запросов от машины не
+зависит.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import BENCH_PASSWORD, Dataset, add_scale_arguments, scale_from_args  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# сценарий -> число запросов по умолчанию
+SCENARIOS: Dict[str, int] = {
+    "login_storm": 200,
+    "inbox_polling": 1000,
+    "discussion_open": 1000,
+    "deadline_submit": 500,
+}
+
+
+class Scenario:
+    """Бесконечный поток запросов сценария: next() -> (method, url, kwargs)"""
+
+    def __init__(self, name: str, data: Dataset, tokens: Dict[int, dict], seed: int):
+        self.name = name
+        self.data = data
+        self.tokens = tokens
+        self.rnd = random.Random(seed)
+        self.make: Callable[[], tuple] = getattr(self, name)
+        # в последнюю минуту каждый студент сдаёт по кругу, а не случайный
+        self.submitters = itertools.cycle(data.student_ids)
+
+    def login_storm(self) -> tuple:
+        student_id = self.rnd.choice(self.data.student_ids)
+        body = {"email": self.data.student_emails[student_id], "password": BENCH_PASSWORD}
+        return "POST", "/api/auth/login", {"json": body}
+
+    def inbox_polling(self) -> tuple:
+        headers = self.tokens[self.rnd.choice(self.data.student_ids)]
+        url = self.rnd.choice(("/api/messenger/unread-count", "/api/messenger/threads"))
+        return "GET", url, {"headers": headers}
+
+    def discussion_open(self) -> tuple:
+        student_id = self.rnd.choice(self.data.student_ids)
+        course_id = self.data.student_course[student_id]
+        headers = self.tokens[student_id]
+        if self.rnd.random() < 0.5:
+            return "GET", f"/api/courses/{course_id}/structure", {"headers": headers}
+        subsection_id = self.rnd.choice(self.data.course_subsections[course_id])
+        params = {"course_id": course_id, "subsection_id": subsection_id}
+        return "GET", "/api/discussions", {"headers": headers, "params": params}
+
+    def deadline_submit(self) -> tuple:
+        student_id = next(self.submitters)
+        assignment_id = self.data.course_assignments[self.data.student_course[student_id]][0]
+        headers = {**self.tokens[student_id], "Idempotency-Key": uuid.uuid4().hex}
+        body = {"content": f"решение {self.rnd.random():.6f}"}
+        return "POST", f"/api/assignments/{assignment_id}/submit", {"headers": headers, "json": body}
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def run_scenario(client, scenario: Scenario, requests: int, concurrency: int, queries: dict) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            method, url, kwargs = scenario.make()
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries["n"] = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries_per_request": round(queries["n"] / requests, 2),
+    }
+
+
+def compare(name: str, result: dict, baseline: dict, latency_tolerance: float, query_tolerance: float) -> List[str]:
+    problems = []
+    # ошибки сверх базы (допуск — 1% запросов на случайные блокировки БД)
+    allowed_errors = baseline["errors"] + result["requests"] // 100
+    if result["errors"] > allowed_errors:
+        problems.append(f"{name}: {result['errors']} ответов с ошибкой, база {baseline['errors']}")
+    if result["p95_ms"] > baseline["p95_ms"] * (1 + latency_tolerance):
+        problems.append(f"{name}: p95 {result['p95_ms']} мс, база {baseline['p95_ms']} мс")
+    if result["rps"] < baseline["rps"] * (1 - latency_tolerance):
+        problems.append(f"{name}: {result['rps']} запросов/с, база {baseline['rps']}")
+    allowed_queries = baseline["queries_per_request"] * (1 + query_tolerance) + 0.01
+    if result["queries_per_request"] > allowed_queries:
+        problems.append(
+            f"{name}: {result['queries_per_request']} SQL на запрос, база {baseline['queries_per_request']}"
+        )
+    return problems
+
+
+def print_table(results: Dict[str, dict]) -> None:
+    print(f"{'сценарий':18} {'запросов':>8} {'ошибок':>6} {'rps':>8} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'SQL/запр':>8}")
+    for name, r in results.items():
+        print(
+            f"{name:18} {r['requests']:8} {r['errors']:6} {r['rps']:8} {r['p50_ms']:8} "
+            f"{r['p95_ms']:8} {r['p99_ms']:8} {r['queries_per_request']:8}"
+        )
+
+
+async def bench(args: argparse.Namespace) -> int:
+    import httpx
+    from sqlalchemy import event
+
+    import main
+    from config import settings
+    from database import SessionLocal, async_engine, engine
+    from db_migrations import recreate_database
+    from datagen import generate
+    from settings import create_access_token, user_claims
+    from models import User
+    from structure_cache import structure_cache
+    from user_cache import user_cache
+
+    # ожидание блокировок под нагрузкой ожидаемо — лог медленных запросов не нужен
+    settings.SLOW_QUERY_MS = 0
+    # схема — миграциями, как у рабочей базы (с её индексами)
+    recreate_database()
+    db = SessionLocal()
+    try:
+        data = generate(db, scale_from_args(args))
+        tokens = {
+            user.id: {"Authorization": f"Bearer {create_access_token(user_claims(user))}"}
+            for user in db.query(User).filter(User.id.in_(data.student_ids))
+        }
+    finally:
+        db.close()
+
+    queries = {"n": 0}
+
+    def count_query(*_):
+        queries["n"] += 1
+
+    # горячие чтения идут через async-движок — считаем запросы обоих
+    for counted in (engine, async_engine.sync_engine):
+        event.listen(counted, "before_cursor_execute", count_query)
+
+    names = args.scenario or list(SCENARIOS)
+    results = {}
+    # исключение приложения — это ответ 500 и ошибка сценария, а не остановка прогона
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in names:
+            requests = args.requests or SCENARIOS[name]
+            scenario = Scenario(name, data, tokens, args.seed)
+            # каждый сценарий с холодными кешами — результат не зависит от предыдущих
+            user_cache.clear()
+            structure_cache.clear()
+            await run_scenario(client, scenario, min(requests, 50), args.concurrency, queries)  # прогрев
+            results[name] = await run_scenario(client, scenario, requests, args.concurrency, queries)
+
+    print_table(results)
+    params = {
+        "scale": vars(scale_from_args(args)),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "database": engine.dialect.name,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "results": results}, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {"params": params, "machine": platform.platform(), "results": results},
+                f, ensure_ascii=False, indent=2,
+            )
+            f.write("\n")
+        print(f"база записана в {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"нет базы {args.baseline} — сравнивать не с чем (запустите с --update-baseline)")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["params"] != params:
+        print("параметры запуска не совпадают с базой — сравнение невозможно")
+        print(f"  база:   {baseline['params']}\n  сейчас: {params}")
+        return 2
+
+    problems = []
+    for name, result in results.items():
+        if name in baseline["results"]:
+            problems += compare(name, result, baseline["results"][name], args.latency_tolerance, args.query_tolerance)
+    for problem in problems:
+        print(f"РЕГРЕССИЯ {problem}")
+    if not problems:
+        print("регрессий относительно базы нет")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="можно указать несколько раз")
+    parser.add_argument("--requests", type=int, default=0, help="запросов на сценарий (0 — значение сценария)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--database-url", help="по умолчанию — временная SQLite")
+    parser.add_argument("--baseline", default=BASELINES)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="записать результаты в JSON")
+    parser.add_argument("--latency-tolerance", type=float, default=0.5)
+    parser.add_argument("--query-tolerance", type=float, default=0.1)
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    # отдельная БД, чтобы не трогать fenix.db; задаётся до импорта database
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        db_dir = tempfile.mkdtemp(prefix="fenix-loadtest-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(db_dir, 'loadtest.db')}"
+
+    sys.exit(asyncio.run(bench(args)))
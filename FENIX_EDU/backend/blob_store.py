@@ -0,0 +1,288 @@
+import copy
+import hashlib
+import os
+import shutil
+from typing import Optional
+
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import AssignmentAttachment, CourseStructureModel, FileBlob, SubsectionFile
+from uploads import CHUNK_SIZE, UPLOAD_DIR, StagedUpload
+
+
+# -------- хранилище файлов по содержимому --------
+#
+# Файл хранится один раз под именем blobs/<первые 2 символа sha256>/<sha256><ext>,
+# строки file_blobs считают ссылки на него (вложения заданий, файлы подразделов).
+# Физический файл удаляется, только когда уходит последняя ссылка.
+#
+# Строка file_blobs служит и блокировкой содержимого: загрузка сначала вставляет
+# строку и только потом кладёт файл, а удаление файла держит на время удаления
+# строку-заглушку (remove_blob_file). Пока одна сторона держит ключ sha256, другая
+# ждёт конца её транзакции, поэтому файл не пропадает из-под новой ссылки.
+
+BLOB_PREFIX = "blobs"
+# файлы, положенные в хранилище в текущей транзакции сессии (см. _placed_blobs)
+PLACED_BLOBS = "placed_blobs"
+
+
+def blob_relpath(sha256: str, ext: str) -> str:
+    return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256}{ext}"
+
+
+def blob_url(blob: FileBlob) -> str:
+    return f"/uploads/{blob.path}"
+
+
+def blob_sha_from_url(url: Optional[str]) -> Optional[str]:
+    """sha256 из url вида /uploads/blobs/ab/<sha256>.pdf (для старых файлов — None)"""
+    if not url or not url.startswith(f"/uploads/{BLOB_PREFIX}/"):
+        return None
+    return os.path.splitext(os.path.basename(url))[0]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _add_reference(db: Session, sha256: str) -> bool:
+    result = db.execute(
+        update(FileBlob)
+        .where(FileBlob.sha256 == sha256)
+        .values(ref_count=FileBlob.ref_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def store_blob(db: Session, sha256: str, size: int, ext: str, place_file) -> FileBlob:
+    """Добавить ссылку на содержимое sha256.
+
+    Если такого содержимого ещё нет, создаётся строка file_blobs и
+    place_file(abs_path) кладёт файл на место; иначе файл не нужен и счётчик
+    ссылок растёт. Если транзакция потом откатится, положенный файл удаляется.
+    """
+    if not _add_reference(db, sha256):
+        path = blob_relpath(sha256, ext)
+        try:
+            # savepoint: параллельная загрузка того же содержимого могла успеть раньше
+            with db.begin_nested():
+                db.add(FileBlob(sha256=sha256, path=path, size=size, ref_count=1))
+        except IntegrityError:
+            _add_reference(db, sha256)
+        else:
+            # файл кладётся только под вставленной строкой — удаление того же
+            # содержимого (remove_blob_file) в это время ждёт её или уже закончилось
+            abs_path = os.path.join(UPLOAD_DIR, path)
+            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+            place_file(abs_path)
+            db.info.setdefault(PLACED_BLOBS, []).append(path)
+    return db.get(FileBlob, sha256)
+
+
+def store_upload(db: Session, item: StagedUpload) -> FileBlob:
+    """Сохранить принятый файл в хранилище (дубликат сразу удаляется)"""
+    blob = store_blob(db, item.sha256, item.size, item.ext, item.move_to)
+    item.discard()  # если файл уже был в хранилище, временная копия не нужна
+    return blob
+
+
+def release_blob(db: Session, sha256: Optional[str]) -> Optional[str]:
+    """Убрать ссылку на содержимое. Возвращает путь файла, который нужно удалить
+    после commit (если это была последняя ссылка), иначе None."""
+    if not sha256:
+        return None
+
+    blob = db.get(FileBlob, sha256)
+    if blob is None:
+        return None
+    path = blob.path
+
+    db.execute(
+        update(FileBlob)
+        .where(FileBlob.sha256 == sha256)
+        .values(ref_count=FileBlob.ref_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    # удаляем строку только если за это время никто не добавил новую ссылку
+    deleted = (
+        db.query(FileBlob)
+        .filter(FileBlob.sha256 == sha256)
+        .filter(FileBlob.ref_count <= 0)
+        .delete(synchronize_session=False)
+    )
+    db.expire(blob)
+    return path if deleted else None
+
+
+def remove_blob_file(path: Optional[str]) -> None:
+    """Удалить физический файл и его сжатые варианты (вызывать после commit).
+
+    Проверка и удаление идут под строкой-заглушкой file_blobs в отдельной
+    транзакции: если содержимое за это время снова загрузили (строка есть или
+    появляется), файл остаётся; параллельная загрузка ждёт конца удаления и
+    кладёт файл заново.
+    """
+    if not path:
+        return
+    sha256 = os.path.splitext(os.path.basename(path))[0]
+    db = SessionLocal()
+    try:
+        placeholder = FileBlob(sha256=sha256, path=path, size=0, ref_count=0)
+        db.add(placeholder)
+        try:
+            db.flush()
+        except IntegrityError:
+            return
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.remove(os.path.join(UPLOAD_DIR, path + suffix))
+            except FileNotFoundError:
+                pass
+        db.delete(placeholder)
+        db.commit()
+    finally:
+        db.close()
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_placed_blobs(session: Session) -> None:
+    session.info.pop(PLACED_BLOBS, None)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _placed_blobs(session: Session, transaction) -> None:
+    """Транзакция, положившая файлы в хранилище, закончилась без commit —
+    строки file_blobs откатились, и файлы без них удаляются."""
+    if transaction.parent is None:
+        for path in session.info.pop(PLACED_BLOBS, []):
+            remove_blob_file(path)
+
+
+# -------- миграция старых файлов --------
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def migrate_legacy_uploads(db: Session, dry_run: bool = False) -> dict:
+    """Перенести файлы uploads/<timestamp>.<ext> в хранилище по содержимому.
+
+    Сначала файлы связываются жёсткими ссылками с новыми путями, затем в одной
+    транзакции обновляются url и счётчики ссылок (вложения заданий, файлы
+    подразделов и файлы в ещё не перенесённых структурах курсов), и только
+    после commit удаляются старые имена. Повторный запуск безопасен: уже
+    перенесённые файлы в корне uploads/ не лежат.
+
+    Файлы, на которые ничто не ссылается, не переносятся и остаются на месте:
+    строка с ref_count=0 не удалилась бы никогда — удаление срабатывает только
+    когда счётчик падает до нуля. Их имена — в stats["unreferenced_files"].
+    """
+    stats = {
+        "files": 0,
+        "blobs": 0,
+        "duplicates": 0,
+        "attachments": 0,
+        "subsection_files": 0,
+        "structure_files": 0,
+    }
+    pending_attachments = db.query(AssignmentAttachment).filter(AssignmentAttachment.blob_sha256 == None).all()
+    pending_files = db.query(SubsectionFile).filter(SubsectionFile.blob_sha256 == None).all()
+    structures = db.query(CourseStructureModel).all()
+    referenced = {row.url for row in pending_attachments + pending_files}
+    for cs in structures:
+        for section in (cs.data or {}).get("sections", []):
+            for subsection in section.get("subsections", []):
+                referenced.update(f.get("url") for f in subsection.get("files", []))
+
+    blobs_by_url = {}
+    new_paths = []
+    unreferenced = []
+
+    for name in sorted(os.listdir(UPLOAD_DIR)):
+        abs_path = os.path.join(UPLOAD_DIR, name)
+        if name.startswith(".") or not os.path.isfile(abs_path):
+            continue
+        stats["files"] += 1
+        if f"/uploads/{name}" not in referenced:
+            unreferenced.append(name)
+            continue
+
+        sha256 = file_sha256(abs_path)
+        blob = db.get(FileBlob, sha256)
+        if blob is None:
+            blob = FileBlob(
+                sha256=sha256,
+                path=blob_relpath(sha256, os.path.splitext(name)[1].lower()),
+                size=os.path.getsize(abs_path),
+                ref_count=0,
+            )
+            db.add(blob)
+            db.flush()
+            new_paths.append((abs_path, os.path.join(UPLOAD_DIR, blob.path)))
+            stats["blobs"] += 1
+        else:
+            stats["duplicates"] += 1
+        blobs_by_url[f"/uploads/{name}"] = blob
+
+    for att in pending_attachments:
+        blob = blobs_by_url.get(att.url)
+        if blob is None:
+            continue
+        att.url = blob_url(blob)
+        att.blob_sha256 = blob.sha256
+        blob.ref_count += 1
+        stats["attachments"] += 1
+
+    for f in pending_files:
+        blob = blobs_by_url.get(f.url)
+        if blob is None:
+            continue
+        f.url = blob_url(blob)
+        f.blob_sha256 = blob.sha256
+        blob.ref_count += 1
+        stats["subsection_files"] += 1
+
+    for cs in structures:
+        data = copy.deepcopy(cs.data or {})
+        changed = False
+        for section in data.get("sections", []):
+            for subsection in section.get("subsections", []):
+                for f in subsection.get("files", []):
+                    blob = blobs_by_url.get(f.get("url"))
+                    if blob is None:
+                        continue
+                    f["url"] = blob_url(blob)
+                    blob.ref_count += 1
+                    changed = True
+                    stats["structure_files"] += 1
+        if changed:
+            cs.data = data
+
+    stats["unreferenced"] = len(unreferenced)
+    stats["unreferenced_files"] = unreferenced
+
+    if dry_run:
+        db.rollback()
+        return stats
+
+    for src, dst in new_paths:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if not os.path.exists(dst):
+            _link_or_copy(src, dst)
+    db.commit()
+
+    for url in blobs_by_url:
+        os.remove(os.path.join(UPLOAD_DIR, url[len("/uploads/"):]))
+    return stats
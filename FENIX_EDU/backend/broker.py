@@ -0,0 +1,126 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from config import settings
+
+
+Dispatch = Callable[[str, str], Awaitable[None]]
+
+
+# -------- backends --------
+
+
+class InMemoryBackend:
+    """Доставка внутри одного процесса (по умолчанию и для тестов)"""
+
+    def __init__(self):
+        self._dispatch: Optional[Dispatch] = None
+
+    async def start(self, dispatch: Dispatch) -> None:
+        self._dispatch = dispatch
+
+    async def stop(self) -> None:
+        self._dispatch = None
+
+    async def publish(self, channel: str, message: str) -> None:
+        if self._dispatch is not None:
+            await self._dispatch(channel, message)
+
+
+class RedisBackend:
+    """Доставка через Redis pub/sub — события видят все воркеры uvicorn"""
+
+    def __init__(self, url: str, prefix: str = "fenix:"):
+        self._url = url
+        self._prefix = prefix
+        self._redis = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self, dispatch: Dispatch) -> None:
+        from redis import asyncio as aioredis
+
+        self._redis = aioredis.from_url(self._url, decode_responses=True)
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.psubscribe(f"{self._prefix}*")
+        self._reader = asyncio.create_task(self._read(dispatch))
+
+    async def _read(self, dispatch: Dispatch) -> None:
+        async for item in self._pubsub.listen():
+            if item["type"] != "pmessage":
+                continue
+            channel = item["channel"][len(self._prefix):]
+            await dispatch(channel, item["data"])
+
+    async def stop(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self._redis is not None:
+            await self._redis.close()
+
+    async def publish(self, channel: str, message: str) -> None:
+        # своё же сообщение вернётся через psubscribe и уйдёт локальным подписчикам
+        await self._redis.publish(f"{self._prefix}{channel}", message)
+
+
+# -------- broker --------
+
+
+class Broker:
+    """Рассылка событий подписчикам каналов (user:<id>, ...)"""
+
+    def __init__(self, backend=None, queue_size: int = 100):
+        self.backend = backend or InMemoryBackend()
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self) -> None:
+        await self.backend.start(self._dispatch)
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+
+    async def publish(self, channel: str, event: Dict[str, Any]) -> None:
+        await self.backend.publish(channel, json.dumps(event, ensure_ascii=False))
+
+    async def _dispatch(self, channel: str, message: str) -> None:
+        for queue in list(self._subscribers.get(channel, ())):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # медленный клиент не должен тормозить остальных — событие теряется,
+                # клиент догонит состояние обычным запросом
+                pass
+
+    @asynccontextmanager
+    async def subscription(self, *channels: str) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        for channel in channels:
+            self._subscribers.setdefault(channel, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            for channel in channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+
+def create_backend(redis_url: Optional[str]):
+    if redis_url:
+        return RedisBackend(redis_url)
+    return InMemoryBackend()
+
+
+broker = Broker(create_backend(settings.REDIS_URL))
@@ -8,8 +8,82 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 часа
     REFRESH_TOKEN_EXPIRE_DAYS: int = 30
     
+    # База данных
+    DATABASE_URL: str = "sqlite:///./fenix.db"
+    # Пул соединений (для SQLite-файла — тоже; :memory: работает без пула)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_SECONDS: int = 30
+    # только для серверных СУБД: пересоздавать соединения старше N секунд и
+    # проверять соединение перед выдачей (переживает рестарт Postgres и idle-таймауты)
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # SQLite: WAL — читатели не блокируют писателя; писатели ждут друг друга до
+    # busy_timeout вместо немедленной ошибки "database is locked"
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 30000
+    # Реплики только для чтения (JSON-список URL, например
+    # '["sqlite:///./fenix-replica.db"]'): на них идут GET-обработчики чтения
+    DATABASE_REPLICA_URLS: list = []
+    # после изменяющего запроса пользователь столько секунд читает с primary
+    REPLICA_STICKY_SECONDS: int = 10
+    # фоновая проверка реплик (SELECT 1): период и таймаут, секунды
+    REPLICA_HEALTH_CHECK_SECONDS: int = 10
+    REPLICA_HEALTH_TIMEOUT_SECONDS: int = 2
+
     # CORS
     CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:5173"]
+
+    # Режим отладки: X-Query-Count с числом SQL-запросов в каждом ответе
+    DEBUG: bool = False
+    # Порог медленного SQL-запроса для лога fenix.sql, мс (0 — не логировать)
+    SLOW_QUERY_MS: int = 200
+
+    # Redis для рассылки событий между воркерами (без него — только в пределах процесса)
+    REDIS_URL: Optional[str] = None
+
+    # Кеш пользователей для авторизации (0 — отключить)
+    USER_CACHE_TTL_SECONDS: int = 30
+    USER_CACHE_MAX_SIZE: int = 10000
+
+    # Хеширование паролей: число итераций pbkdf2_sha256 (при изменении пароли
+    # перехешируются при следующем входе), размер пула и очереди
+    PASSWORD_HASH_ROUNDS: int = 29000
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # Лимиты загрузки файлов (проверяются по ходу потоковой записи)
+    UPLOAD_MAX_FILE_MB: int = 600
+    UPLOAD_MAX_REQUEST_MB: int = 1024
+
+    # Раздача /uploads: "" — сам бэкенд, "x-accel-redirect" (nginx) или "x-sendfile"
+    # (apache/lighttpd) — файл отдаёт фронтовой прокси из internal-локации с префиксом
+    UPLOADS_SENDFILE_MODE: str = ""
+    UPLOADS_ACCEL_PREFIX: str = "/protected-uploads"
+    # Создавать рядом .gz/.br для сжимаемых файлов (текст, json, svg...)
+    UPLOADS_PRECOMPRESS: bool = True
+
+    # Кеш ответа структуры курса: размер LRU в процессе и TTL общего уровня в Redis
+    # (используется, если задан REDIS_URL; 0 — без общего уровня)
+    STRUCTURE_CACHE_MAX_SIZE: int = 512
+    STRUCTURE_CACHE_REDIS_TTL_SECONDS: int = 3600
+
+    # Обсуждения: комментариев на страницу и ответов в превью каждого комментария
+    DISCUSSION_PAGE_SIZE: int = 50
+    DISCUSSION_REPLIES_PREVIEW: int = 3
+    # интервал пинга в потоке событий обсуждения (SSE), секунды
+    DISCUSSION_STREAM_HEARTBEAT_SECONDS: int = 15
+
+    # Сколько часов хранится ответ на запрос с Idempotency-Key
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+
+    # Архив сообщений: прочитанные сообщения архивных диалогов и сообщения
+    # старше N дней переносятся из messages в archived_messages
+    MESSAGE_ARCHIVE_AFTER_DAYS: int = 180
+    MESSAGE_ARCHIVE_BATCH_SIZE: int = 1000
+    # период фонового архивирования в воркере, часы (0 — только manage.py archive-messages)
+    MESSAGE_ARCHIVE_INTERVAL_HOURS: int = 0
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,436 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from blob_store import blob_sha_from_url, release_blob
+from models import CourseSection, CourseStructureModel, CourseSubsection, SubsectionFile
+
+
+# -------- структура курса --------
+#
+# Разделы и подразделы хранятся строками course_sections / course_subsections
+# (порядок — поле position, 0..n-1 внутри родителя), файлы подразделов — в
+# subsection_files. course_structures.version растёт при каждом изменении:
+# клиент передаёт версию, которую видел, и при расхождении получает 409.
+# Файлы подразделов загружаются и удаляются сразу, без сохранения дерева, —
+# для них есть отдельный счётчик files_version, который в проверке не участвует.
+
+SUBSECTION_FIELDS = {"icon": "icon", "title": "title", "status": "status", "statusIcon": "status_icon"}
+
+
+def _conflict(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+def _not_found(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+def structure_version(db: Session, course_id: int) -> int:
+    version = db.scalar(
+        select(CourseStructureModel.version).where(CourseStructureModel.course_id == course_id)
+    )
+    return version or 0
+
+
+def structure_versions(db: Session, course_id: int) -> Tuple[int, int]:
+    """(version, files_version) — вместе однозначно задают ответ GET структуры"""
+    row = db.execute(
+        select(CourseStructureModel.version, CourseStructureModel.files_version)
+        .where(CourseStructureModel.course_id == course_id)
+    ).first()
+    if row is None:
+        return 0, 0
+    return row.version or 0, row.files_version or 0
+
+
+def bump_version(db: Session, course_id: int, expected_version: Optional[int] = None) -> int:
+    """Увеличить версию структуры; если expected_version не совпал с текущей — 409.
+
+    Условный UPDATE блокирует строку до конца транзакции, поэтому из двух
+    одновременных правок с одной и той же версией пройдёт только одна.
+    """
+    if db.scalar(select(CourseStructureModel.id).where(CourseStructureModel.course_id == course_id)) is None:
+        # структуры ещё нет — считаем, что её версия 0
+        db.add(CourseStructureModel(course_id=course_id, data={}, version=0))
+        db.flush()
+
+    stmt = (
+        update(CourseStructureModel)
+        .where(CourseStructureModel.course_id == course_id)
+        .values(version=CourseStructureModel.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if expected_version is not None:
+        stmt = stmt.where(CourseStructureModel.version == expected_version)
+    if db.execute(stmt).rowcount == 0:
+        raise _conflict("Структура курса уже изменена другим пользователем, обновите страницу")
+    return structure_version(db, course_id)
+
+
+def touch_subsection(db: Session, subsection_id: int) -> None:
+    """Файлы подраздела входят в ответ структуры — увеличить files_version его курса"""
+    course_id = db.scalar(select(CourseSubsection.course_id).where(CourseSubsection.id == subsection_id))
+    if course_id is None:
+        return
+    db.execute(
+        update(CourseStructureModel)
+        .where(CourseStructureModel.course_id == course_id)
+        .values(files_version=CourseStructureModel.files_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# -------- чтение --------
+
+
+def load_subsection_files(db: Session, ids: Iterable[int]) -> Dict[int, List[dict]]:
+    """Файлы подразделов одним запросом: subsection_id -> [файлы]"""
+    ids = list(ids)
+    files: Dict[int, List[dict]] = defaultdict(list)
+    if not ids:
+        return files
+    rows = (
+        db.query(SubsectionFile)
+        .filter(SubsectionFile.subsection_id.in_(ids))
+        .order_by(SubsectionFile.subsection_id, SubsectionFile.id)
+        .all()
+    )
+    for f in rows:
+        files[f.subsection_id].append(f.to_dict())
+    return files
+
+
+def load_structure(db: Session, course_id: int) -> dict:
+    """Дерево курса в формате CourseStructureSchema (три запроса на курс)"""
+    sections = (
+        db.query(CourseSection)
+        .filter(CourseSection.course_id == course_id)
+        .order_by(CourseSection.position, CourseSection.id)
+        .all()
+    )
+    subsections = (
+        db.query(CourseSubsection)
+        .filter(CourseSubsection.course_id == course_id)
+        .order_by(CourseSubsection.section_id, CourseSubsection.position, CourseSubsection.id)
+        .all()
+    )
+    files = load_subsection_files(db, [s.id for s in subsections])
+
+    by_section: Dict[int, List[dict]] = defaultdict(list)
+    for sub in subsections:
+        item = sub.to_dict()
+        item["files"] = files.get(sub.id, [])
+        by_section[sub.section_id].append(item)
+
+    result = []
+    for section in sections:
+        item = section.to_dict()
+        item["subsections"] = by_section.get(section.id, [])
+        result.append(item)
+    return {"sections": result}
+
+
+# -------- изменение отдельных узлов --------
+
+
+def _sibling_count(db: Session, model, **filters) -> int:
+    query = select(func.count()).select_from(model)
+    for name, value in filters.items():
+        query = query.where(getattr(model, name) == value)
+    return db.scalar(query)
+
+
+def _shift(db: Session, model, start: int, delta: int, end: Optional[int] = None, **filters) -> None:
+    """Сдвинуть position соседей в диапазоне [start, end] на delta"""
+    stmt = update(model).where(model.position >= start)
+    if end is not None:
+        stmt = stmt.where(model.position <= end)
+    for name, value in filters.items():
+        stmt = stmt.where(getattr(model, name) == value)
+    db.execute(
+        stmt.values(position=model.position + delta).execution_options(synchronize_session=False)
+    )
+
+
+def _insert_position(position: Optional[int], count: int) -> int:
+    if position is None:
+        return count
+    return max(0, min(position, count))
+
+
+def _check_free_id(db: Session, model, node_id: Optional[int]) -> None:
+    if node_id is not None and db.get(model, node_id) is not None:
+        raise _conflict(f"Узел структуры с id {node_id} уже существует")
+
+
+def get_section(db: Session, course_id: int, section_id: int) -> CourseSection:
+    section = db.get(CourseSection, section_id)
+    if section is None or section.course_id != course_id:
+        raise _not_found("Раздел не найден")
+    return section
+
+
+def get_subsection(db: Session, course_id: int, subsection_id: int) -> CourseSubsection:
+    sub = db.get(CourseSubsection, subsection_id)
+    if sub is None or sub.course_id != course_id:
+        raise _not_found("Подраздел не найден")
+    return sub
+
+
+def add_section(
+    db: Session,
+    course_id: int,
+    title: str,
+    number: Optional[int] = None,
+    position: Optional[int] = None,
+    section_id: Optional[int] = None,
+) -> CourseSection:
+    _check_free_id(db, CourseSection, section_id)
+    position = _insert_position(position, _sibling_count(db, CourseSection, course_id=course_id))
+    _shift(db, CourseSection, position, +1, course_id=course_id)
+
+    section = CourseSection(
+        id=section_id,
+        course_id=course_id,
+        title=title,
+        number=number if number is not None else position + 1,
+        position=position,
+    )
+    db.add(section)
+    db.flush()
+    return section
+
+
+def move_section(db: Session, section: CourseSection, position: int) -> None:
+    count = _sibling_count(db, CourseSection, course_id=section.course_id)
+    position = max(0, min(position, count - 1))
+    if position == section.position:
+        return
+    if position > section.position:
+        _shift(db, CourseSection, section.position + 1, -1, position, course_id=section.course_id)
+    else:
+        _shift(db, CourseSection, position, +1, section.position - 1, course_id=section.course_id)
+    section.position = position
+
+
+def add_subsection(
+    db: Session,
+    section: CourseSection,
+    fields: dict,
+    position: Optional[int] = None,
+    subsection_id: Optional[int] = None,
+) -> CourseSubsection:
+    _check_free_id(db, CourseSubsection, subsection_id)
+    position = _insert_position(position, _sibling_count(db, CourseSubsection, section_id=section.id))
+    _shift(db, CourseSubsection, position, +1, section_id=section.id)
+
+    sub = CourseSubsection(
+        id=subsection_id,
+        course_id=section.course_id,
+        section_id=section.id,
+        position=position,
+    )
+    update_subsection_fields(sub, fields)
+    db.add(sub)
+    db.flush()
+    return sub
+
+
+def update_subsection_fields(sub: CourseSubsection, fields: dict) -> None:
+    """fields в именах API (statusIcon), None — поле не меняется"""
+    for name, column in SUBSECTION_FIELDS.items():
+        if fields.get(name) is not None:
+            setattr(sub, column, fields[name])
+
+
+def move_subsection(
+    db: Session,
+    sub: CourseSubsection,
+    section: CourseSection,
+    position: Optional[int],
+) -> None:
+    """Переместить подраздел (в том числе в другой раздел того же курса)"""
+    if section.id == sub.section_id:
+        if position is None:
+            return
+        count = _sibling_count(db, CourseSubsection, section_id=section.id)
+        position = max(0, min(position, count - 1))
+        if position > sub.position:
+            _shift(db, CourseSubsection, sub.position + 1, -1, position, section_id=section.id)
+        elif position < sub.position:
+            _shift(db, CourseSubsection, position, +1, sub.position - 1, section_id=section.id)
+        sub.position = position
+        return
+
+    _shift(db, CourseSubsection, sub.position + 1, -1, section_id=sub.section_id)
+    position = _insert_position(position, _sibling_count(db, CourseSubsection, section_id=section.id))
+    _shift(db, CourseSubsection, position, +1, section_id=section.id)
+    sub.section_id = section.id
+    sub.position = position
+
+
+def delete_subsections(db: Session, subsections: List[CourseSubsection]) -> List[str]:
+    """Удалить подразделы вместе с их файлами.
+
+    Возвращает пути файлов хранилища, которые нужно удалить после commit.
+    """
+    if not subsections:
+        return []
+    ids = [s.id for s in subsections]
+    unused_paths = []
+    for f in db.query(SubsectionFile).filter(SubsectionFile.subsection_id.in_(ids)).all():
+        path = release_blob(db, f.blob_sha256 or blob_sha_from_url(f.url))
+        if path:
+            unused_paths.append(path)
+        db.delete(f)
+    for sub in subsections:
+        db.delete(sub)
+    return unused_paths
+
+
+def delete_subsection(db: Session, sub: CourseSubsection) -> List[str]:
+    _shift(db, CourseSubsection, sub.position + 1, -1, section_id=sub.section_id)
+    return delete_subsections(db, [sub])
+
+
+def delete_section(db: Session, section: CourseSection) -> List[str]:
+    subsections = db.query(CourseSubsection).filter(CourseSubsection.section_id == section.id).all()
+    unused_paths = delete_subsections(db, subsections)
+    db.flush()
+    _shift(db, CourseSection, section.position + 1, -1, course_id=section.course_id)
+    db.delete(section)
+    return unused_paths
+
+
+# -------- замена дерева целиком (PUT / POST структуры) --------
+
+
+def replace_structure(db: Session, course_id: int, sections: List[dict]) -> List[str]:
+    """Привести строки курса к переданному дереву.
+
+    Узлы с известным id обновляются, новые создаются, отсутствующие
+    удаляются вместе с файлами. Списки files в дереве игнорируются: файлы
+    подразделов меняются только через /api/subsections/{id}/files.
+    """
+    existing_sections = {
+        s.id: s for s in db.query(CourseSection).filter(CourseSection.course_id == course_id)
+    }
+    existing_subsections = {
+        s.id: s for s in db.query(CourseSubsection).filter(CourseSubsection.course_id == course_id)
+    }
+    kept_sections, kept_subsections = set(), set()
+
+    for position, data in enumerate(sections):
+        section = existing_sections.get(data.get("id"))
+        if section is None:
+            _check_free_id(db, CourseSection, data.get("id"))
+            section = CourseSection(id=data.get("id"), course_id=course_id)
+            db.add(section)
+        section.number = data["number"]
+        section.title = data["title"]
+        section.position = position
+        db.flush()
+        kept_sections.add(section.id)
+
+        for sub_position, sub_data in enumerate(data.get("subsections", [])):
+            sub = existing_subsections.get(sub_data.get("id"))
+            if sub is None:
+                _check_free_id(db, CourseSubsection, sub_data.get("id"))
+                sub = CourseSubsection(id=sub_data.get("id"), course_id=course_id)
+                db.add(sub)
+            sub.section_id = section.id
+            sub.position = sub_position
+            update_subsection_fields(sub, sub_data)
+            db.flush()
+            kept_subsections.add(sub.id)
+
+    removed = [s for s_id, s in existing_subsections.items() if s_id not in kept_subsections]
+    unused_paths = delete_subsections(db, removed)
+    db.flush()
+    for section_id, section in existing_sections.items():
+        if section_id not in kept_sections:
+            db.delete(section)
+    return unused_paths
+
+
+# -------- перенос старых данных --------
+
+
+def import_structure_files(db: Session) -> dict:
+    """Перенести файлы подразделов из JSON структур курсов в subsection_files.
+
+    id файлов сохраняются (на них ссылается фронтенд), ссылка на хранилище
+    берётся из url. Счётчики ссылок file_blobs не меняются: ссылку, которую
+    держал JSON, теперь держит строка таблицы. Повторный запуск безопасен.
+    """
+    stats = {"structures": 0, "files": 0, "skipped": 0}
+    existing_ids = {row.id for row in db.query(SubsectionFile.id)}
+
+    for cs in db.query(CourseStructureModel).all():
+        data = cs.data or {}
+        imported = 0
+        for section in data.get("sections", []):
+            for subsection in section.get("subsections", []):
+                for f in subsection.get("files", []):
+                    if subsection.get("id") is None or not f.get("url"):
+                        stats["skipped"] += 1
+                        continue
+                    if f.get("id") in existing_ids:
+                        continue
+                    row = SubsectionFile(
+                        subsection_id=subsection["id"],
+                        name=f["name"],
+                        size=f.get("size") or 0,
+                        url=f["url"],
+                        blob_sha256=blob_sha_from_url(f["url"]),
+                    )
+                    if f.get("id") is not None:
+                        row.id = f["id"]
+                        existing_ids.add(f["id"])
+                    db.add(row)
+                    imported += 1
+        if imported:
+            stats["structures"] += 1
+            stats["files"] += imported
+        stripped = _without_files(data) if data else data
+        if stripped != data:
+            cs.data = stripped
+
+    db.commit()
+    return stats
+
+
+def _without_files(data: dict) -> dict:
+    sections = []
+    for section in data.get("sections", []):
+        subsections = [{**s, "files": []} for s in section.get("subsections", [])]
+        sections.append({**section, "subsections": subsections})
+    return {**data, "sections": sections}
+
+
+def migrate_structures(db: Session) -> dict:
+    """Разложить JSON course_structures.data на строки разделов и подразделов.
+
+    Сначала файлы подразделов переносятся в subsection_files, затем дерево —
+    в course_sections / course_subsections (id узлов сохраняются), после чего
+    data очищается. Повторный запуск безопасен.
+    """
+    stats = {"files": import_structure_files(db)["files"], "courses": 0, "sections": 0, "subsections": 0}
+
+    for cs in db.query(CourseStructureModel).all():
+        sections = (cs.data or {}).get("sections")
+        if not sections:
+            continue
+        replace_structure(db, cs.course_id, sections)
+        cs.data = {}
+        cs.version = (cs.version or 0) + 1
+        stats["courses"] += 1
+        stats["sections"] += len(sections)
+        stats["subsections"] += sum(len(s.get("subsections", [])) for s in sections)
+
+    db.commit()
+    return stats
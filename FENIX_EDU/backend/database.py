@@ -1,17 +1,92 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from config import settings
+from instrumentation import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument_engine, metrics
 
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./fenix.db")
+# async-драйверы для тех же баз: URL в настройках один, драйвер подставляется
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
-)
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+def create_db_engine(url: str, name: str = "primary") -> Engine:
+    """Движок по настройкам из Settings.
+
+    SQLite — прагмы на каждое новое соединение; серверные СУБД — пул с
+    pre-ping и recycle. Пул считает ожидание соединения (метрики fenix_db_pool_*).
+    """
+    pool = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+    }
+
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        if parsed.database in (None, "", ":memory:"):
+            pool = {}  # у базы в памяти свой пул — одно соединение на поток
+        engine = create_engine(url, connect_args={"check_same_thread": False}, **pool)
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    else:
+        engine = create_engine(
+            url,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            **pool,
+        )
+
+    instrument_engine(engine)
+    metrics.register_engine(name, engine)
+    return engine
+
+
+def create_async_db_engine(url: str, name: str = "primary-async") -> AsyncEngine:
+    """Async-движок к той же базе с теми же настройками пула и прагмами SQLite"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Нет async-драйвера для {backend}")
+    parsed = parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+    pool = {
+        "poolclass": InstrumentedAsyncQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+    }
+
+    if backend == "sqlite":
+        if parsed.database in (None, "", ":memory:"):
+            pool = {}
+        engine = create_async_engine(parsed, **pool)
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    else:
+        engine = create_async_engine(
+            parsed,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            **pool,
+        )
+
+    instrument_engine(engine.sync_engine)
+    metrics.register_engine(name, engine.sync_engine)
+    return engine
+
+
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -21,4 +96,19 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Async-путь для горячих обработчиков чтения: ввод-вывод БД идёт в цикле
+# событий, без пула потоков. Синхронный код ORM (Query, хелперы модулей)
+# вызывается через await db.run_sync(func, ...).
+async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL)
+
+# expire_on_commit=False: после commit объекты читаются без повторной загрузки
+# (ленивая загрузка в async-сессии невозможна)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,74 @@
+import os
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import MetaData, create_engine, inspect, pool
+
+from config import settings
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ревизия исходной схемы: в неё попадают базы, созданные create_all
+BASELINE_REVISION = "0001"
+
+
+def alembic_config(url: Optional[str] = None) -> Config:
+    """Конфигурация alembic независимо от текущего каталога"""
+    cfg = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    cfg.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    cfg.attributes["database_url"] = url or settings.DATABASE_URL
+    cfg.attributes["configure_logger"] = False
+    return cfg
+
+
+def current_revision(url: Optional[str] = None) -> Optional[str]:
+    engine = create_engine(url or settings.DATABASE_URL, poolclass=pool.NullPool)
+    try:
+        with engine.connect() as conn:
+            return MigrationContext.configure(conn).get_current_revision()
+    finally:
+        engine.dispose()
+
+
+def head_revision() -> str:
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+def upgrade_database(url: Optional[str] = None) -> bool:
+    """Обновить схему до последней ревизии.
+
+    База без alembic_version, но с таблицами (создана create_all) сначала
+    помечается исходной ревизией. Возвращает True, если так и было.
+    """
+    cfg = alembic_config(url)
+    engine = create_engine(cfg.attributes["database_url"], poolclass=pool.NullPool)
+    try:
+        tables = set(inspect(engine).get_table_names())
+    finally:
+        engine.dispose()
+
+    legacy = "users" in tables and "alembic_version" not in tables
+    if legacy:
+        command.stamp(cfg, BASELINE_REVISION)
+    command.upgrade(cfg, "head")
+    return legacy
+
+
+def recreate_database(url: Optional[str] = None) -> None:
+    """Удалить все таблицы (вместе с alembic_version) и создать схему миграциями.
+
+    Для нагрузочных прогонов и генератора данных: схема и индексы — те же,
+    что у рабочей базы после upgrade, а не от create_all.
+    """
+    cfg = alembic_config(url)
+    engine = create_engine(cfg.attributes["database_url"], poolclass=pool.NullPool)
+    try:
+        existing = MetaData()
+        existing.reflect(bind=engine)
+        existing.drop_all(bind=engine)
+    finally:
+        engine.dispose()
+    command.upgrade(cfg, "head")
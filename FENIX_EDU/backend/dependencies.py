@@ -1,10 +1,12 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from settings import decode_token
-from database import get_db
+from database import get_async_db, get_db
 from models import User, UserRole, UserStatus
+from user_cache import user_cache
 
 
 security = HTTPBearer()
@@ -34,11 +36,34 @@ def get_current_user_for_waiting(
         )
 
     return user
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    token = credentials.credentials
+def load_user(user_id: int, db: Session) -> Optional[User]:
+    """Пользователь из кеша, при промахе — из БД (с сохранением в кеш)"""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is not None:
+        # отсоединяем от сессии запроса, чтобы commit в обработчике не сбросил атрибуты
+        db.expunge(user)
+        user_cache.put(user)
+    return user
+
+
+async def load_user_async(user_id: int, db: AsyncSession) -> Optional[User]:
+    """То же, что load_user, для async-сессии"""
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    user = await db.get(User, user_id)
+    if user is not None:
+        db.expunge(user)
+        user_cache.put(user)
+    return user
+
+
+def _token_user_id(token: str) -> Optional[int]:
     payload = decode_token(token)
 
     if not payload or payload.get("type") != "access":
@@ -47,17 +72,18 @@ def get_current_user(
             detail="Невалидный или просроченный токен",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return payload.get("user_id")
 
-    user_id = payload.get("user_id")
-    user = db.query(User).filter(User.id == user_id).first()
 
+def _check_active(user: Optional[User]) -> User:
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Пользователь не найден",
         )
 
-    # Проверка статуса аккаунта
+    # Проверка статуса аккаунта (по кешу/БД, а не по claims токена:
+    # смена статуса администратором должна действовать сразу)
     if user.status != UserStatus.ACTIVE:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -67,6 +93,33 @@ def get_current_user(
     return user
 
 
+def get_user_by_token(token: str, db: Session) -> User:
+    return _check_active(load_user(_token_user_id(token), db))
+
+
+async def get_user_by_token_async(token: str, db: AsyncSession) -> User:
+    return _check_active(await load_user_async(_token_user_id(token), db))
+
+
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> User:
+    return get_user_by_token(credentials.credentials, db)
+
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db),
+) -> User:
+    """get_current_user для async-обработчиков: без пула потоков.
+
+    Статус уже проверен (ACTIVE), поэтому отдельная проверка
+    require_account_confirmation для них не нужна.
+    """
+    return await get_user_by_token_async(credentials.credentials, db)
+
+
 def require_role(required_roles: List[UserRole]):
     def role_checker(current_user: User = Depends(get_current_user)):
         if current_user.role not in required_roles:
@@ -0,0 +1,213 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session, joinedload
+
+from models import DiscussionComment, DiscussionReply, User, UserRole
+
+
+# -------- обсуждения: выборки с фиксированным числом запросов --------
+#
+# Комментарии и ответы идут по возрастанию (created_at, id) — ключ покрыт
+# индексами, курсор следующей страницы — id последнего элемента.
+
+
+def _author_fields(author: Optional[User]) -> dict:
+    return {
+        "author_name": author.full_name if author else "",
+        "author_role": author.role if author else UserRole.STUDENT,
+    }
+
+
+def reply_to_dict(reply: DiscussionReply) -> dict:
+    return {
+        "id": reply.id,
+        "comment_id": reply.comment_id,
+        **_author_fields(reply.author),
+        "content": reply.content,
+        "created_at": reply.created_at,
+    }
+
+
+def comment_to_dict(comment: DiscussionComment, replies: List[dict], replies_total: int) -> dict:
+    return {
+        "id": comment.id,
+        **_author_fields(comment.author),
+        "content": comment.content,
+        "created_at": comment.created_at,
+        "replies": replies,
+        "replies_total": replies_total,
+    }
+
+
+def _after(model, after_id: int):
+    """Условие «позже элемента after_id» по ключу (created_at, id)"""
+    anchor_created_at = select(model.created_at).where(model.id == after_id).scalar_subquery()
+    return or_(
+        model.created_at > anchor_created_at,
+        and_(model.created_at == anchor_created_at, model.id > after_id),
+    )
+
+
+def load_reply_previews(
+    db: Session, comment_ids: List[int], preview: int
+) -> Tuple[Dict[int, List[dict]], Dict[int, int]]:
+    """Первые preview ответов и общее число ответов для каждого комментария.
+
+    Один запрос с оконными функциями: row_number() отбирает превью внутри
+    каждого комментария, count() over даёт replies_total.
+    """
+    previews: Dict[int, List[dict]] = defaultdict(list)
+    totals: Dict[int, int] = {}
+    if not comment_ids:
+        return previews, totals
+
+    ranked = (
+        select(
+            DiscussionReply.id.label("id"),
+            func.row_number()
+            .over(
+                partition_by=DiscussionReply.comment_id,
+                order_by=(DiscussionReply.created_at, DiscussionReply.id),
+            )
+            .label("rn"),
+            func.count().over(partition_by=DiscussionReply.comment_id).label("total"),
+        )
+        .where(DiscussionReply.comment_id.in_(comment_ids))
+        .subquery()
+    )
+    rows = (
+        db.query(DiscussionReply, ranked.c.rn, ranked.c.total)
+        .join(ranked, ranked.c.id == DiscussionReply.id)
+        .options(joinedload(DiscussionReply.author))
+        # хотя бы одна строка на комментарий, чтобы узнать total и при preview=0
+        .filter(ranked.c.rn <= max(preview, 1))
+        .order_by(DiscussionReply.comment_id, ranked.c.rn)
+        .all()
+    )
+    for reply, rn, total in rows:
+        totals[reply.comment_id] = total
+        if rn <= preview:
+            previews[reply.comment_id].append(reply_to_dict(reply))
+    return previews, totals
+
+
+def comment_page(
+    db: Session,
+    course_id: int,
+    subsection_id: int,
+    after_id: Optional[int],
+    limit: int,
+    replies_preview: int,
+) -> Tuple[List[dict], Optional[int]]:
+    """Страница комментариев подраздела с превью ответов (два запроса).
+
+    Возвращает (комментарии, курсор следующей страницы или None).
+    """
+    query = (
+        db.query(DiscussionComment)
+        .options(joinedload(DiscussionComment.author))
+        .filter(DiscussionComment.course_id == course_id)
+        .filter(DiscussionComment.subsection_id == subsection_id)
+    )
+    if after_id is not None:
+        query = query.filter(_after(DiscussionComment, after_id))
+    comments = (
+        query.order_by(DiscussionComment.created_at.asc(), DiscussionComment.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+    previews, totals = load_reply_previews(db, [c.id for c in comments], replies_preview)
+    items = [comment_to_dict(c, previews.get(c.id, []), totals.get(c.id, 0)) for c in comments]
+    next_cursor = comments[-1].id if len(comments) == limit else None
+    return items, next_cursor
+
+
+def reply_page(
+    db: Session, comment_id: int, after_id: Optional[int], limit: int
+) -> Tuple[List[dict], Optional[int]]:
+    """Ответы на комментарий после after_id (для догрузки сверх превью)"""
+    query = (
+        db.query(DiscussionReply)
+        .options(joinedload(DiscussionReply.author))
+        .filter(DiscussionReply.comment_id == comment_id)
+    )
+    if after_id is not None:
+        query = query.filter(_after(DiscussionReply, after_id))
+    replies = (
+        query.order_by(DiscussionReply.created_at.asc(), DiscussionReply.id.asc())
+        .limit(limit)
+        .all()
+    )
+    next_cursor = replies[-1].id if len(replies) == limit else None
+    return [reply_to_dict(r) for r in replies], next_cursor
+
+
+# -------- обновления: инкрементальная лента и события --------
+
+
+def discussion_channel(course_id: int, subsection_id: int) -> str:
+    return f"discussion:{course_id}:{subsection_id}"
+
+
+def comment_events(course_id: int, subsection_id: int, comment: dict) -> list:
+    return [(discussion_channel(course_id, subsection_id), {"type": "comment.new", "comment": comment})]
+
+
+def reply_events(course_id: int, subsection_id: int, reply: dict) -> list:
+    return [(discussion_channel(course_id, subsection_id), {"type": "reply.new", "reply": reply})]
+
+
+def discussion_updates(
+    db: Session,
+    course_id: int,
+    subsection_id: int,
+    since_comment_id: Optional[int],
+    since_reply_id: Optional[int],
+    limit: int,
+) -> dict:
+    """Комментарии и ответы подраздела новее since_*_id (по id, два запроса).
+
+    Без since_* возвращает только текущие last_*_id — с них клиент начинает
+    следить за обсуждением. Ответы новых комментариев приходят в replies.
+    """
+    scope = and_(
+        DiscussionComment.course_id == course_id,
+        DiscussionComment.subsection_id == subsection_id,
+    )
+    result = {"comments": [], "replies": [], "last_comment_id": 0, "last_reply_id": 0}
+
+    if since_comment_id is None:
+        result["last_comment_id"] = db.scalar(select(func.max(DiscussionComment.id)).where(scope)) or 0
+    else:
+        comments = (
+            db.query(DiscussionComment)
+            .options(joinedload(DiscussionComment.author))
+            .filter(scope, DiscussionComment.id > since_comment_id)
+            .order_by(DiscussionComment.id.asc())
+            .limit(limit)
+            .all()
+        )
+        result["comments"] = [comment_to_dict(c, [], 0) for c in comments]
+        result["last_comment_id"] = comments[-1].id if comments else since_comment_id
+
+    if since_reply_id is None:
+        result["last_reply_id"] = (
+            db.scalar(select(func.max(DiscussionReply.id)).join(DiscussionComment).where(scope)) or 0
+        )
+    else:
+        replies = (
+            db.query(DiscussionReply)
+            .join(DiscussionComment, DiscussionReply.comment_id == DiscussionComment.id)
+            .options(joinedload(DiscussionReply.author))
+            .filter(scope, DiscussionReply.id > since_reply_id)
+            .order_by(DiscussionReply.id.asc())
+            .limit(limit)
+            .all()
+        )
+        result["replies"] = [reply_to_dict(r) for r in replies]
+        result["last_reply_id"] = replies[-1].id if replies else since_reply_id
+
+    return result
@@ -0,0 +1,290 @@
+import gzip
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+
+from blob_store import BLOB_PREFIX, file_sha256
+from config import settings
+from uploads import CHUNK_SIZE, UPLOAD_DIR
+
+try:  # brotli необязателен: без него раздаются только .gz-варианты
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+# Файлы хранилища (blobs/) неизменяемы — их имя и есть хеш содержимого
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+LEGACY_CACHE_CONTROL = "public, max-age=86400"
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/rtf",
+    "image/svg+xml",
+}
+
+# варианты в порядке предпочтения: (Content-Encoding, суффикс файла)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def is_compressible(path: str) -> bool:
+    media_type = mimetypes.guess_type(path)[0] or ""
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+# -------- ETag --------
+
+
+class _LegacyEtags:
+    """sha256 старых файлов (имя по времени) — считается один раз на (mtime, size)"""
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, abs_path: str, stat: os.stat_result) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(abs_path)
+            if item and item[0] == stat.st_mtime and item[1] == stat.st_size:
+                self._items.move_to_end(abs_path)
+                return item[2]
+        return None
+
+    def put(self, abs_path: str, stat: os.stat_result, sha256: str) -> None:
+        with self._lock:
+            self._items[abs_path] = (stat.st_mtime, stat.st_size, sha256)
+            self._items.move_to_end(abs_path)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+_legacy_etags = _LegacyEtags()
+
+
+async def content_sha256(relpath: str, abs_path: str, stat: os.stat_result) -> str:
+    if relpath.startswith(f"{BLOB_PREFIX}/"):
+        return os.path.splitext(os.path.basename(relpath))[0]
+    sha256 = _legacy_etags.get(abs_path, stat)
+    if sha256 is None:
+        sha256 = await run_in_threadpool(file_sha256, abs_path)
+        _legacy_etags.put(abs_path, stat, sha256)
+    return sha256
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    # для If-None-Match допускается слабое сравнение
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+# -------- Range --------
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Один диапазон bytes=a-b / a- / -n -> (start, end) включительно.
+
+    None — заголовка нет или он не поддерживается (отдаём файл целиком),
+    ValueError — диапазон за пределами файла (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        if start_text.isdigit() or end_text.isdigit():
+            raise
+        return None
+    if start >= size or end < start:
+        raise ValueError
+    return start, min(end, size - 1)
+
+
+async def _file_chunks(path: str, start: int, length: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+# -------- раздача --------
+
+
+def _is_servable(abs_path: str, relpath: str) -> bool:
+    """Служебные файлы uploads/ напрямую не отдаются.
+
+    Скрытые имена и .part — недописанные загрузки (.upload-*.part) и сжатые
+    варианты. Предсжатый .gz/.br (рядом лежит оригинал) отдаётся только через
+    Accept-Encoding на имя оригинала; загруженный пользователем архив .gz без
+    такого соседа — обычный файл.
+    """
+    if any(part.startswith(".") for part in relpath.split("/")) or relpath.endswith(".part"):
+        return False
+    for _, suffix in ENCODINGS:
+        if abs_path.endswith(suffix) and os.path.isfile(abs_path[: -len(suffix)]):
+            return False
+    return True
+
+
+def _resolve(relpath: str) -> Tuple[str, str]:
+    abs_path = os.path.realpath(os.path.join(UPLOAD_DIR, relpath))
+    root = os.path.realpath(UPLOAD_DIR)
+    relpath = os.path.relpath(abs_path, root).replace(os.sep, "/")
+    if (
+        not abs_path.startswith(root + os.sep)
+        or not os.path.isfile(abs_path)
+        or not _is_servable(abs_path, relpath)
+    ):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Файл не найден")
+    return abs_path, relpath
+
+
+def _pick_encoding(request: Request, abs_path: str) -> Tuple[Optional[str], str]:
+    accepted = request.headers.get("accept-encoding", "")
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(abs_path + suffix):
+            return encoding, abs_path + suffix
+    return None, abs_path
+
+
+async def serve_upload(request: Request, relpath: str) -> Response:
+    """Отдать файл из uploads/ с ETag, 304, Range и предсжатыми вариантами"""
+    abs_path, relpath = _resolve(relpath)
+    stat = os.stat(abs_path)
+    etag = f'"{await content_sha256(relpath, abs_path, stat)}"'
+    media_type = mimetypes.guess_type(abs_path)[0] or "application/octet-stream"
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL
+        if relpath.startswith(f"{BLOB_PREFIX}/")
+        else LEGACY_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+
+    # Range применяется только к несжатому файлу; If-Range с чужим ETag — целиком
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        range_header = None
+
+    encoding, body_path = (None, abs_path) if range_header else _pick_encoding(request, abs_path)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        etag = f'{etag[:-1]}-{encoding}"'
+        stat = os.stat(body_path)
+    headers["ETag"] = etag
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        byte_range = parse_range(range_header, stat.st_size)
+    except ValueError:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{stat.st_size}"},
+        )
+
+    # отдача файла фронтовым прокси (nginx / apache): ETag и 304 уже обработаны здесь
+    mode = settings.UPLOADS_SENDFILE_MODE
+    if mode == "x-accel-redirect":
+        served = os.path.relpath(body_path, os.path.realpath(UPLOAD_DIR)).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = f"{settings.UPLOADS_ACCEL_PREFIX.rstrip('/')}/{served}"
+        return Response(headers=headers, media_type=media_type)
+    if mode == "x-sendfile":
+        headers["X-Sendfile"] = body_path
+        return Response(headers=headers, media_type=media_type)
+
+    if byte_range is None:
+        start, length, status_code = 0, stat.st_size, status.HTTP_200_OK
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        _file_chunks(body_path, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+# -------- предсжатые варианты --------
+
+
+def precompress_file(abs_path: str) -> int:
+    """Создать рядом .gz (и .br, если установлен brotli) для сжимаемых типов.
+
+    Вариант сохраняется, только если он заметно меньше оригинала.
+    Возвращает число созданных файлов.
+    """
+    compressors = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors[".br"] = brotli.compress
+
+    missing = [suffix for suffix in compressors if not os.path.exists(abs_path + suffix)]
+    if not missing or not is_compressible(abs_path) or not os.path.isfile(abs_path):
+        return 0
+    with open(abs_path, "rb") as f:
+        data = f.read()
+
+    created = 0
+    for suffix in missing:
+        compressed = compressors[suffix](data)
+        if len(compressed) >= len(data) * 0.9:
+            continue
+        temp_path = f"{abs_path}{suffix}.part"
+        with open(temp_path, "wb") as out:
+            out.write(compressed)
+        os.replace(temp_path, abs_path + suffix)
+        created += 1
+    return created
+
+
+def precompress_upload(relpath: str) -> None:
+    """Фоновая задача после загрузки файла в хранилище"""
+    if settings.UPLOADS_PRECOMPRESS:
+        precompress_file(os.path.join(UPLOAD_DIR, relpath))
+
+
+def precompress_all() -> dict:
+    """Создать недостающие сжатые варианты для всех файлов в uploads/"""
+    stats = {"files": 0, "variants": 0}
+    for root, _, names in os.walk(UPLOAD_DIR):
+        for name in names:
+            if name.startswith(".") or name.endswith((".gz", ".br", ".part")):
+                continue
+            stats["files"] += 1
+            stats["variants"] += precompress_file(os.path.join(root, name))
+    return stats
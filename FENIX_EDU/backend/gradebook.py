@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from messenger import user_channel
+from models import Assignment, AssignmentSubmission, User, UserRole
+
+
+# -------- ведомость курса: студенты × задания --------
+#
+# Матрица читается одним запросом (студенты × задания курса с LEFT JOIN сдач),
+# отсортированным по студенту, и отдаётся построчно — на большом курсе ответ
+# не собирается в памяти целиком.
+
+ROWS_PER_FETCH = 1000
+
+
+def course_assignments(db: Session, course_id: int) -> List[Assignment]:
+    return (
+        db.query(Assignment)
+        .filter(Assignment.course_id == course_id)
+        .order_by(Assignment.created_at, Assignment.id)
+        .all()
+    )
+
+
+def _matrix_query(course_id: int, target_group: Optional[str]):
+    # студенты группы курса и все, кто уже что-то сдавал по курсу
+    submitted = (
+        select(AssignmentSubmission.student_id)
+        .join(Assignment, Assignment.id == AssignmentSubmission.assignment_id)
+        .where(Assignment.course_id == course_id)
+    )
+    students = User.id.in_(submitted)
+    if target_group:
+        students = or_(User.group == target_group, students)
+
+    return (
+        select(
+            User.id,
+            User.full_name,
+            User.group,
+            Assignment.id,
+            AssignmentSubmission.id,
+            AssignmentSubmission.grade,
+        )
+        .select_from(User)
+        .join(Assignment, Assignment.course_id == course_id)
+        .outerjoin(
+            AssignmentSubmission,
+            and_(
+                AssignmentSubmission.assignment_id == Assignment.id,
+                AssignmentSubmission.student_id == User.id,
+            ),
+        )
+        .where(User.role == UserRole.STUDENT, students)
+        .order_by(User.full_name, User.id, Assignment.created_at, Assignment.id)
+    )
+
+
+def iter_gradebook(course_id: int, target_group: Optional[str], assignment_ids: List[int]) -> Iterator[dict]:
+    """Строки ведомости: {student_id, student_name, group, grades, submitted}.
+
+    grades и submitted идут в порядке assignment_ids. Работает в собственной
+    сессии: генератор дочитывается уже после того, как обработчик вернул ответ.
+    """
+    if not assignment_ids:
+        return
+    column = {assignment_id: i for i, assignment_id in enumerate(assignment_ids)}
+
+    db = SessionLocal()
+    try:
+        row = None
+        result = db.execute(
+            _matrix_query(course_id, target_group).execution_options(yield_per=ROWS_PER_FETCH)
+        )
+        for student_id, full_name, group, assignment_id, submission_id, grade in result:
+            if row is None or row["student_id"] != student_id:
+                if row is not None:
+                    yield row
+                row = {
+                    "student_id": student_id,
+                    "student_name": full_name,
+                    "group": group,
+                    "grades": [None] * len(assignment_ids),
+                    "submitted": [False] * len(assignment_ids),
+                }
+            i = column[assignment_id]
+            row["grades"][i] = grade
+            row["submitted"][i] = submission_id is not None
+        if row is not None:
+            yield row
+    finally:
+        db.close()
+
+
+def gradebook_csv(assignments: List[Assignment], rows: Iterator[dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    # BOM — чтобы Excel открыл файл в UTF-8
+    writer.writerow(["student_id", "student_name", "group"] + [a.title for a in assignments])
+    yield "\ufeff" + flush()
+    for row in rows:
+        cells = [
+            grade if grade is not None else ("сдано" if submitted else "")
+            for grade, submitted in zip(row["grades"], row["submitted"])
+        ]
+        writer.writerow([row["student_id"], row["student_name"], row["group"] or ""] + cells)
+        yield flush()
+
+
+def gradebook_json(assignments: List[Assignment], rows: Iterator[dict]) -> Iterator[str]:
+    header = [
+        {"id": a.id, "title": a.title, "deadline": a.deadline.isoformat() if a.deadline else None}
+        for a in assignments
+    ]
+    yield '{"assignments": ' + json.dumps(header, ensure_ascii=False) + ', "students": ['
+    for i, row in enumerate(rows):
+        yield ("," if i else "") + json.dumps(row, ensure_ascii=False)
+    yield "]}"
+
+
+def grade_events(assignment_id: int, teacher_ids: List[int], graded: List[Tuple[int, int]]) -> list:
+    """Оценки выставлены: каждому студенту — его сдача, преподавателям — одно
+    событие на всю пачку. graded — пары (submission_id, student_id).
+
+    Каналы user:<id> — те же, на которые подписаны WebSocket/SSE мессенджера.
+    """
+    events = [
+        (
+            user_channel(student_id),
+            {"type": "grades.updated", "assignment_id": assignment_id, "submission_ids": [submission_id]},
+        )
+        for submission_id, student_id in graded
+    ]
+    batch = {"type": "grades.updated", "assignment_id": assignment_id, "submission_ids": [sid for sid, _ in graded]}
+    events += [(user_channel(teacher_id), batch) for teacher_id in dict.fromkeys(teacher_ids)]
+    return events
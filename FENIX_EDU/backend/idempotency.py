@@ -0,0 +1,106 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import IdempotencyKey
+
+
+# -------- Idempotency-Key --------
+#
+# Клиент присылает один и тот же ключ при повторе запроса (двойной клик,
+# переотправка после таймаута). Ответ первого успешного запроса сохраняется в
+# той же транзакции, что и сама операция, и при повторе возвращается без
+# повторного выполнения.
+
+
+def request_fingerprint(method: str, path: str, payload: Any) -> str:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{method} {path}\n{body}".encode()).hexdigest()
+
+
+def _replay(record: IdempotencyKey, fingerprint: str) -> JSONResponse:
+    if record.fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key уже использован для другого запроса",
+        )
+    return JSONResponse(
+        status_code=record.status_code,
+        content=record.response,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def find_response(db: Session, user_id: int, key: str, fingerprint: str) -> Optional[JSONResponse]:
+    """Сохранённый ответ для ключа (или None, если запрос с ним ещё не выполнялся)"""
+    since = datetime.utcnow() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    record = (
+        db.query(IdempotencyKey)
+        .filter(IdempotencyKey.user_id == user_id)
+        .filter(IdempotencyKey.key == key)
+        .filter(IdempotencyKey.created_at >= since)
+        .first()
+    )
+    return _replay(record, fingerprint) if record else None
+
+
+def commit_with_key(
+    db: Session,
+    user_id: int,
+    key: str,
+    fingerprint: str,
+    response: Any,
+    status_code: int = status.HTTP_200_OK,
+) -> Optional[JSONResponse]:
+    """Сохранить ответ вместе с операцией и сделать commit.
+
+    Если параллельный запрос с тем же ключом успел раньше, своя транзакция
+    откатывается и возвращается его ответ; иначе None.
+    """
+    # просроченная запись с тем же ключом больше не защищает — заменяем её
+    db.query(IdempotencyKey).filter(IdempotencyKey.user_id == user_id).filter(
+        IdempotencyKey.key == key
+    ).filter(
+        IdempotencyKey.created_at < datetime.utcnow() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    ).delete(synchronize_session=False)
+
+    db.add(
+        IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            fingerprint=fingerprint,
+            status_code=status_code,
+            response=jsonable_encoder(response),
+        )
+    )
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        record = (
+            db.query(IdempotencyKey)
+            .filter(IdempotencyKey.user_id == user_id)
+            .filter(IdempotencyKey.key == key)
+            .one()
+        )
+        return _replay(record, fingerprint)
+    return None
+
+
+def purge_expired_keys(db: Session) -> int:
+    since = datetime.utcnow() - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted = (
+        db.query(IdempotencyKey)
+        .filter(IdempotencyKey.created_at < since)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
@@ -0,0 +1,147 @@
+import re
+import uuid
+from typing import Callable, List, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from course_structure import load_structure, structure_versions
+from database import Base
+from discussions import comment_page, discussion_updates, reply_page
+from messenger import mark_thread_read, message_page, thread_list
+from models import (
+    Assignment, Course, CourseSection, CourseSubsection, DiscussionComment, DiscussionReply,
+    Message, MessageThread, User, UserRole, UserStatus,
+)
+
+
+# -------- горячие запросы --------
+#
+# Проверяются те же функции, что вызывают обработчики (запросы из main.py,
+# которые не вынесены в модули, повторены здесь). Данные для них создаются в
+# транзакции, которая потом откатывается, так что проверку можно запускать
+# и на рабочей базе.
+
+
+def _seed(db: Session) -> dict:
+    tag = uuid.uuid4().hex[:12]
+    teacher = User(
+        email=f"index-check-t-{tag}@fenixedu.ru", full_name="index-check", hashed_password="-",
+        role=UserRole.TEACHER, status=UserStatus.ACTIVE,
+    )
+    student = User(
+        email=f"index-check-s-{tag}@fenixedu.ru", full_name="index-check", hashed_password="-",
+        role=UserRole.STUDENT, status=UserStatus.ACTIVE, group=f"index-check-{tag}",
+    )
+    course = Course(name="index-check", target_group=student.group)
+    db.add_all([teacher, student, course])
+    db.flush()
+
+    section = CourseSection(course_id=course.id, number=1, title="index-check", position=0)
+    db.add(section)
+    db.flush()
+    subsection = CourseSubsection(course_id=course.id, section_id=section.id, title="index-check", position=0)
+    thread = MessageThread(student_id=student.id, teacher_id=teacher.id)
+    db.add_all([subsection, thread])
+    db.flush()
+
+    messages = [
+        Message(thread_id=thread.id, sender_id=student.id, content="index-check"),
+        Message(thread_id=thread.id, sender_id=teacher.id, content="index-check"),
+    ]
+    comment = DiscussionComment(course_id=course.id, subsection_id=subsection.id, author_id=student.id, content="-")
+    assignment = Assignment(course_id=course.id, subsection_id=subsection.id, title="index-check", created_by=teacher.id)
+    db.add_all(messages + [comment, assignment])
+    db.flush()
+    db.add(DiscussionReply(comment_id=comment.id, author_id=teacher.id, content="-"))
+    db.flush()
+    return {
+        "teacher": teacher, "student": student, "course": course, "subsection": subsection,
+        "thread": thread, "first": messages[0], "last": messages[-1], "comment": comment,
+    }
+
+
+def hot_paths(db: Session, d: dict) -> List[Tuple[str, Callable[[], object]]]:
+    course_id, subsection_id = d["course"].id, d["subsection"].id
+    return [
+        # main.get_courses для студента
+        ("курсы группы", lambda: db.execute(select(Course).where(Course.target_group == d["student"].group)).all()),
+        # main.get_assignments
+        ("задания подраздела", lambda: db.query(Assignment)
+            .filter(Assignment.course_id == course_id)
+            .filter(Assignment.subsection_id == subsection_id)
+            .order_by(Assignment.created_at.desc())
+            .all()),
+        ("диалоги студента", lambda: thread_list(db, d["student"])),
+        ("диалоги преподавателя", lambda: thread_list(db, d["teacher"])),
+        # main.get_unread_message_count
+        ("непрочитанные", lambda: db.query(MessageThread.id, MessageThread.teacher_unread_count)
+            .filter(MessageThread.teacher_id == d["teacher"].id, MessageThread.is_archived == False)
+            .all()),
+        ("сообщения диалога", lambda: message_page(db, d["thread"].id, 1, 50, None, None)),
+        ("история сообщений", lambda: message_page(db, d["thread"].id, 1, 50, d["last"].id, None)),
+        ("новые сообщения", lambda: message_page(db, d["thread"].id, 1, 50, None, d["first"].id)),
+        ("прочтение диалога", lambda: mark_thread_read(db, d["thread"], d["teacher"].id)),
+        ("версия структуры", lambda: structure_versions(db, course_id)),
+        ("структура курса", lambda: load_structure(db, course_id)),
+        ("обсуждение подраздела", lambda: comment_page(db, course_id, subsection_id, None, 50, 3)),
+        ("ответы на комментарий", lambda: reply_page(db, d["comment"].id, None, 50)),
+        ("обновления обсуждения", lambda: discussion_updates(db, course_id, subsection_id, 0, 0, 100)),
+    ]
+
+
+# -------- планы запросов --------
+
+_ALIAS = re.compile(r"\b(\w+) AS (\w+)\b")
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)")
+_POSTGRES_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def _full_scans(conn, statement: str, parameters) -> List[str]:
+    """Таблицы, которые запрос читает целиком (по плану СУБД)"""
+    tables = set(Base.metadata.tables)
+    aliases = {alias: table for table, alias in _ALIAS.findall(statement) if table in tables}
+
+    if conn.dialect.name == "sqlite":
+        plan = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+        scanned = [m.group(1) for m in map(_SQLITE_SCAN.match, plan) if m]
+    elif conn.dialect.name == "postgresql":
+        # на маленьких таблицах Postgres и так выберет Seq Scan — запрещаем его,
+        # чтобы он остался только там, где индекса нет
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = [row[0] for row in conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)]
+        scanned = [m.group(1) for line in plan for m in [_POSTGRES_SCAN.search(line)] if m]
+    else:
+        raise ValueError(f"Проверка планов не поддерживается для {conn.dialect.name}")
+
+    return sorted({aliases.get(name, name) for name in scanned} & tables)
+
+
+def check_indexes(db: Session) -> List[str]:
+    """Выполнить горячие запросы и вернуть список полных сканирований таблиц.
+
+    Всё делается в транзакции сессии и откатывается в конце.
+    """
+    problems: List[str] = []
+    try:
+        data = _seed(db)
+        conn = db.connection()
+        captured: List[Tuple[str, object]] = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                captured.append((statement, parameters))
+
+        for name, run in hot_paths(db, data):
+            captured.clear()
+            event.listen(conn, "before_cursor_execute", capture)
+            try:
+                run()
+            finally:
+                event.remove(conn, "before_cursor_execute", capture)
+            for statement, parameters in captured:
+                for table in _full_scans(conn, statement, parameters):
+                    problems.append(f"{name}: полный просмотр {table}\n    {' '.join(statement.split())}")
+    finally:
+        db.rollback()
+    return problems
@@ -0,0 +1,318 @@
+import logging
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from config import settings
+
+logger = logging.getLogger("fenix.sql")
+
+
+# -------- статистика запроса --------
+#
+# На время HTTP-запроса в contextvar лежит RequestStats. Синхронные
+# обработчики и зависимости FastAPI выполняются в пуле потоков с копией
+# контекста — объект тот же, поэтому события движка видят его и там.
+
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope)
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("fenix_request_stats", default=None)
+
+
+def route_label(scope: dict) -> str:
+    # шаблон пути, а не сам путь: /api/courses/{course_id}/structure
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+def normalize_statement(statement: str) -> str:
+    """SQL без литералов и с одним ? вместо списков IN — одинаковый для однотипных запросов"""
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+# -------- метрики по маршрутам --------
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class _RouteMetrics:
+    __slots__ = ("requests", "queries", "db_seconds", "slow_queries", "duration", "queries_per_request")
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        self.duration = _Histogram(DURATION_BUCKETS)
+        self.queries_per_request = _Histogram(QUERY_BUCKETS)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Счётчики в памяти процесса; render() — текстовый формат Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], _RouteMetrics] = {}
+        self._engines: Dict[str, Engine] = {}
+
+    def register_engine(self, name: str, engine: Engine) -> None:
+        """Показывать состояние пула движка (берётся engine.pool — переживает dispose)"""
+        self._engines[name] = engine
+
+    def _route(self, method: str, route: str) -> _RouteMetrics:
+        key = (method, route)
+        metrics = self._routes.get(key)
+        if metrics is None:
+            metrics = self._routes[key] = _RouteMetrics()
+        return metrics
+
+    def record_request(self, method: str, route: str, stats: RequestStats, seconds: float) -> None:
+        with self._lock:
+            metrics = self._route(method, route)
+            metrics.requests += 1
+            metrics.queries += stats.queries
+            metrics.db_seconds += stats.db_seconds
+            metrics.duration.observe(seconds)
+            metrics.queries_per_request.observe(stats.queries)
+
+    def record_slow_query(self, method: str, route: str) -> None:
+        with self._lock:
+            self._route(method, route).slow_queries += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name: str, labels: str, hist: _Histogram) -> None:
+            for bound, count in zip(hist.buckets, hist.counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+            total = f"{hist.total:.6f}" if isinstance(hist.total, float) else hist.total
+            lines.append(f"{name}_sum{{{labels}}} {total}")
+            lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        with self._lock:
+            routes = sorted(self._routes.items())
+            counters = [
+                ("fenix_http_requests_total", "Обработанные HTTP-запросы", lambda m: m.requests),
+                ("fenix_db_queries_total", "SQL-запросы, выполненные при обработке", lambda m: m.queries),
+                ("fenix_db_query_seconds_total", "Суммарное время SQL-запросов", lambda m: f"{m.db_seconds:.6f}"),
+                ("fenix_db_slow_queries_total", "SQL-запросы дольше SLOW_QUERY_MS", lambda m: m.slow_queries),
+            ]
+            for name, help_text, value in counters:
+                header(name, "counter", help_text)
+                for (method, route), metrics in routes:
+                    lines.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {value(metrics)}')
+
+            header("fenix_http_request_duration_seconds", "histogram", "Время обработки запроса")
+            for (method, route), metrics in routes:
+                histogram(
+                    "fenix_http_request_duration_seconds",
+                    f'method="{method}",route="{_escape(route)}"',
+                    metrics.duration,
+                )
+            header("fenix_db_queries_per_request", "histogram", "SQL-запросов на один HTTP-запрос")
+            for (method, route), metrics in routes:
+                histogram(
+                    "fenix_db_queries_per_request",
+                    f'method="{method}",route="{_escape(route)}"',
+                    metrics.queries_per_request,
+                )
+
+        pools = [
+            (name, engine.pool)
+            for name, engine in sorted(self._engines.items())
+            if isinstance(engine.pool, InstrumentedQueuePool)
+        ]
+        gauges = [
+            ("fenix_db_pool_capacity", "Соединений в пуле максимум (size + max_overflow)", lambda p: p.capacity),
+            ("fenix_db_pool_checked_out", "Соединений выдано сейчас", lambda p: p.checkedout()),
+            ("fenix_db_pool_idle", "Свободных соединений в пуле", lambda p: p.checkedin()),
+        ]
+        for name, help_text, value in gauges:
+            header(name, "gauge", help_text)
+            for pool_name, pool in pools:
+                lines.append(f'{name}{{pool="{pool_name}"}} {value(pool)}')
+        header("fenix_db_pool_timeouts_total", "counter", "Соединение не дождались за pool_timeout")
+        for pool_name, pool in pools:
+            lines.append(f'fenix_db_pool_timeouts_total{{pool="{pool_name}"}} {pool.timeouts}')
+        header("fenix_db_pool_wait_seconds", "histogram", "Ожидание соединения из пула")
+        for pool_name, pool in pools:
+            with pool.stats_lock:
+                histogram("fenix_db_pool_wait_seconds", f'pool="{pool_name}"', pool.wait)
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# -------- события движка --------
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("fenix_query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["fenix_query_started"].pop()
+    elapsed = time.perf_counter() - started
+
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        if stats is not None:
+            method, route = stats.scope["method"], stats.route
+            metrics.record_slow_query(method, route)
+            where = f"{method} {route}"
+        else:
+            where = "вне HTTP-запроса"
+        logger.warning(
+            "медленный запрос %.1f мс [%s]: %s", elapsed * 1000, where, normalize_statement(statement)
+        )
+
+
+def _handle_error(context):
+    # запрос упал — снимаем его отметку времени, иначе стек разъедется
+    started = context.connection.info.get("fenix_query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Считать число и время SQL-запросов в статистику текущего HTTP-запроса"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# -------- пул соединений --------
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, который считает ожидание соединения и таймауты"""
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        self.capacity = pool_size + max(max_overflow, 0)
+        self.stats_lock = threading.Lock()
+        self.wait = _Histogram(POOL_WAIT_BUCKETS)
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            with self.stats_lock:
+                self.wait.observe(time.perf_counter() - started)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """То же для async-движка (очередь пула, совместимая с asyncio)"""
+
+
+# -------- ASGI middleware --------
+
+
+class QueryStatsMiddleware:
+    """Статистика каждого HTTP-запроса: SQL-запросы, время в БД и общее время.
+
+    Чистый ASGI (без BaseHTTPMiddleware) — не буферизует потоковые ответы. В
+    режиме DEBUG число SQL-запросов до начала ответа уходит в X-Query-Count.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        finished: List[float] = []
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start" and settings.DEBUG:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(stats.queries).encode()))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished.append(time.perf_counter())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current.reset(token)
+            # время — до отправки ответа; фоновые задачи идут после, но их
+            # SQL-запросы тоже относятся к маршруту
+            ended = finished[0] if finished else time.perf_counter()
+            metrics.record_request(scope["method"], route_label(scope), stats, ended - started)
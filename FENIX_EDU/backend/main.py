@@ -1,23 +1,80 @@
-from fastapi import Body, FastAPI, Depends, HTTPException, status, Request, UploadFile, File
+from fastapi import (
+    BackgroundTasks, Body, FastAPI, Depends, Header, HTTPException, status, Request,
+    WebSocket, WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased, joinedload
 from typing import List, Optional, Dict
 from datetime import datetime
+import asyncio
 import uvicorn
 import os
 from models import MessageThread, Message
 from schemas import MessageCreate, ThreadResponse, MessageResponse, UnreadCountResponse, TeacherListResponse
+from messenger import (
+    message_events,
+    message_page,
+    publish_events,
+    read_events,
+    mark_thread_read,
+    register_incoming_message,
+    thread_list,
+    user_channel,
+)
+from broker import broker
+from user_cache import invalidate_user, listen_for_invalidations
+from password_pool import hash_password_async, password_pool, verify_password_async
+from uploads import FILES_REQUEST_BODY, UPLOAD_DIR, StagedUpload, check_upload_size, receive_uploads
+from blob_store import blob_sha_from_url, blob_url, release_blob, remove_blob_file, store_upload
+from file_serving import etag_matches, precompress_upload, serve_upload
+from course_structure import (
+    add_section,
+    add_subsection,
+    bump_version,
+    delete_section,
+    delete_subsection,
+    get_section,
+    get_subsection,
+    load_structure,
+    move_section,
+    move_subsection,
+    replace_structure,
+    structure_version,
+    structure_versions,
+    touch_subsection,
+    update_subsection_fields,
+)
+from structure_cache import structure_cache, structure_etag
+from instrumentation import QueryStatsMiddleware, metrics
+from read_replicas import ReadYourWritesMiddleware, get_read_db, listen_for_writes, replica_set
+from discussions import (
+    comment_events,
+    comment_page,
+    discussion_channel,
+    discussion_updates,
+    reply_events,
+    reply_page,
+)
+from submissions import upsert_submission
+from idempotency import commit_with_key, find_response, request_fingerprint
+from message_archive import archive_periodically
+from gradebook import course_assignments, grade_events, gradebook_csv, gradebook_json, iter_gradebook
+from config import settings
 from pydantic import BaseModel
 
-from database import engine, get_db, Base
+from database import AsyncSessionLocal, SessionLocal, get_async_db, get_db
+from db_migrations import current_revision, head_revision
 from models import (
     User, Course, Group, UserRole, UserStatus, CourseStructureModel,
     DiscussionComment, DiscussionReply,
-    Assignment, AssignmentSubmission, AssignmentAttachment
+    Assignment, AssignmentSubmission, AssignmentSubmissionVersion, AssignmentAttachment, SubsectionFile
 )
 from schemas import (
     UserCreate,
@@ -31,24 +88,34 @@ from schemas import (
     DiscussionCommentCreate,
     DiscussionReplyCreate,
     DiscussionCommentOut,
+    DiscussionReplyOut,
+    DiscussionUpdates,
     AssignmentCreate,
     AssignmentUpdate,
     AssignmentOut,
     AssignmentAttachmentOut,
     SubmissionCreate,
     SubmissionGrade,
+    SubmissionGradeItem,
+    BulkGradeRequest,
+    BulkGradeResponse,
     SubmissionOut,
+    SubmissionVersionOut,
 )
 
 from settings import (
-    verify_password,
     get_password_hash,
     create_access_token,
     create_refresh_token,
     refresh_access_token,
+    decode_token,
+    user_claims,
 )
 from dependencies import (
     get_current_user,
+    get_current_user_async,
+    get_user_by_token_async,
+    load_user,
     get_current_user_for_waiting,
     require_admin,
     require_department_head,
@@ -58,8 +125,6 @@ from dependencies import (
 
 security = HTTPBearer()
 
-Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="FENIX.EDU API",
     description="API для образовательной платформы FENIX.EDU",
@@ -68,12 +133,13 @@ app = FastAPI(
 
 # ---------- настройки загрузки и статики ----------
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
-
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+
+@app.api_route("/uploads/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_upload(path: str, request: Request):
+    return await serve_upload(request, path)
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -81,7 +147,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "Idempotent-Replayed", "X-Query-Count"],
 )
+app.add_middleware(ReadYourWritesMiddleware)
+# внешний слой: учитывает и CORS, и обработчики ошибок
+app.add_middleware(QueryStatsMiddleware)
 
 # ---------- Pydantic-схемы для структуры курса ----------
 
@@ -111,14 +181,56 @@ class SectionSchema(BaseModel):
 
 class CourseStructureSchema(BaseModel):
     sections: List[SectionSchema]
+    # в ответе — текущая версия структуры, в запросе — версия, которую видел клиент
+    version: Optional[int] = None
+
+
+class SectionCreate(BaseModel):
+    id: Optional[int] = None
+    number: Optional[int] = None
+    title: str
+    position: Optional[int] = None  # по умолчанию — в конец
+    version: Optional[int] = None
+
+
+class SectionUpdate(BaseModel):
+    number: Optional[int] = None
+    title: Optional[str] = None
+    position: Optional[int] = None
+    version: Optional[int] = None
+
+
+class SubsectionCreate(BaseModel):
+    id: Optional[int] = None
+    icon: str = ""
+    title: str
+    status: str = ""
+    statusIcon: str = ""
+    position: Optional[int] = None
+    version: Optional[int] = None
 
 
-# хранилище файлов (пока в памяти — только связь subsection_id -> файлы)
-subsection_files: Dict[int, List[SubsectionFileSchema]] = {}
+class SubsectionUpdate(BaseModel):
+    icon: Optional[str] = None
+    title: Optional[str] = None
+    status: Optional[str] = None
+    statusIcon: Optional[str] = None
+    section_id: Optional[int] = None  # перенос в другой раздел курса
+    position: Optional[int] = None
+    version: Optional[int] = None
+
 
 # ---------- служебные события ----------
 
 
+@app.on_event("startup")
+def check_schema_version():
+    # таблицы создают миграции (python manage.py migrate), а не импорт приложения
+    current, head = current_revision(), head_revision()
+    if current != head:
+        raise RuntimeError(f"Схема БД на ревизии {current}, нужна {head}: выполните python manage.py migrate")
+
+
 @app.on_event("startup")
 def create_first_admin():
     db = next(get_db())
@@ -206,11 +318,40 @@ def create_first_admin():
 
 
 
+@app.on_event("startup")
+async def start_broker():
+    await broker.start()
+    # сброс кеша пользователей по событиям из других воркеров
+    app.state.user_invalidation_listener = asyncio.create_task(listen_for_invalidations())
+    # реплики: отметки read-your-writes из других воркеров и проверка доступности
+    app.state.replica_tasks = []
+    if replica_set.enabled:
+        app.state.replica_tasks = [
+            asyncio.create_task(listen_for_writes()),
+            asyncio.create_task(replica_set.monitor()),
+        ]
+    # перенос старых сообщений в архив (иначе — python manage.py archive-messages по расписанию)
+    app.state.archive_task = None
+    if settings.MESSAGE_ARCHIVE_INTERVAL_HOURS > 0:
+        app.state.archive_task = asyncio.create_task(archive_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_broker():
+    app.state.user_invalidation_listener.cancel()
+    for task in app.state.replica_tasks:
+        task.cancel()
+    if app.state.archive_task is not None:
+        app.state.archive_task.cancel()
+    await broker.stop()
+    password_pool.shutdown()
+
+
 # ---------- auth ----------
 
 
 @app.post("/api/auth/register", response_model=TokenResponse)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate):
     if "@" not in user_data.email or "." not in user_data.email.split("@")[-1]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -235,28 +376,39 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
                 detail="Для студента необходимо указать группу",
             )
 
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Пользователь с таким email уже существует",
-        )
+    email_taken = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Пользователь с таким email уже существует",
+    )
+
+    # async-сессии на каждый шаг: запросы не блокируют цикл событий, а на
+    # время долгого хеширования соединение возвращается в пул
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(User.id).where(User.email == user_data.email)) is not None:
+            raise email_taken
+
+    hashed_password = await hash_password_async(user_data.password)
 
     user = User(
         full_name=user_data.full_name,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         role=user_data.role,
         course=user_data.course if user_data.role == UserRole.STUDENT else None,
         group=user_data.group if user_data.role == UserRole.STUDENT else None,
         status=UserStatus.PENDING,
     )
 
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    async with AsyncSessionLocal() as db:
+        db.add(user)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # тот же email успели зарегистрировать, пока хешировался пароль
+            raise email_taken
+        await db.refresh(user)
 
-    access_token = create_access_token({"user_id": user.id, "email": user.email})
+    access_token = create_access_token(user_claims(user))
     refresh_token = create_refresh_token({"user_id": user.id, "email": user.email})
 
     return TokenResponse(
@@ -268,22 +420,39 @@ def register(user_data: UserCreate, db: Session = Depends(get_db)):
 
 
 @app.post("/api/auth/login", response_model=TokenResponse)
-def login(login_data: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == login_data.email).first()
+async def login(login_data: UserLogin):
+    # сессия закрывается до проверки пароля: при наплыве входов соединения
+    # не простаивают в ожидании пула хеширования
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.email == login_data.email))
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Неверный email или пароль",
+        )
 
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    password_ok, new_hash = await verify_password_async(login_data.password, user.hashed_password)
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
         )
 
+    # параметры хеширования изменились — сохраняем пароль в новом формате
+    if new_hash:
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+            await db.commit()
+        user.hashed_password = new_hash
+
     if user.status != UserStatus.ACTIVE:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Аккаунт не подтвержден администратором",
         )
 
-    access_token = create_access_token({"user_id": user.id, "email": user.email})
+    access_token = create_access_token(user_claims(user))
     refresh_token = create_refresh_token({"user_id": user.id, "email": user.email})
 
     return TokenResponse(
@@ -295,7 +464,7 @@ def login(login_data: UserLogin, db: Session = Depends(get_db)):
 
 
 @app.post("/api/auth/refresh", response_model=TokenResponse)
-def refresh_token_endpoint(data: dict):
+def refresh_token_endpoint(data: dict, db: Session = Depends(get_db)):
     refresh_token_value = data.get("refresh_token")
     if not refresh_token_value:
         raise HTTPException(
@@ -303,7 +472,11 @@ def refresh_token_endpoint(data: dict):
             detail="Refresh token обязателен",
         )
 
-    tokens = refresh_access_token(refresh_token_value)
+    # актуальные role/status для claims нового access-токена
+    payload = decode_token(refresh_token_value) or {}
+    user = load_user(payload.get("user_id"), db) if payload.get("type") == "refresh" else None
+
+    tokens = refresh_access_token(refresh_token_value, user_claims(user) if user else None)
     if not tokens:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -328,6 +501,18 @@ def get_me(current_user: User = Depends(get_current_user)):
 
 # ---------- admin users ----------
 
+@app.get("/api/admin/cache-stats", response_model=dict)
+def get_cache_stats(current_user: User = Depends(require_admin)):
+    return {"course_structure": structure_cache.stats()}
+
+
+@app.get("/api/admin/metrics", include_in_schema=False)
+def get_metrics(current_user: User = Depends(require_admin)):
+    """Метрики по маршрутам в текстовом формате Prometheus"""
+    body = metrics.render() + replica_set.render_metrics()
+    return Response(body, media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/admin/users", response_model=UserListResponse)
 def get_all_users(
     status: Optional[UserStatus] = None,
@@ -364,6 +549,7 @@ def get_all_users(
 @app.post("/api/admin/users/{user_id}/promote-department-head")
 def promote_to_department_head(
     user_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
@@ -374,6 +560,7 @@ def promote_to_department_head(
     user.role = UserRole.DEPARTMENT_HEAD
     db.commit()
     db.refresh(user)
+    invalidate_user(background_tasks, user.id)
 
     return {
         "success": True,
@@ -386,6 +573,7 @@ def promote_to_department_head(
 def update_user_status(
     user_id: int,
     status_data: UserUpdateStatus,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(require_department_head),
     db: Session = Depends(get_db),
 ):
@@ -403,6 +591,7 @@ def update_user_status(
         user.confirmed_by = current_user.id
 
     db.commit()
+    invalidate_user(background_tasks, user.id)
 
     return {
         "success": True,
@@ -435,24 +624,36 @@ def create_course(
 
 
 @app.get("/api/courses", response_model=List[dict])
-def get_courses(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_account_confirmation()),
+async def get_courses(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     if current_user.role == UserRole.STUDENT:
         if not current_user.group:
             return []
 
-        courses = (
-            db.query(Course)
-            .filter(Course.target_group == current_user.group)
-            .all()
-        )
+        courses = await db.scalars(select(Course).where(Course.target_group == current_user.group))
     else:
-        courses = db.query(Course).all()
+        courses = await db.scalars(select(Course))
 
     return [course.to_dict() for course in courses]
 
+def _get_course_or_404(db: Session, course_id: int) -> Course:
+    course = db.query(Course).filter(Course.id == course_id).first()
+    if not course:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Курс не найден",
+        )
+    return course
+
+
+def _commit_structure(db: Session, unused_paths: List[str]) -> None:
+    db.commit()
+    for path in unused_paths:
+        remove_blob_file(path)
+
+
 @app.post("/api/courses/{course_id}/structure", response_model=dict)
 def create_course_structure(
     course_id: int,
@@ -460,30 +661,19 @@ def create_course_structure(
     current_user: User = Depends(require_teacher),
     db: Session = Depends(get_db),
 ):
-    course = db.query(Course).filter(Course.id == course_id).first()
-    if not course:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Курс не найден",
-        )
+    _get_course_or_404(db, course_id)
 
-    existing = (
-        db.query(CourseStructureModel)
-        .filter(CourseStructureModel.course_id == course_id)
-        .first()
-    )
-    if existing:
+    if structure_version(db, course_id) > 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Структура для этого курса уже создана",
         )
 
-    data = jsonable_encoder(structure)
-    cs = CourseStructureModel(course_id=course_id, data=data)
-    db.add(cs)
-    db.commit()
+    version = bump_version(db, course_id, structure.version)
+    unused_paths = replace_structure(db, course_id, jsonable_encoder(structure)["sections"])
+    _commit_structure(db, unused_paths)
 
-    return {"success": True}
+    return {"success": True, "version": version}
 
 
 @app.put("/api/courses/{course_id}/structure", response_model=dict)
@@ -493,49 +683,150 @@ def update_course_structure(
     current_user: User = Depends(require_teacher),
     db: Session = Depends(get_db),
 ):
-    course = db.query(Course).filter(Course.id == course_id).first()
-    if not course:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Курс не найден",
-        )
+    _get_course_or_404(db, course_id)
 
-    cs = (
-        db.query(CourseStructureModel)
-        .filter(CourseStructureModel.course_id == course_id)
-        .first()
+    # без version — прежнее поведение «последний записавший побеждает»
+    version = bump_version(db, course_id, structure.version)
+    unused_paths = replace_structure(db, course_id, jsonable_encoder(structure)["sections"])
+    _commit_structure(db, unused_paths)
+
+    return {"success": True, "version": version}
+
+
+@app.get("/api/courses/{course_id}/structure", response_model=CourseStructureSchema)
+async def get_course_structure(
+    course_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_read_db),
+):
+    # версии меняются при любой правке дерева или файлов, поэтому (курс, версии) однозначно задают ответ
+    version, files_version = await db.run_sync(structure_versions, course_id)
+    headers = {"ETag": structure_etag(course_id, version, files_version), "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    async def build() -> bytes:
+        data = await db.run_sync(load_structure, course_id) if version else {"sections": []}
+        return CourseStructureSchema(**data, version=version).model_dump_json().encode()
+
+    body = await structure_cache.aget_or_build((course_id, version, files_version), build)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# ---------- правка отдельных узлов структуры ----------
+
+
+@app.post("/api/courses/{course_id}/structure/sections", response_model=dict)
+def add_course_section(
+    course_id: int,
+    payload: SectionCreate,
+    current_user: User = Depends(require_teacher),
+    db: Session = Depends(get_db),
+):
+    _get_course_or_404(db, course_id)
+    version = bump_version(db, course_id, payload.version)
+    section = add_section(
+        db,
+        course_id,
+        title=payload.title,
+        number=payload.number,
+        position=payload.position,
+        section_id=payload.id,
     )
-    if not cs:
-        cs = CourseStructureModel(course_id=course_id, data={})
-        db.add(cs)
-        db.flush()
+    db.commit()
+    return {"success": True, "version": version, "section": section.to_dict()}
 
-    for section in structure.sections:
-        for subsection in section.subsections:
-            if subsection.id is not None and subsection.id in subsection_files:
-                subsection.files = subsection_files[subsection.id]
 
-    cs.data = jsonable_encoder(structure)
+@app.patch("/api/courses/{course_id}/structure/sections/{section_id}", response_model=dict)
+def update_course_section(
+    course_id: int,
+    section_id: int,
+    payload: SectionUpdate,
+    current_user: User = Depends(require_teacher),
+    db: Session = Depends(get_db),
+):
+    _get_course_or_404(db, course_id)
+    version = bump_version(db, course_id, payload.version)
+    section = get_section(db, course_id, section_id)
+    if payload.title is not None:
+        section.title = payload.title
+    if payload.number is not None:
+        section.number = payload.number
+    if payload.position is not None:
+        move_section(db, section, payload.position)
     db.commit()
+    return {"success": True, "version": version, "section": section.to_dict()}
 
-    return {"success": True}
+
+@app.delete("/api/courses/{course_id}/structure/sections/{section_id}", response_model=dict)
+def delete_course_section(
+    course_id: int,
+    section_id: int,
+    version: Optional[int] = None,
+    current_user: User = Depends(require_teacher),
+    db: Session = Depends(get_db),
+):
+    _get_course_or_404(db, course_id)
+    new_version = bump_version(db, course_id, version)
+    unused_paths = delete_section(db, get_section(db, course_id, section_id))
+    _commit_structure(db, unused_paths)
+    return {"success": True, "version": new_version}
 
 
-@app.get("/api/courses/{course_id}/structure", response_model=CourseStructureSchema)
-def get_course_structure(
+@app.post("/api/courses/{course_id}/structure/sections/{section_id}/subsections", response_model=dict)
+def add_course_subsection(
     course_id: int,
-    current_user: User = Depends(require_account_confirmation()),
+    section_id: int,
+    payload: SubsectionCreate,
+    current_user: User = Depends(require_teacher),
     db: Session = Depends(get_db),
 ):
-    cs = (
-        db.query(CourseStructureModel)
-        .filter(CourseStructureModel.course_id == course_id)
-        .first()
+    _get_course_or_404(db, course_id)
+    version = bump_version(db, course_id, payload.version)
+    sub = add_subsection(
+        db,
+        get_section(db, course_id, section_id),
+        payload.model_dump(),
+        position=payload.position,
+        subsection_id=payload.id,
     )
-    if not cs:
-        return CourseStructureSchema(sections=[])
+    db.commit()
+    return {"success": True, "version": version, "subsection": sub.to_dict()}
+
 
-    return CourseStructureSchema(**cs.data)
+@app.patch("/api/courses/{course_id}/structure/subsections/{subsection_id}", response_model=dict)
+def update_course_subsection(
+    course_id: int,
+    subsection_id: int,
+    payload: SubsectionUpdate,
+    current_user: User = Depends(require_teacher),
+    db: Session = Depends(get_db),
+):
+    _get_course_or_404(db, course_id)
+    version = bump_version(db, course_id, payload.version)
+    sub = get_subsection(db, course_id, subsection_id)
+    update_subsection_fields(sub, payload.model_dump())
+    if payload.section_id is not None or payload.position is not None:
+        target = get_section(db, course_id, payload.section_id or sub.section_id)
+        move_subsection(db, sub, target, payload.position)
+    db.commit()
+    return {"success": True, "version": version, "subsection": sub.to_dict()}
+
+
+@app.delete("/api/courses/{course_id}/structure/subsections/{subsection_id}", response_model=dict)
+def delete_course_subsection(
+    course_id: int,
+    subsection_id: int,
+    version: Optional[int] = None,
+    current_user: User = Depends(require_teacher),
+    db: Session = Depends(get_db),
+):
+    _get_course_or_404(db, course_id)
+    new_version = bump_version(db, course_id, version)
+    unused_paths = delete_subsection(db, get_subsection(db, course_id, subsection_id))
+    _commit_structure(db, unused_paths)
+    return {"success": True, "version": new_version}
 
 
 @app.post("/api/groups", response_model=dict)
@@ -582,51 +873,110 @@ def get_groups(
 
 # ---------- discussions ----------
 @app.get("/api/discussions", response_model=List[DiscussionCommentOut])
-def get_discussions(
+async def get_discussions(
     course_id: int,
     subsection_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    replies_preview: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
 ):
-    items = (
-        db.query(DiscussionComment)
-        .filter(DiscussionComment.course_id == course_id)
-        .filter(DiscussionComment.subsection_id == subsection_id)
-        .order_by(DiscussionComment.created_at.asc())
-        .all()
+    """Комментарии подраздела (от старых к новым) с превью ответов.
+
+    Следующая страница — after_id из заголовка X-Next-Cursor; остальные
+    ответы комментария — GET /api/discussions/{comment_id}/replies.
+    """
+    limit = max(1, min(limit or settings.DISCUSSION_PAGE_SIZE, 200))
+    if replies_preview is None:
+        replies_preview = settings.DISCUSSION_REPLIES_PREVIEW
+    replies_preview = max(0, min(replies_preview, 100))
+
+    items, next_cursor = await db.run_sync(
+        comment_page, course_id, subsection_id, after_id, limit, replies_preview
     )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return items
 
-    result = []
-    for c in items:
-        replies = []
-        for r in c.replies:
-            replies.append(
-                {
-                    "id": r.id,
-                    "author_name": r.author.full_name if r.author else "",
-                    "author_role": r.author.role if r.author else UserRole.STUDENT,
-                    "content": r.content,
-                    "created_at": r.created_at,
-                }
-            )
 
-        result.append(
-            {
-                "id": c.id,
-                "author_name": c.author.full_name if c.author else "",
-                "author_role": c.author.role if c.author else UserRole.STUDENT,
-                "content": c.content,
-                "created_at": c.created_at,
-                "replies": replies,
-            }
-        )
+@app.get("/api/discussions/{comment_id}/replies", response_model=List[DiscussionReplyOut])
+async def get_discussion_replies(
+    comment_id: int,
+    response: Response,
+    after_id: Optional[int] = None,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Ответы на комментарий; after_id — id последнего уже показанного ответа"""
+    items, next_cursor = await db.run_sync(reply_page, comment_id, after_id, max(1, min(limit, 200)))
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return items
 
-    return result
+
+@app.get("/api/discussions/updates", response_model=DiscussionUpdates)
+async def get_discussion_updates(
+    course_id: int,
+    subsection_id: int,
+    since_comment_id: Optional[int] = None,
+    since_reply_id: Optional[int] = None,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
+):
+    """Только новые комментарии и ответы подраздела (после since_*_id).
+
+    Клиент вызывает без параметров при открытии обсуждения, чтобы получить
+    курсоры, и с курсорами — после переподключения потока событий.
+    """
+    return await db.run_sync(
+        discussion_updates, course_id, subsection_id, since_comment_id, since_reply_id, max(1, min(limit, 500))
+    )
+
+
+@app.get("/api/discussions/stream")
+async def discussion_stream(
+    course_id: int,
+    subsection_id: int,
+    token: str = "",
+):
+    """Server-Sent Events: новые комментарии и ответы подраздела.
+
+    EventSource не умеет передавать заголовок Authorization, поэтому
+    access-токен передаётся параметром ?token=.
+    """
+    async with AsyncSessionLocal() as db:
+        await get_user_by_token_async(token, db)
+
+    async def events():
+        async with broker.subscription(discussion_channel(course_id, subsection_id)) as queue:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        queue.get(), timeout=settings.DISCUSSION_STREAM_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # комментарий-пинг не даёт прокси закрыть простаивающее соединение
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+
+    # при отключении клиента Starlette отменяет генератор, подписка снимается
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/api/discussions", response_model=DiscussionCommentOut)
 def create_discussion_comment(
     payload: DiscussionCommentCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -640,20 +990,24 @@ def create_discussion_comment(
     db.commit()
     db.refresh(comment)
 
-    return {
+    result = {
         "id": comment.id,
         "author_name": current_user.full_name,
         "author_role": current_user.role,
         "content": comment.content,
         "created_at": comment.created_at,
         "replies": [],
+        "replies_total": 0,
     }
+    publish_events(background_tasks, comment_events(comment.course_id, comment.subsection_id, result))
+    return result
 
 
 @app.post("/api/discussions/{comment_id}/replies")
 def create_discussion_reply(
     comment_id: int,
     payload: DiscussionReplyCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -670,13 +1024,16 @@ def create_discussion_reply(
     db.commit()
     db.refresh(reply)
 
-    return {
+    result = {
         "id": reply.id,
+        "comment_id": comment_id,
         "author_name": current_user.full_name,
         "author_role": current_user.role,
         "content": reply.content,
         "created_at": reply.created_at,
     }
+    publish_events(background_tasks, reply_events(comment.course_id, comment.subsection_id, result))
+    return result
 
 # ---------- assignments ----------
 
@@ -742,67 +1099,152 @@ def update_assignment(
 def submit_assignment(
     assignment_id: int,
     payload: SubmissionCreate,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: User = Depends(require_account_confirmation()),
 ):
+    """Сдача или пересдача задания.
+
+    Одна строка на (задание, студент) обновляется атомарным upsert, каждая
+    сдача дописывается в историю версий. С заголовком Idempotency-Key повтор
+    того же запроса возвращает сохранённый ответ, не создавая новую версию.
+    """
     # только студент сдаёт
     if current_user.role != UserRole.STUDENT:
         raise HTTPException(status_code=403, detail="Сдавать задания может только студент")
 
-    a = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+    fingerprint = None
+    if idempotency_key:
+        fingerprint = request_fingerprint(request.method, request.url.path, payload)
+        replayed = find_response(db, current_user.id, idempotency_key, fingerprint)
+        if replayed is not None:
+            return replayed
+
+    a = db.query(Assignment.id).filter(Assignment.id == assignment_id).first()
     if not a:
         raise HTTPException(status_code=404, detail="Задание не найдено")
 
-    sub = (
-        db.query(AssignmentSubmission)
-        .filter(AssignmentSubmission.assignment_id == assignment_id)
-        .filter(AssignmentSubmission.student_id == current_user.id)
-        .first()
+    sub = upsert_submission(
+        db,
+        assignment_id=assignment_id,
+        student_id=current_user.id,
+        content=(payload.content.strip() if payload.content else None),
+        file_url=payload.file_url,
     )
+    out = sub.to_dict()
 
-    if not sub:
-        sub = AssignmentSubmission(
-            assignment_id=assignment_id,
-            student_id=current_user.id,
-            content=(payload.content.strip() if payload.content else None),
-            file_url=payload.file_url,
-        )
-        db.add(sub)
+    if idempotency_key:
+        replayed = commit_with_key(db, current_user.id, idempotency_key, fingerprint, out)
+        if replayed is not None:
+            return replayed
     else:
-        # пересдача
-        sub.content = (payload.content.strip() if payload.content else None)
-        sub.file_url = payload.file_url
+        db.commit()
+    return out
 
-    db.commit()
-    db.refresh(sub)
 
-    out = sub.to_dict()
-    return out
+@app.get("/api/submissions/{submission_id}/versions", response_model=List[SubmissionVersionOut])
+def get_submission_versions(
+    submission_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """История сдач: студенту — своя, преподавателю и админу — любая"""
+    sub = db.query(AssignmentSubmission).filter(AssignmentSubmission.id == submission_id).first()
+    if not sub:
+        raise HTTPException(status_code=404, detail="Сдача не найдена")
+    if current_user.role == UserRole.STUDENT and sub.student_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Нет доступа к этой сдаче")
+
+    versions = (
+        db.query(AssignmentSubmissionVersion)
+        .filter(AssignmentSubmissionVersion.submission_id == submission_id)
+        .order_by(AssignmentSubmissionVersion.version.asc())
+        .all()
+    )
+    return [v.to_dict() for v in versions]
 
 
 @app.get("/api/assignments/{assignment_id}/submissions", response_model=List[SubmissionOut])
 def get_submissions(
     assignment_id: int,
+    response: Response,
+    page: int = 1,
+    limit: Optional[int] = None,
+    ungraded_only: bool = False,
+    late_only: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_teacher),
 ):
+    """Сдачи задания со студентами (один запрос на страницу + подсчёт).
+
+    Без limit возвращаются все сдачи, как раньше; с limit — страница page.
+    Общее число сдач с учётом фильтров — в заголовке X-Total-Count.
+    """
     a = db.query(Assignment).filter(Assignment.id == assignment_id).first()
     if not a:
         raise HTTPException(status_code=404, detail="Задание не найдено")
 
-    subs = (
-        db.query(AssignmentSubmission)
-        .filter(AssignmentSubmission.assignment_id == assignment_id)
-        .order_by(AssignmentSubmission.created_at.desc())
-        .all()
+    query = db.query(AssignmentSubmission).filter(AssignmentSubmission.assignment_id == assignment_id)
+    if ungraded_only:
+        query = query.filter(AssignmentSubmission.grade == None)
+    if late_only:
+        # опоздание — по последней (пере)сдаче: есть версия позже дедлайна.
+        # updated_at не подходит — он меняется и при выставлении оценки.
+        # Без дедлайна опозданий нет.
+        if a.deadline is None:
+            query = query.filter(False)
+        else:
+            query = query.filter(
+                select(AssignmentSubmissionVersion.id)
+                .where(AssignmentSubmissionVersion.submission_id == AssignmentSubmission.id)
+                .where(AssignmentSubmissionVersion.submitted_at > a.deadline)
+                .exists()
+            )
+
+    response.headers["X-Total-Count"] = str(query.count())
+
+    query = query.options(joinedload(AssignmentSubmission.student)).order_by(
+        AssignmentSubmission.created_at.desc(), AssignmentSubmission.id.desc()
+    )
+    if limit is not None:
+        limit = max(1, min(limit, 500))
+        query = query.offset((max(page, 1) - 1) * limit).limit(limit)
+    return [s.to_dict() for s in query.all()]
+
+
+@app.get("/api/courses/{course_id}/gradebook")
+def get_course_gradebook(
+    course_id: int,
+    format: str = "csv",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_teacher),
+):
+    """Ведомость курса: студенты × задания, потоково в CSV или JSON"""
+    if format not in ("csv", "json"):
+        raise HTTPException(status_code=400, detail="Формат должен быть csv или json")
+
+    course = db.query(Course).filter(Course.id == course_id).first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Курс не найден")
+
+    assignments = course_assignments(db, course_id)
+    rows = iter_gradebook(course_id, course.target_group, [a.id for a in assignments])
+
+    if format == "json":
+        return StreamingResponse(gradebook_json(assignments, rows), media_type="application/json")
+    return StreamingResponse(
+        gradebook_csv(assignments, rows),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="gradebook_course_{course_id}.csv"'},
     )
-    return [s.to_dict() for s in subs]
 
 
 @app.put("/api/submissions/{submission_id}/grade", response_model=SubmissionOut)
 def grade_submission(
     submission_id: int,
     payload: SubmissionGrade,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_teacher),
 ):
@@ -815,8 +1257,71 @@ def grade_submission(
 
     db.commit()
     db.refresh(sub)
+    teacher_ids = [current_user.id, sub.assignment.created_by]
+    publish_events(background_tasks, grade_events(sub.assignment_id, teacher_ids, [(sub.id, sub.student_id)]))
     return sub.to_dict()
 
+@app.post("/api/assignments/{assignment_id}/grades", response_model=BulkGradeResponse)
+def grade_submissions_bulk(
+    assignment_id: int,
+    payload: BulkGradeRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_teacher),
+):
+    """Оценить сразу много сдач задания: одна транзакция, один UPDATE по id.
+
+    Тело проверяется целиком (SubmissionGradeItem). Для каждого элемента
+    возвращается свой результат: повторы и чужие сдачи пропускаются,
+    остальные применяются.
+    """
+    a = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+    if not a:
+        raise HTTPException(status_code=404, detail="Задание не найдено")
+
+    results: List[dict] = []
+    items: Dict[int, SubmissionGradeItem] = {}
+    for item in payload.items:
+        if item.submission_id in items:
+            results.append({"submission_id": item.submission_id, "success": False, "error": "Сдача указана повторно"})
+            continue
+        items[item.submission_id] = item
+        results.append({"submission_id": item.submission_id, "success": True})
+
+    # сдачи этого задания (и их студенты) — одним запросом
+    found = dict(
+        db.execute(
+            select(AssignmentSubmission.id, AssignmentSubmission.student_id)
+            .where(AssignmentSubmission.assignment_id == assignment_id)
+            .where(AssignmentSubmission.id.in_(list(items)))
+        ).all()
+    ) if items else {}
+
+    now = datetime.utcnow()
+    rows = []
+    for result in results:
+        if not result["success"]:
+            continue
+        if result["submission_id"] not in found:
+            result.update(success=False, error="Сдача не найдена")
+            continue
+        item = items[result["submission_id"]]
+        rows.append({
+            "id": item.submission_id,
+            "grade": item.grade,
+            "teacher_comment": item.teacher_comment.strip() if item.teacher_comment else None,
+            "updated_at": now,
+        })
+
+    if rows:
+        # ORM bulk UPDATE по первичному ключу (executemany в одной транзакции)
+        db.execute(update(AssignmentSubmission), rows)
+        db.commit()
+        graded = [(row["id"], found[row["id"]]) for row in rows]
+        publish_events(background_tasks, grade_events(assignment_id, [current_user.id, a.created_by], graded))
+
+    return {"updated": len(rows), "results": results}
+
 # ---------- assignment attachments ----------
 
 @app.get("/api/assignments/{assignment_id}/attachments", response_model=List[AssignmentAttachmentOut])
@@ -838,38 +1343,56 @@ def get_assignment_attachments(
     return items
 
 
-@app.post("/api/assignments/{assignment_id}/attachments", response_model=List[AssignmentAttachmentOut])
+def _save_assignment_attachments(assignment_id: int, staged: List[StagedUpload]):
+    """Файлы в хранилище и строки вложений — в своей сессии, в пуле потоков"""
+    db = SessionLocal()
+    try:
+        saved, paths = [], []
+        for item in staged:
+            blob = store_upload(db, item)
+            paths.append(blob.path)
+
+            att = AssignmentAttachment(
+                assignment_id=assignment_id,
+                name=item.filename,
+                size=item.size,
+                url=blob_url(blob),
+                blob_sha256=blob.sha256,
+            )
+            db.add(att)
+            saved.append(att)
+
+        db.commit()
+        return [AssignmentAttachmentOut.model_validate(att) for att in saved], paths
+    finally:
+        # временные файлы, не попавшие в хранилище (при ошибке), удаляются
+        for item in staged:
+            item.discard()
+        db.close()
+
+
+@app.post(
+    "/api/assignments/{assignment_id}/attachments",
+    response_model=List[AssignmentAttachmentOut],
+    dependencies=[Depends(check_upload_size)],
+    openapi_extra=FILES_REQUEST_BODY,
+)
 async def upload_assignment_attachments(
     assignment_id: int,
-    files: List[UploadFile] = File(...),
-    db: Session = Depends(get_db),
+    request: Request,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(require_teacher),
 ):
-    a = db.query(Assignment).filter(Assignment.id == assignment_id).first()
-    if not a:
-        raise HTTPException(status_code=404, detail="Задание не найдено")
-
-    saved = []
-    for f in files:
-        file_id = int(datetime.utcnow().timestamp() * 1000)
-        ext = os.path.splitext(f.filename)[1]
-        safe_name = f"assign_{assignment_id}_{file_id}{ext}"
-        file_path = os.path.join(UPLOAD_DIR, safe_name)
-
-        content = await f.read()
-        with open(file_path, "wb") as out:
-            out.write(content)
-
-        att = AssignmentAttachment(
-            assignment_id=assignment_id,
-            name=f.filename,
-            size=len(content),
-            url=f"/uploads/{safe_name}",
-        )
-        db.add(att)
-        saved.append(att)
-
-    db.commit()
+    # async: тело читается потоково; запросы к БД и работа с файлами —
+    # в async-сессии и в пуле потоков, не в цикле событий
+    async with AsyncSessionLocal() as db:
+        if await db.get(Assignment, assignment_id) is None:
+            raise HTTPException(status_code=404, detail="Задание не найдено")
+
+    staged = await receive_uploads(request, UPLOAD_DIR)
+    saved, paths = await run_in_threadpool(_save_assignment_attachments, assignment_id, staged)
+    for path in paths:
+        background_tasks.add_task(precompress_upload, path)
     return saved
 
 
@@ -889,7 +1412,15 @@ def delete_assignment_attachment(
     if not att:
         raise HTTPException(status_code=404, detail="Файл не найден")
 
-    # пробуем удалить физический файл (не критично если не найдём)
+    if att.blob_sha256:
+        # файл удаляется только вместе с последней ссылкой на него
+        unused_path = release_blob(db, att.blob_sha256)
+        db.delete(att)
+        db.commit()
+        remove_blob_file(unused_path)
+        return {"success": True}
+
+    # старый файл с именем по времени: пробуем удалить физический файл (не критично если не найдём)
     try:
         if att.url and att.url.startswith("/uploads/"):
             filename = att.url.replace("/uploads/", "")
@@ -905,42 +1436,53 @@ def delete_assignment_attachment(
 
 # ---------- файлы подразделов ----------
 
+def _save_subsection_files(subsection_id: int, uploaded_by: int, staged: List[StagedUpload]):
+    """Файлы в хранилище и строки файлов подраздела — в своей сессии, в пуле потоков"""
+    db = SessionLocal()
+    try:
+        saved, paths = [], []
+        for item in staged:
+            blob = store_upload(db, item)
+            paths.append(blob.path)
+
+            f = SubsectionFile(
+                subsection_id=subsection_id,
+                name=item.filename,
+                size=item.size,
+                url=blob_url(blob),
+                blob_sha256=blob.sha256,
+                uploaded_by=uploaded_by,
+            )
+            db.add(f)
+            saved.append(f)
+
+        touch_subsection(db, subsection_id)
+        db.commit()
+        return [SubsectionFileSchema(**f.to_dict()) for f in saved], paths
+    finally:
+        # временные файлы, не попавшие в хранилище (при ошибке), удаляются
+        for item in staged:
+            item.discard()
+        db.close()
+
+
 @app.post(
     "/api/subsections/{subsection_id}/files",
     response_model=List[SubsectionFileSchema],
+    dependencies=[Depends(check_upload_size)],
+    openapi_extra=FILES_REQUEST_BODY,
 )
 async def upload_subsection_files(
     subsection_id: int,
-    files: List[UploadFile] = File(...),
+    request: Request,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(require_teacher),
 ):
-    saved_files: List[SubsectionFileSchema] = []
-
-    for f in files:
-        file_id = int(datetime.utcnow().timestamp() * 1000)
-        ext = os.path.splitext(f.filename)[1]
-        safe_name = f"{file_id}{ext}"
-        file_path = os.path.join(UPLOAD_DIR, safe_name)
-
-        content = await f.read()
-        with open(file_path, "wb") as out:
-            out.write(content)
-
-        size = len(content)
-
-        file_schema = SubsectionFileSchema(
-            id=file_id,
-            name=f.filename,
-            size=size,
-            url=f"/uploads/{safe_name}",
-        )
-        saved_files.append(file_schema)
-
-    if subsection_id not in subsection_files:
-        subsection_files[subsection_id] = []
-    subsection_files[subsection_id].extend(saved_files)
-
-    return saved_files
+    staged = await receive_uploads(request, UPLOAD_DIR)
+    saved, paths = await run_in_threadpool(_save_subsection_files, subsection_id, current_user.id, staged)
+    for path in paths:
+        background_tasks.add_task(precompress_upload, path)
+    return saved
 
 
 @app.delete(
@@ -950,23 +1492,27 @@ async def upload_subsection_files(
 def delete_subsection_file(
     subsection_id: int,
     file_id: int,
+    db: Session = Depends(get_db),
     current_user: User = Depends(require_teacher),
 ):
-    if subsection_id not in subsection_files:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Файлы для данного подраздела не найдены",
-        )
-
-    files = subsection_files[subsection_id]
-    new_files = [f for f in files if f.id != file_id]
-    if len(new_files) == len(files):
+    f = (
+        db.query(SubsectionFile)
+        .filter(SubsectionFile.id == file_id)
+        .filter(SubsectionFile.subsection_id == subsection_id)
+        .first()
+    )
+    if not f:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Файл не найден",
         )
 
-    subsection_files[subsection_id] = new_files
+    # файл удаляется только вместе с последней ссылкой на него
+    unused_path = release_blob(db, f.blob_sha256 or blob_sha_from_url(f.url))
+    db.delete(f)
+    touch_subsection(db, subsection_id)
+    db.commit()
+    remove_blob_file(unused_path)
     return {"success": True}
 
 # ---------- прочее ----------
@@ -1007,6 +1553,7 @@ def get_pending_users(
 @app.post("/api/admin/users/{user_id}/approve")
 def approve_user(
     user_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(require_department_head),
     db: Session = Depends(get_db),
 ):
@@ -1028,6 +1575,7 @@ def approve_user(
     user.confirmed_by = current_user.id
 
     db.commit()
+    invalidate_user(background_tasks, user.id)
 
     return {
         "success": True,
@@ -1039,6 +1587,7 @@ def approve_user(
 @app.post("/api/admin/users/{user_id}/reject")
 def reject_user(
     user_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(require_department_head),
     db: Session = Depends(get_db),
 ):
@@ -1059,6 +1608,7 @@ def reject_user(
     user.confirmed_by = current_user.id
 
     db.commit()
+    invalidate_user(background_tasks, user.id)
 
     return {
         "success": True,
@@ -1069,6 +1619,7 @@ def reject_user(
 @app.post("/api/admin/users/{user_id}/promote-to-department-head")
 def promote_to_department_head(
     user_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
@@ -1091,6 +1642,7 @@ def promote_to_department_head(
     user.role = UserRole.DEPARTMENT_HEAD
     db.commit()
     db.refresh(user)
+    invalidate_user(background_tasks, user.id)
 
     return {
         "success": True,
@@ -1119,60 +1671,12 @@ def get_status_message(status: UserStatus) -> str:
     return messages.get(status, "Неизвестный статус.")
 
 @app.get("/api/messenger/threads", response_model=List[ThreadResponse])
-def get_message_threads(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_account_confirmation()),
+async def get_message_threads(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_async),
 ):
     """Получить все диалоги текущего пользователя"""
-    if current_user.role == UserRole.STUDENT:
-        threads = (
-            db.query(MessageThread)
-            .filter(MessageThread.student_id == current_user.id)
-            .filter(MessageThread.is_archived == False)
-            .order_by(MessageThread.last_message_at.desc())
-            .all()
-        )
-    else:
-        threads = (
-            db.query(MessageThread)
-            .filter(MessageThread.teacher_id == current_user.id)
-            .filter(MessageThread.is_archived == False)
-            .order_by(MessageThread.last_message_at.desc())
-            .all()
-        )
-    
-    result = []
-    for thread in threads:
-        # Передаем ID текущего пользователя в to_dict
-        thread_dict = thread.to_dict(current_user.id)
-        
-        # Получаем последнее сообщение
-        last_message = (
-            db.query(Message)
-            .filter(Message.thread_id == thread.id)
-            .order_by(Message.created_at.desc())
-            .first()
-        )
-        if last_message:
-            thread_dict["last_message"] = last_message.to_dict()
-        
-        # Пересчитываем количество непрочитанных сообщений (только чужие)
-        unread_count = (
-            db.query(Message)
-            .filter(Message.thread_id == thread.id)
-            .filter(Message.is_read == False)
-            .filter(Message.sender_id != current_user.id)  # Только сообщения от другого пользователя
-            .count()
-        )
-        
-        thread.unread_count = unread_count
-        thread_dict["unread_count"] = unread_count
-        
-        result.append(thread_dict)
-    
-    db.commit()  
-    
-    return result
+    return await db.run_sync(thread_list, current_user)
 
 
 @app.get("/api/messenger/teachers", response_model=TeacherListResponse)
@@ -1199,15 +1703,30 @@ def get_available_teachers(
 
 
 @app.get("/api/messenger/threads/{thread_id}/messages", response_model=List[MessageResponse])
-def get_thread_messages(
+async def get_thread_messages(
     thread_id: int,
+    background_tasks: BackgroundTasks,
+    response: Response,
     page: int = 1,
     limit: int = 50,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async),
 ):
-    """Получить сообщения диалога"""
-    thread = db.query(MessageThread).filter(MessageThread.id == thread_id).first()
+    """Получить сообщения диалога.
+
+    Курсорный режим: before_id — более старые сообщения (прокрутка истории),
+    after_id — только новые после указанного. Курсор для следующего запроса
+    возвращается в заголовке X-Next-Cursor. Без курсора работает page.
+    """
+    if before_id is not None and after_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Укажите только один из параметров before_id или after_id",
+        )
+
+    thread = await db.get(MessageThread, thread_id)
     if not thread:
         raise HTTPException(status_code=404, detail="Диалог не найден")
     
@@ -1217,46 +1736,29 @@ def get_thread_messages(
     elif current_user.role != UserRole.STUDENT and thread.teacher_id != current_user.id:
         raise HTTPException(status_code=403, detail="Нет доступа к этому диалогу")
     
-    # Помечаем сообщения от другого пользователя как прочитанные
-    unread_messages = (
-        db.query(Message)
-        .filter(Message.thread_id == thread_id)
-        .filter(Message.is_read == False)
-        .filter(Message.sender_id != current_user.id)  # Только чужие сообщения
-        .all()
-    )
-    
-    for msg in unread_messages:
-        msg.is_read = True
-    
-    # Пересчитываем количество непрочитанных сообщений (только чужие)
-    unread_count = (
-        db.query(Message)
-        .filter(Message.thread_id == thread_id)
-        .filter(Message.is_read == False)
-        .filter(Message.sender_id != current_user.id)
-        .count()
-    )
-    
-    thread.unread_count = unread_count
-    db.commit()
-    
-    # Получаем сообщения
-    messages = (
-        db.query(Message)
-        .filter(Message.thread_id == thread_id)
-        .order_by(Message.created_at.desc())
-        .offset((page - 1) * limit)
-        .limit(limit)
-        .all()
-    )
-    
-    return [msg.to_dict() for msg in reversed(messages)]
+    page, limit = max(1, page), max(1, min(limit, 200))
+
+    # Помечаем сообщения от другого пользователя как прочитанные (один UPDATE);
+    # события собираются в той же синхронной части — после commit атрибуты
+    # диалога истекают, а ленивую загрузку в async-сессии делать нельзя
+    def mark_read(session: Session) -> list:
+        marked = mark_thread_read(session, thread, current_user.id)
+        session.commit()
+        return read_events(thread, current_user.id, marked) if marked else []
+
+    publish_events(background_tasks, await db.run_sync(mark_read))
+
+    messages, next_cursor = await db.run_sync(message_page, thread_id, page, limit, before_id, after_id)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+
+    return messages
 
 
 @app.post("/api/messenger/messages", response_model=MessageResponse)
 def send_message(
     message_data: MessageCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -1286,13 +1788,12 @@ def send_message(
         thread = MessageThread(
             student_id=current_user.id,
             teacher_id=teacher.id,
-            unread_count=1  # При создании диалога - одно непрочитанное сообщение (от студента для преподавателя)
         )
         db.add(thread)
         db.flush()  # Получаем ID диалога перед коммитом
-    else:
-        # Увеличиваем счетчик непрочитанных только для получателя (преподавателя)
-        thread.unread_count += 1
+    
+    # Увеличиваем счетчик непрочитанных только для получателя (преподавателя)
+    register_incoming_message(thread, current_user.id)
     
     # Создаем сообщение
     message = Message(
@@ -1308,12 +1809,15 @@ def send_message(
     db.commit()
     db.refresh(message)
     
-    return message.to_dict()
+    result = message.to_dict()
+    publish_events(background_tasks, message_events(thread, result))
+    return result
 
 
 @app.post("/api/messenger/messages/{thread_id}/reply", response_model=MessageResponse)
 def reply_to_thread(
     thread_id: int,
+    background_tasks: BackgroundTasks,
     request: dict = Body(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
@@ -1358,12 +1862,14 @@ def reply_to_thread(
     thread.last_message_at = datetime.utcnow()
     
     # Увеличиваем счетчик непрочитанных для получателя
-    thread.unread_count += 1
+    register_incoming_message(thread, current_user.id)
     
     db.commit()
     db.refresh(message)
     
-    return message.to_dict()
+    result = message.to_dict()
+    publish_events(background_tasks, message_events(thread, result))
+    return result
 
 
 @app.get("/api/messenger/unread-count", response_model=UnreadCountResponse)
@@ -1373,39 +1879,20 @@ def get_unread_message_count(
 ):
     """Получить количество непрочитанных сообщений (только чужие)"""
     if current_user.role == UserRole.STUDENT:
-        threads = db.query(MessageThread).filter(
+        rows = db.query(MessageThread.id, MessageThread.student_unread_count).filter(
             MessageThread.student_id == current_user.id,
             MessageThread.is_archived == False
         ).all()
     else:
-        threads = db.query(MessageThread).filter(
+        rows = db.query(MessageThread.id, MessageThread.teacher_unread_count).filter(
             MessageThread.teacher_id == current_user.id,
             MessageThread.is_archived == False
         ).all()
     
-    total_unread = 0
-    thread_unread_counts = {}
-    
-    for thread in threads:
-        # Считаем только непрочитанные сообщения от другого пользователя
-        unread_count = (
-            db.query(Message)
-            .filter(Message.thread_id == thread.id)
-            .filter(Message.is_read == False)
-            .filter(Message.sender_id != current_user.id)  # Только чужие сообщения
-            .count()
-        )
-        
-        # Обновляем счетчик в базе
-        thread.unread_count = unread_count
-        
-        total_unread += unread_count
-        thread_unread_counts[thread.id] = unread_count
-    
-    db.commit()  # Сохраняем обновленные счетчики
+    thread_unread_counts = {thread_id: unread_count for thread_id, unread_count in rows}
     
     return UnreadCountResponse(
-        total_unread=total_unread,
+        total_unread=sum(thread_unread_counts.values()),
         thread_unread_counts=thread_unread_counts
     )
 
@@ -1413,6 +1900,7 @@ def get_unread_message_count(
 @app.post("/api/messenger/threads/{thread_id}/read")
 def mark_thread_as_read(
     thread_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
@@ -1427,21 +1915,11 @@ def mark_thread_as_read(
     elif current_user.role != UserRole.STUDENT and thread.teacher_id != current_user.id:
         raise HTTPException(status_code=403, detail="Нет доступа к этому диалогу")
     
-    # Помечаем все сообщения от другого пользователя как прочитанные
-    unread_messages = (
-        db.query(Message)
-        .filter(Message.thread_id == thread_id)
-        .filter(Message.is_read == False)
-        .filter(Message.sender_id != current_user.id)  # Только чужие сообщения
-        .all()
-    )
-    
-    for msg in unread_messages:
-        msg.is_read = True
-    
-    # Сбрасываем счетчик непрочитанных (только для чужих сообщений)
-    thread.unread_count = 0
+    # Помечаем все сообщения от другого пользователя как прочитанные (один UPDATE),
+    # счетчик непрочитанных уменьшается ровно на число отмеченных
+    marked = mark_thread_read(db, thread, current_user.id)
     db.commit()
+    publish_events(background_tasks, read_events(thread, current_user.id, marked))
     
     return {"success": True, "message": "Все сообщения отмечены как прочитанные"}
 
@@ -1476,45 +1954,87 @@ def get_unread_summary(
     current_user: User = Depends(get_current_user),
 ):
     """Получить краткую статистику по непрочитанным сообщениям (только чужие)"""
+    Student = aliased(User)
+    Teacher = aliased(User)
+    query = (
+        db.query(MessageThread.id, Student.full_name, Teacher.full_name)
+        .outerjoin(Student, MessageThread.student_id == Student.id)
+        .outerjoin(Teacher, MessageThread.teacher_id == Teacher.id)
+        .filter(MessageThread.is_archived == False)
+    )
     if current_user.role == UserRole.STUDENT:
-        threads = db.query(MessageThread).filter(
-            MessageThread.student_id == current_user.id,
-            MessageThread.is_archived == False
-        ).all()
+        rows = (
+            query.add_columns(MessageThread.student_unread_count)
+            .filter(MessageThread.student_id == current_user.id)
+            .all()
+        )
     else:
-        threads = db.query(MessageThread).filter(
-            MessageThread.teacher_id == current_user.id,
-            MessageThread.is_archived == False
-        ).all()
+        rows = (
+            query.add_columns(MessageThread.teacher_unread_count)
+            .filter(MessageThread.teacher_id == current_user.id)
+            .all()
+        )
     
     total_unread = 0
     threads_with_unread = []
     
-    for thread in threads:
-        # Считаем только непрочитанные сообщения от других пользователей
-        unread_count = (
-            db.query(Message)
-            .filter(Message.thread_id == thread.id)
-            .filter(Message.is_read == False)
-            .filter(Message.sender_id != current_user.id)  # Только чужие сообщения
-            .count()
-        )
-        
+    for thread_id, student_name, teacher_name, unread_count in rows:
         if unread_count > 0:
             total_unread += unread_count
             threads_with_unread.append({
-                "id": thread.id,
-                "teacher_name": thread.teacher.full_name if thread.teacher else "Неизвестный",
-                "student_name": thread.student.full_name if thread.student else "Неизвестный",
+                "id": thread_id,
+                "teacher_name": teacher_name or "Неизвестный",
+                "student_name": student_name or "Неизвестный",
                 "unread_count": unread_count
             })
     
     return {
         "total_unread": total_unread,
         "threads_with_unread": threads_with_unread,
-        "total_threads": len(threads)
+        "total_threads": len(rows)
     }
     
-    return {"success": True, "message": "Диалог архивирован"}
+@app.websocket("/api/messenger/ws")
+async def messenger_events_ws(websocket: WebSocket, token: str = ""):
+    """Push-канал мессенджера: новые сообщения, прочтения и изменения счётчиков.
+
+    Браузер не умеет передавать заголовок Authorization при открытии WebSocket,
+    поэтому access-токен передаётся параметром ?token=.
+    """
+    try:
+        async with AsyncSessionLocal() as db:
+            user = await get_user_by_token_async(token, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+
+    async with broker.subscription(user_channel(user.id)) as queue:
+
+        async def forward_events():
+            while True:
+                await websocket.send_text(await queue.get())
+
+        async def wait_disconnect():
+            # входящие сообщения клиента (ping) игнорируем, ждём только отключения
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+
+        tasks = [
+            asyncio.create_task(forward_events()),
+            asyncio.create_task(wait_disconnect()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,213 @@
+"""Служебные команды бэкенда: python manage.py <команда>"""
+import argparse
+import os
+import tempfile
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionLocal
+from db_migrations import current_revision, upgrade_database
+from messenger import reconcile_unread_counters
+from blob_store import migrate_legacy_uploads
+from file_serving import precompress_all
+from course_structure import import_structure_files, migrate_structures
+from idempotency import purge_expired_keys
+from read_replicas import copy_sqlite_replicas
+from index_check import check_indexes
+from message_archive import archive_messages
+
+
+def cmd_migrate(args: argparse.Namespace) -> None:
+    if upgrade_database():
+        print("ℹ️ База без истории миграций помечена исходной схемой")
+    print(f"✅ Схема обновлена до ревизии {current_revision()}")
+
+
+def cmd_check_indexes(args: argparse.Namespace) -> None:
+    if args.fresh:
+        # пустая SQLite-база по миграциям — проверяет сами миграции, а не рабочую схему
+        path = os.path.join(tempfile.mkdtemp(prefix="fenix-index-check-"), "check.db")
+        url = f"sqlite:///{path}"
+        upgrade_database(url)
+        engine = create_engine(url)
+        db = sessionmaker(bind=engine)()
+    else:
+        db = SessionLocal()
+    try:
+        problems = check_indexes(db)
+    finally:
+        db.close()
+    for problem in problems:
+        print(f"  {problem}")
+    if problems:
+        raise SystemExit(f"❌ Горячие запросы без индекса: {len(problems)}")
+    print("✅ Все горячие запросы используют индексы")
+
+
+def cmd_reconcile_unread(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        updated = reconcile_unread_counters(db)
+        print(f"✅ Счётчики непрочитанных пересчитаны для диалогов: {updated}")
+    finally:
+        db.close()
+
+
+def cmd_migrate_uploads(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        stats = migrate_legacy_uploads(db, dry_run=args.dry_run)
+    finally:
+        db.close()
+
+    prefix = "[dry-run] " if args.dry_run else "✅ "
+    print(
+        f"{prefix}файлов: {stats['files']}, новых в хранилище: {stats['blobs']}, "
+        f"дубликатов: {stats['duplicates']}"
+    )
+    print(
+        f"{prefix}обновлено вложений: {stats['attachments']}, "
+        f"файлов в структурах курсов: {stats['structure_files']}, "
+        f"без ссылок (оставлены на месте): {stats['unreferenced']}"
+    )
+    if args.dry_run:
+        for name in stats["unreferenced_files"]:
+            print(f"  без ссылок: uploads/{name}")
+
+
+def cmd_precompress_uploads(args: argparse.Namespace) -> None:
+    stats = precompress_all()
+    print(f"✅ Проверено файлов: {stats['files']}, создано сжатых вариантов: {stats['variants']}")
+
+
+def cmd_import_subsection_files(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        stats = import_structure_files(db)
+    finally:
+        db.close()
+    print(
+        f"✅ Перенесено файлов подразделов: {stats['files']} "
+        f"(структур: {stats['structures']}, пропущено без url: {stats['skipped']})"
+    )
+
+
+def cmd_migrate_structures(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        stats = migrate_structures(db)
+    finally:
+        db.close()
+    print(
+        f"✅ Курсов: {stats['courses']}, разделов: {stats['sections']}, "
+        f"подразделов: {stats['subsections']}, файлов подразделов: {stats['files']}"
+    )
+
+
+def cmd_purge_idempotency_keys(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        deleted = purge_expired_keys(db)
+    finally:
+        db.close()
+    print(f"✅ Удалено просроченных ключей идемпотентности: {deleted}")
+
+
+def cmd_archive_messages(args: argparse.Namespace) -> None:
+    db = SessionLocal()
+    try:
+        result = archive_messages(db, args.older_than_days, args.batch_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+    if args.dry_run:
+        print(f"Будет перенесено в архив сообщений: {result['messages']} (диалогов: {result['threads']})")
+    else:
+        print(f"✅ Перенесено в архив сообщений: {result['messages']} (диалогов: {result['threads']})")
+
+
+def cmd_copy_sqlite_replicas(args: argparse.Namespace) -> None:
+    copied = copy_sqlite_replicas()
+    for path in copied:
+        print(f"  {path}")
+    print(f"✅ Скопировано реплик: {len(copied)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Служебные команды FENIX.EDU")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser(
+        "migrate",
+        help="обновить схему БД до последней миграции (базы от create_all помечаются исходной схемой)",
+    )
+    migrate.set_defaults(handler=cmd_migrate)
+
+    check = commands.add_parser(
+        "check-indexes",
+        help="выполнить горячие запросы в откатываемой транзакции и проверить по EXPLAIN, что они идут по индексам",
+    )
+    check.add_argument("--fresh", action="store_true", help="проверить на временной SQLite-базе, созданной миграциями")
+    check.set_defaults(handler=cmd_check_indexes)
+
+    reconcile = commands.add_parser(
+        "reconcile-unread",
+        help="пересчитать счётчики непрочитанных сообщений по таблице messages",
+    )
+    reconcile.set_defaults(handler=cmd_reconcile_unread)
+
+    migrate_uploads = commands.add_parser(
+        "migrate-uploads",
+        help="перенести старые файлы uploads/<timestamp>.<ext> в хранилище по sha256",
+    )
+    migrate_uploads.add_argument("--dry-run", action="store_true", help="только показать, что будет сделано")
+    migrate_uploads.set_defaults(handler=cmd_migrate_uploads)
+
+    precompress = commands.add_parser(
+        "precompress-uploads",
+        help="создать .gz/.br рядом со сжимаемыми файлами в uploads/",
+    )
+    precompress.set_defaults(handler=cmd_precompress_uploads)
+
+    import_files = commands.add_parser(
+        "import-subsection-files",
+        help="перенести файлы подразделов из JSON структур курсов в таблицу subsection_files",
+    )
+    import_files.set_defaults(handler=cmd_import_subsection_files)
+
+    structures = commands.add_parser(
+        "migrate-structures",
+        help="разложить JSON структур курсов на строки разделов и подразделов",
+    )
+    structures.set_defaults(handler=cmd_migrate_structures)
+
+    purge_keys = commands.add_parser(
+        "purge-idempotency-keys",
+        help="удалить сохранённые ответы Idempotency-Key старше IDEMPOTENCY_KEY_TTL_HOURS",
+    )
+    purge_keys.set_defaults(handler=cmd_purge_idempotency_keys)
+
+    archive = commands.add_parser(
+        "archive-messages",
+        help="перенести прочитанные сообщения архивных и старых диалогов в archived_messages",
+    )
+    archive.add_argument("--dry-run", action="store_true", help="только посчитать, что будет перенесено")
+    archive.add_argument(
+        "--older-than-days", type=int, default=None,
+        help="возраст сообщений для переноса (по умолчанию MESSAGE_ARCHIVE_AFTER_DAYS)",
+    )
+    archive.add_argument("--batch-size", type=int, default=None, help="сообщений в одной транзакции")
+    archive.set_defaults(handler=cmd_archive_messages)
+
+    copy_replicas = commands.add_parser(
+        "copy-sqlite-replicas",
+        help="скопировать SQLite-базу в файлы DATABASE_REPLICA_URLS (локальная проверка реплик)",
+    )
+    copy_replicas.set_defaults(handler=cmd_copy_sqlite_replicas)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
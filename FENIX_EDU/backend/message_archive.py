@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import DateTime, and_, delete, distinct, func, insert, literal, or_, select
+from sqlalchemy.orm import Session, aliased
+
+from config import settings
+from database import SessionLocal
+from models import ArchivedMessage, Message, MessageThread
+
+logger = logging.getLogger("fenix.archive")
+
+# колонки, которые переносятся в archived_messages как есть
+ARCHIVED_COLUMNS = ("id", "thread_id", "sender_id", "content", "is_read", "created_at")
+
+
+# -------- архив сообщений --------
+#
+# В архив уходят прочитанные сообщения архивных диалогов и прочитанные
+# сообщения старше MESSAGE_ARCHIVE_AFTER_DAYS. Непрочитанные и последнее
+# сообщение каждого диалога остаются в messages: счётчики, прочтение и
+# список диалогов работают только с горячей таблицей, а лента сообщений
+# (messenger.message_page) читает обе.
+
+
+def archivable(cutoff: datetime):
+    """Условие отбора сообщений messages в архив"""
+    Newer = aliased(Message)
+    last_in_thread = (
+        select(func.max(Newer.id))
+        .where(Newer.thread_id == Message.thread_id)
+        .scalar_subquery()
+    )
+    in_archived_thread = (
+        select(MessageThread.id)
+        .where(MessageThread.id == Message.thread_id)
+        .where(MessageThread.is_archived == True)
+        .exists()
+    )
+    return and_(
+        Message.is_read == True,
+        Message.id < last_in_thread,
+        or_(Message.created_at < cutoff, in_archived_thread),
+    )
+
+
+def archive_messages(
+    db: Session,
+    older_than_days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """Перенести сообщения в archived_messages пачками по batch_size.
+
+    Каждая пачка — отдельная транзакция (INSERT ... SELECT + DELETE), так что
+    прерванный перенос можно просто запустить снова. Возвращает число
+    сообщений и диалогов; при dry_run только считает.
+    """
+    days = settings.MESSAGE_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.MESSAGE_ARCHIVE_BATCH_SIZE
+    condition = archivable(datetime.utcnow() - timedelta(days=days))
+
+    if dry_run:
+        messages, threads = db.execute(
+            select(func.count(Message.id), func.count(distinct(Message.thread_id))).where(condition)
+        ).one()
+        return {"messages": messages, "threads": threads}
+
+    moved, threads, last_id = 0, set(), 0
+    columns = [getattr(Message, name) for name in ARCHIVED_COLUMNS]
+    while True:
+        rows = db.execute(
+            select(Message.id, Message.thread_id)
+            .where(condition)
+            .where(Message.id > last_id)
+            .order_by(Message.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        ids = [row.id for row in rows]
+        db.execute(
+            insert(ArchivedMessage).from_select(
+                [*ARCHIVED_COLUMNS, "archived_at"],
+                select(*columns, literal(datetime.utcnow(), DateTime)).where(Message.id.in_(ids)),
+            )
+        )
+        db.execute(delete(Message).where(Message.id.in_(ids)))
+        db.commit()
+
+        moved += len(ids)
+        threads.update(row.thread_id for row in rows)
+        last_id = ids[-1]
+
+    return {"messages": moved, "threads": len(threads)}
+
+
+def _archive_once() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return archive_messages(db)
+    finally:
+        db.close()
+
+
+async def archive_periodically() -> None:
+    """Фоновое архивирование раз в MESSAGE_ARCHIVE_INTERVAL_HOURS"""
+    while True:
+        await asyncio.sleep(settings.MESSAGE_ARCHIVE_INTERVAL_HOURS * 3600)
+        try:
+            result = await asyncio.to_thread(_archive_once)
+        except Exception:
+            # например, параллельный запуск в другом воркере — повторим в следующий раз
+            logger.exception("Архивирование сообщений не удалось")
+        else:
+            if result["messages"]:
+                logger.info("В архив перенесено сообщений: %(messages)s (диалогов: %(threads)s)", result)
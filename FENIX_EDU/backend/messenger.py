@@ -0,0 +1,321 @@
+from typing import List, Optional, Tuple
+
+from fastapi import BackgroundTasks
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, case, func, or_, select, union_all, update
+from sqlalchemy.orm import Session, aliased, contains_eager, joinedload
+
+from broker import broker
+from models import ArchivedMessage, Message, MessageThread, User, UserRole
+
+
+# -------- счётчики непрочитанных --------
+#
+# У каждого диалога два счётчика: student_unread_count и teacher_unread_count.
+# Они меняются в той же транзакции, что и вставка сообщения / отметка о
+# прочтении, поэтому для /api/messenger/unread-count не нужно сканировать messages.
+
+
+def unread_column(thread: MessageThread, reader_id: int):
+    """Колонка счётчика непрочитанных для участника диалога"""
+    if reader_id == thread.student_id:
+        return MessageThread.student_unread_count
+    return MessageThread.teacher_unread_count
+
+
+def register_incoming_message(thread: MessageThread, sender_id: int) -> None:
+    """Увеличить счётчик непрочитанных у получателя (не у отправителя)"""
+    recipient_id = thread.teacher_id if sender_id == thread.student_id else thread.student_id
+    column = unread_column(thread, recipient_id)
+    # инкремент выражением SQL, чтобы параллельные отправки не теряли обновления
+    setattr(thread, column.key, column + 1)
+
+
+def last_read_column(thread: MessageThread, reader_id: int):
+    """Колонка отметки «прочитано до id» для участника диалога"""
+    if reader_id == thread.student_id:
+        return MessageThread.student_last_read_id
+    return MessageThread.teacher_last_read_id
+
+
+def mark_thread_read(db: Session, thread: MessageThread, reader_id: int) -> int:
+    """Отметить прочитанными все чужие сообщения диалога одним UPDATE.
+
+    Возвращает число отмеченных сообщений — на него уменьшается счётчик
+    непрочитанных, а отметка прочтения сдвигается до последнего сообщения собеседника.
+    """
+    last_id = (
+        db.query(func.max(Message.id))
+        .filter(Message.thread_id == thread.id)
+        .filter(Message.sender_id != reader_id)
+        .scalar()
+    )
+    if last_id is None:
+        return 0
+
+    marked = (
+        db.query(Message)
+        .filter(Message.thread_id == thread.id)
+        .filter(Message.sender_id != reader_id)
+        .filter(Message.is_read == False)
+        .filter(Message.id <= last_id)
+        .update({Message.is_read: True}, synchronize_session=False)
+    )
+
+    counter = unread_column(thread, reader_id)
+    watermark = last_read_column(thread, reader_id)
+    if marked:
+        setattr(thread, counter.key, case((counter > marked, counter - marked), else_=0))
+    setattr(thread, watermark.key, case((watermark < last_id, last_id), else_=watermark))
+    return marked
+
+
+def reconcile_unread_counters(db: Session) -> int:
+    """Пересчитать счётчики и отметки прочтения по сообщениям (после сбоя или миграции)"""
+
+    # непрочитанные в архив не переносятся — их считаем только в messages
+    def unread_for(reader_id_column):
+        return (
+            select(func.count(Message.id))
+            .where(Message.thread_id == MessageThread.id)
+            .where(Message.is_read == False)
+            .where(Message.sender_id != reader_id_column)
+            .correlate(MessageThread)
+            .scalar_subquery()
+        )
+
+    # а прочитанные могли уйти в архив — отметка берётся по обеим таблицам
+    def last_read_for(reader_id_column):
+        hot, cold = (
+            select(func.coalesce(func.max(model.id), 0))
+            .where(model.thread_id == MessageThread.id)
+            .where(model.is_read == True)
+            .where(model.sender_id != reader_id_column)
+            .correlate(MessageThread)
+            .scalar_subquery()
+            for model in (Message, ArchivedMessage)
+        )
+        return case((hot > cold, hot), else_=cold)
+
+    result = db.execute(
+        update(MessageThread)
+        .values(
+            student_unread_count=unread_for(MessageThread.student_id),
+            teacher_unread_count=unread_for(MessageThread.teacher_id),
+            student_last_read_id=last_read_for(MessageThread.student_id),
+            teacher_last_read_id=last_read_for(MessageThread.teacher_id),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+# -------- выборки для списка диалогов и ленты сообщений --------
+#
+# Синхронные функции над Session: из async-обработчиков вызываются через
+# AsyncSession.run_sync, из синхронного кода — напрямую.
+
+
+def thread_list(db: Session, user: User) -> List[dict]:
+    """Неархивные диалоги пользователя с собеседниками и последним сообщением (один запрос)"""
+    if user.role == UserRole.STUDENT:
+        own_threads = MessageThread.student_id == user.id
+    else:
+        own_threads = MessageThread.teacher_id == user.id
+
+    # id последнего сообщения в каждом диалоге (id растут вместе с created_at)
+    last_ids = (
+        db.query(Message.thread_id, func.max(Message.id).label("last_id"))
+        .join(MessageThread, MessageThread.id == Message.thread_id)
+        .filter(own_threads)
+        .group_by(Message.thread_id)
+        .subquery()
+    )
+
+    Student = aliased(User)
+    Teacher = aliased(User)
+    Sender = aliased(User)
+    LastMessage = aliased(Message)
+
+    rows = (
+        db.query(MessageThread, LastMessage)
+        .outerjoin(Student, MessageThread.student_id == Student.id)
+        .outerjoin(Teacher, MessageThread.teacher_id == Teacher.id)
+        .outerjoin(last_ids, last_ids.c.thread_id == MessageThread.id)
+        .outerjoin(LastMessage, LastMessage.id == last_ids.c.last_id)
+        .outerjoin(Sender, LastMessage.sender_id == Sender.id)
+        .options(
+            contains_eager(MessageThread.student.of_type(Student)),
+            contains_eager(MessageThread.teacher.of_type(Teacher)),
+            contains_eager(LastMessage.sender.of_type(Sender)),
+        )
+        .filter(own_threads)
+        .filter(MessageThread.is_archived == False)
+        .order_by(MessageThread.last_message_at.desc())
+        .all()
+    )
+
+    result = []
+    for thread, last_message in rows:
+        thread_dict = thread.to_dict(user.id)
+        if last_message:
+            thread_dict["last_message"] = last_message.to_dict()
+        result.append(thread_dict)
+    return result
+
+
+def _message_created_at(message_id: int):
+    """Время сообщения-курсора подзапросом — без отдельного обращения к БД.
+
+    Курсор мог указывать на сообщение, которое с тех пор ушло в архив.
+    """
+    return func.coalesce(
+        select(Message.created_at).where(Message.id == message_id).scalar_subquery(),
+        select(ArchivedMessage.created_at).where(ArchivedMessage.id == message_id).scalar_subquery(),
+    )
+
+
+def message_page(
+    db: Session,
+    thread_id: int,
+    page: int,
+    limit: int,
+    before_id: Optional[int],
+    after_id: Optional[int],
+) -> Tuple[List[dict], Optional[int]]:
+    """Сообщения диалога по возрастанию и курсор следующего запроса (или None).
+
+    after_id — новые после курсора, before_id — более старые, без курсора — page.
+    Ключ сортировки (created_at, id) покрыт индексом и в messages, и в
+    archived_messages: по курсору из каждой таблицы берётся не больше limit, и
+    результаты сливаются, так что архив для клиента не виден.
+    """
+    if after_id is None and before_id is None:
+        messages = _numbered_page(db, thread_id, page, limit)
+        next_cursor = messages[0].id if len(messages) == limit else None
+        return [msg.to_dict() for msg in messages], next_cursor
+
+    anchor_created_at = _message_created_at(after_id if after_id is not None else before_id)
+
+    def window(model) -> list:
+        query = (
+            db.query(model)
+            .options(joinedload(model.sender))
+            .filter(model.thread_id == thread_id)
+        )
+        if after_id is not None:
+            return (
+                query.filter(
+                    or_(
+                        model.created_at > anchor_created_at,
+                        and_(model.created_at == anchor_created_at, model.id > after_id),
+                    )
+                )
+                .order_by(model.created_at.asc(), model.id.asc())
+                .limit(limit)
+                .all()
+            )
+        return (
+            query.filter(
+                or_(
+                    model.created_at < anchor_created_at,
+                    and_(model.created_at == anchor_created_at, model.id < before_id),
+                )
+            )
+            .order_by(model.created_at.desc(), model.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    merged = sorted(
+        window(Message) + window(ArchivedMessage),
+        key=lambda msg: (msg.created_at, msg.id),
+        reverse=after_id is None,
+    )[:limit]
+
+    if after_id is not None:
+        # при пустом ответе клиент продолжает опрашивать с тем же курсором
+        next_cursor = merged[-1].id if merged else after_id
+    else:
+        merged.reverse()
+        next_cursor = merged[0].id if len(merged) == limit else None
+
+    return [msg.to_dict() for msg in merged], next_cursor
+
+
+def _numbered_page(db: Session, thread_id: int, page: int, limit: int) -> list:
+    """Страница по номеру (по возрастанию).
+
+    Слияние двух таблиц и OFFSET выполняет СУБД над ключами (created_at, id),
+    так что в память попадают только limit сообщений, как и до архива.
+    """
+    keys = union_all(
+        select(Message.id, Message.created_at).where(Message.thread_id == thread_id),
+        select(ArchivedMessage.id, ArchivedMessage.created_at).where(ArchivedMessage.thread_id == thread_id),
+    ).subquery()
+    ids = db.scalars(
+        select(keys.c.id)
+        .order_by(keys.c.created_at.desc(), keys.c.id.desc())
+        .offset((page - 1) * limit)
+        .limit(limit)
+    ).all()
+    if not ids:
+        return []
+
+    # id уникальны в обеих таблицах: архив сохраняет id перенесённых сообщений
+    by_id = {}
+    for model in (Message, ArchivedMessage):
+        for msg in db.query(model).options(joinedload(model.sender)).filter(model.id.in_(ids)):
+            by_id[msg.id] = msg
+    return [by_id[message_id] for message_id in reversed(ids)]
+
+
+# -------- события для push-канала --------
+#
+# Каждый пользователь слушает свой канал user:<id> (см. /api/messenger/ws).
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def message_events(thread: MessageThread, message: dict) -> list:
+    """Новое сообщение: обоим участникам + прирост непрочитанных получателю"""
+    sender_id = message["sender_id"]
+    recipient_id = thread.teacher_id if sender_id == thread.student_id else thread.student_id
+    new_message = {"type": "message.new", "thread_id": thread.id, "message": message}
+    return [
+        (user_channel(recipient_id), new_message),
+        (user_channel(sender_id), new_message),
+        (
+            user_channel(recipient_id),
+            {"type": "unread.delta", "thread_id": thread.id, "delta": 1},
+        ),
+    ]
+
+
+def read_events(thread: MessageThread, reader_id: int, cleared: int) -> list:
+    """Прочтение диалога: уведомление собеседнику + уменьшение счётчика читателю"""
+    partner_id = thread.teacher_id if reader_id == thread.student_id else thread.student_id
+    read_event = {
+        "type": "thread.read",
+        "thread_id": thread.id,
+        "reader_id": reader_id,
+        "last_read_id": getattr(thread, last_read_column(thread, reader_id).key),
+    }
+    events = [(user_channel(partner_id), read_event)]
+    if cleared:
+        events.append(
+            (
+                user_channel(reader_id),
+                {"type": "unread.delta", "thread_id": thread.id, "delta": -cleared},
+            )
+        )
+    return events
+
+
+def publish_events(background_tasks: BackgroundTasks, events: list) -> None:
+    """Разослать события после отправки ответа (т.е. уже после commit)"""
+    for channel, event in events:
+        background_tasks.add_task(broker.publish, channel, jsonable_encoder(event))
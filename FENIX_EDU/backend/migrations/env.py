@@ -0,0 +1,49 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from config import settings
+from database import Base
+import models  # noqa: F401  — регистрирует таблицы в Base.metadata
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def database_url() -> str:
+    # manage.py и index_check передают URL явно, alembic из консоли — из настроек
+    return config.attributes.get("database_url") or settings.DATABASE_URL
+
+
+def configure(**kw) -> None:
+    # SQLite не умеет большинство ALTER TABLE — alembic пересоздаёт таблицу (batch)
+    context.configure(
+        target_metadata=target_metadata,
+        render_as_batch=database_url().startswith("sqlite"),
+        compare_type=True,
+        **kw,
+    )
+
+
+def run_migrations_offline() -> None:
+    configure(url=database_url(), literal_binds=True, dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connectable = create_engine(database_url(), poolclass=pool.NullPool)
+    with connectable.connect() as connection:
+        configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,301 @@
+"""Схема после доработок мессенджера, структуры курсов, файлов и сдач
+
+Счётчики непрочитанных на диалогах, строки разделов/подразделов курса,
+хранилище файлов по sha256, файлы подразделов, версии сдач с уникальной
+сдачей на студента и ключи идемпотентности.
+
+create_all создавал новые таблицы, но не добавлял столбцы в старые, поэтому
+в существующих базах часть изменений уже может быть — каждый шаг
+проверяет, есть ли таблица, столбец или ограничение.
+
+Данные в новые таблицы переносят отдельные команды (после миграции):
+    python manage.py migrate-structures
+    python manage.py import-subsection-files
+    python manage.py migrate-uploads
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _has_table(table: str) -> bool:
+    return _inspector().has_table(table)
+
+
+def _has_column(table: str, column: str) -> bool:
+    return column in {c["name"] for c in _inspector().get_columns(table)}
+
+
+def _has_unique(table: str, name: str) -> bool:
+    inspector = _inspector()
+    return name in {c["name"] for c in inspector.get_unique_constraints(table)} | {
+        i["name"] for i in inspector.get_indexes(table) if i["unique"]
+    }
+
+
+def _add_columns(table: str, *columns: sa.Column) -> None:
+    missing = [column for column in columns if not _has_column(table, column.name)]
+    if missing:
+        with op.batch_alter_table(table) as batch:
+            for column in missing:
+                batch.add_column(column)
+
+
+def _create_table(table: str, *columns, indexes=()) -> None:
+    if not _has_table(table):
+        op.create_table(table, *columns)
+    for name, index_columns, unique in indexes:
+        op.create_index(name, table, index_columns, unique=unique, if_not_exists=True)
+
+
+def upgrade() -> None:
+    # -------- мессенджер --------
+    _add_columns(
+        "message_threads",
+        sa.Column("student_unread_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("teacher_unread_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("student_last_read_id", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("teacher_last_read_id", sa.Integer(), nullable=False, server_default="0"),
+    )
+    if _has_column("message_threads", "unread_count"):
+        # общий счётчик без владельца: NOT NULL без значения по умолчанию ломает INSERT
+        with op.batch_alter_table("message_threads") as batch:
+            batch.drop_column("unread_count")
+    _reconcile_unread_counters()
+    op.create_index(
+        "ix_messages_thread_created_id", "messages", ["thread_id", "created_at", "id"], if_not_exists=True
+    )
+
+    # -------- структура курса --------
+    _add_columns(
+        "course_structures",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    )
+    _create_table(
+        "course_sections",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("course_id", sa.Integer(), sa.ForeignKey("courses.id"), nullable=False),
+        sa.Column("number", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        indexes=[
+            ("ix_course_sections_id", ["id"], False),
+            ("ix_course_sections_course_position", ["course_id", "position"], False),
+        ],
+    )
+    _create_table(
+        "course_subsections",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("course_id", sa.Integer(), sa.ForeignKey("courses.id"), nullable=False),
+        sa.Column("section_id", sa.Integer(), sa.ForeignKey("course_sections.id"), nullable=False),
+        sa.Column("icon", sa.String(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("status_icon", sa.String(), nullable=False),
+        sa.Column("position", sa.Integer(), nullable=False),
+        indexes=[
+            ("ix_course_subsections_id", ["id"], False),
+            (
+                "ix_course_subsections_course_section_position",
+                ["course_id", "section_id", "position"],
+                False,
+            ),
+        ],
+    )
+
+    # -------- обсуждения --------
+    op.create_index(
+        "ix_discussion_comments_course_sub_created",
+        "discussion_comments",
+        ["course_id", "subsection_id", "created_at"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_discussion_replies_comment_created_id",
+        "discussion_replies",
+        ["comment_id", "created_at", "id"],
+        if_not_exists=True,
+    )
+
+    # -------- файлы --------
+    _create_table(
+        "file_blobs",
+        sa.Column("sha256", sa.String(64), primary_key=True),
+        sa.Column("path", sa.String(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    if not _has_column("assignment_attachments", "blob_sha256"):
+        with op.batch_alter_table("assignment_attachments") as batch:
+            batch.add_column(sa.Column("blob_sha256", sa.String(64), nullable=True))
+            batch.create_foreign_key(
+                "fk_assignment_attachments_blob_sha256", "file_blobs", ["blob_sha256"], ["sha256"]
+            )
+    _create_table(
+        "subsection_files",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("subsection_id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("blob_sha256", sa.String(64), sa.ForeignKey("file_blobs.sha256"), nullable=True),
+        sa.Column("uploaded_by", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("uploaded_at", sa.DateTime(), nullable=False),
+        indexes=[
+            ("ix_subsection_files_id", ["id"], False),
+            ("ix_subsection_files_subsection_id", ["subsection_id"], False),
+        ],
+    )
+
+    # -------- сдачи заданий --------
+    _add_columns(
+        "assignment_submissions",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    )
+    _create_table(
+        "assignment_submission_versions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("submission_id", sa.Integer(), sa.ForeignKey("assignment_submissions.id"), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=True),
+        sa.Column("file_url", sa.String(), nullable=True),
+        sa.Column("submitted_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("submission_id", "version", name="uq_submission_version"),
+        indexes=[("ix_assignment_submission_versions_id", ["id"], False)],
+    )
+    if not _has_unique("assignment_submissions", "uq_submission_assignment_student"):
+        _merge_duplicate_submissions()
+        with op.batch_alter_table("assignment_submissions") as batch:
+            batch.create_unique_constraint("uq_submission_assignment_student", ["assignment_id", "student_id"])
+
+    # -------- идемпотентность --------
+    _create_table(
+        "idempotency_keys",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("key", sa.String(255), nullable=False),
+        sa.Column("fingerprint", sa.String(64), nullable=False),
+        sa.Column("status_code", sa.Integer(), nullable=False),
+        sa.Column("response", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),
+        indexes=[
+            ("ix_idempotency_keys_id", ["id"], False),
+            ("ix_idempotency_keys_created_at", ["created_at"], False),
+        ],
+    )
+
+
+def _reconcile_unread_counters() -> None:
+    """Счётчики и отметки прочтения по messages — как manage.py reconcile-unread"""
+    op.execute(
+        sa.text(
+            """
+            UPDATE message_threads SET
+                student_unread_count = (
+                    SELECT COUNT(m.id) FROM messages m
+                    WHERE m.thread_id = message_threads.id AND m.is_read = :no
+                      AND m.sender_id != message_threads.student_id),
+                teacher_unread_count = (
+                    SELECT COUNT(m.id) FROM messages m
+                    WHERE m.thread_id = message_threads.id AND m.is_read = :no
+                      AND m.sender_id != message_threads.teacher_id),
+                student_last_read_id = (
+                    SELECT COALESCE(MAX(m.id), 0) FROM messages m
+                    WHERE m.thread_id = message_threads.id AND m.is_read = :yes
+                      AND m.sender_id != message_threads.student_id),
+                teacher_last_read_id = (
+                    SELECT COALESCE(MAX(m.id), 0) FROM messages m
+                    WHERE m.thread_id = message_threads.id AND m.is_read = :yes
+                      AND m.sender_id != message_threads.teacher_id)
+            """
+        ).bindparams(sa.bindparam("no", False), sa.bindparam("yes", True))
+    )
+
+
+def _merge_duplicate_submissions() -> None:
+    """Дубли (assignment_id, student_id) — в одну сдачу с историей версий.
+
+    Остаётся самая новая строка (наибольший id); все строки группы по
+    порядку id становятся её версиями 1..n. Оценка и комментарий берутся из
+    последней оценённой строки, если у оставшейся их нет.
+    """
+    keep = (
+        "SELECT assignment_id, student_id, MAX(id) AS keep_id "
+        "FROM assignment_submissions GROUP BY assignment_id, student_id"
+    )
+    # версии — только для сдач, у которых их ещё нет (create_all мог создать таблицу раньше)
+    op.execute(
+        f"""
+        INSERT INTO assignment_submission_versions (submission_id, version, content, file_url, submitted_at)
+        SELECT k.keep_id,
+               ROW_NUMBER() OVER (PARTITION BY s.assignment_id, s.student_id ORDER BY s.id),
+               s.content, s.file_url, s.updated_at
+        FROM assignment_submissions s
+        JOIN ({keep}) k ON k.assignment_id = s.assignment_id AND k.student_id = s.student_id
+        WHERE NOT EXISTS (
+            SELECT 1 FROM assignment_submission_versions v WHERE v.submission_id = k.keep_id
+        )
+        """
+    )
+    # одним UPDATE: условие grade IS NULL проверяется по строке до изменения
+    latest_graded = (
+        "SELECT d.{column} FROM assignment_submissions d "
+        "WHERE d.assignment_id = assignment_submissions.assignment_id "
+        "AND d.student_id = assignment_submissions.student_id AND d.grade IS NOT NULL "
+        "ORDER BY d.id DESC LIMIT 1"
+    )
+    op.execute(
+        f"""
+        UPDATE assignment_submissions SET
+            grade = ({latest_graded.format(column="grade")}),
+            teacher_comment = ({latest_graded.format(column="teacher_comment")})
+        WHERE grade IS NULL AND id IN (SELECT keep_id FROM ({keep}) k)
+        """
+    )
+    op.execute(
+        """
+        UPDATE assignment_submissions SET version = (
+            SELECT COALESCE(MAX(v.version), 1) FROM assignment_submission_versions v
+            WHERE v.submission_id = assignment_submissions.id
+        )
+        """
+    )
+    op.execute(f"DELETE FROM assignment_submissions WHERE id NOT IN (SELECT keep_id FROM ({keep}) k)")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("assignment_submissions") as batch:
+        batch.drop_constraint("uq_submission_assignment_student", type_="unique")
+        batch.drop_column("version")
+    for table in ("idempotency_keys", "assignment_submission_versions", "subsection_files"):
+        op.drop_table(table)
+    with op.batch_alter_table("assignment_attachments") as batch:
+        batch.drop_constraint("fk_assignment_attachments_blob_sha256", type_="foreignkey")
+        batch.drop_column("blob_sha256")
+    op.drop_table("file_blobs")
+    op.drop_index("ix_discussion_replies_comment_created_id", table_name="discussion_replies")
+    op.drop_index("ix_discussion_comments_course_sub_created", table_name="discussion_comments")
+    op.drop_table("course_subsections")
+    op.drop_table("course_sections")
+    with op.batch_alter_table("course_structures") as batch:
+        batch.drop_column("version")
+    op.drop_index("ix_messages_thread_created_id", table_name="messages")
+    with op.batch_alter_table("message_threads") as batch:
+        batch.add_column(sa.Column("unread_count", sa.Integer(), nullable=False, server_default="0"))
+        for column in ("student_unread_count", "teacher_unread_count", "student_last_read_id", "teacher_last_read_id"):
+            batch.drop_column(column)
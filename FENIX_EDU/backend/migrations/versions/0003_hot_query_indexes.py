@@ -0,0 +1,36 @@
+"""Составные индексы под горячие запросы
+
+Прочтение диалога и счётчики (messages: thread_id, is_read, sender_id),
+список диалогов и непрочитанные по участнику (message_threads: student_id /
+teacher_id, is_archived, last_message_at), задания подраздела и курсы группы.
+Проверка планов: python manage.py check-indexes и tests/test_index_check.py.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_messages_thread_read_sender", "messages", ["thread_id", "is_read", "sender_id"]),
+    ("ix_message_threads_student_archived_last", "message_threads", ["student_id", "is_archived", "last_message_at"]),
+    ("ix_message_threads_teacher_archived_last", "message_threads", ["teacher_id", "is_archived", "last_message_at"]),
+    ("ix_assignments_course_sub_created", "assignments", ["course_id", "subsection_id", "created_at"]),
+    ("ix_courses_target_group", "courses", ["target_group"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
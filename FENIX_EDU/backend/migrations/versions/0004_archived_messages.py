@@ -0,0 +1,41 @@
+"""Холодная таблица archived_messages для архива сообщений
+
+Сообщения переносит python manage.py archive-messages (или фоновая задача при
+MESSAGE_ARCHIVE_INTERVAL_HOURS > 0). Понижение возвращает их в messages.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+COLUMNS = "id, thread_id, sender_id, content, is_read, created_at"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "archived_messages",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("thread_id", sa.Integer(), sa.ForeignKey("message_threads.id"), nullable=False),
+        sa.Column("sender_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("is_read", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index(
+        "ix_archived_messages_thread_created_id", "archived_messages", ["thread_id", "created_at", "id"]
+    )
+
+
+def downgrade() -> None:
+    op.execute(f"INSERT INTO messages ({COLUMNS}) SELECT {COLUMNS} FROM archived_messages")
+    op.drop_index("ix_archived_messages_thread_created_id", table_name="archived_messages")
+    op.drop_table("archived_messages")
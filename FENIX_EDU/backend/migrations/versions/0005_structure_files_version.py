@@ -0,0 +1,28 @@
+"""course_structures.files_version — счётчик изменений файлов подразделов
+
+Загрузка и удаление файла раньше увеличивали version, и следующее сохранение
+открытого редактора получало 409. Теперь файлы меняют только files_version
+(кеш и ETag ответа структуры), а version остаётся за правками дерева.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("course_structures") as batch:
+        batch.add_column(sa.Column("files_version", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("course_structures") as batch:
+        batch.drop_column("files_version")
@@ -0,0 +1,56 @@
+"""64-битные id разделов и подразделов курса
+
+Фронтенд создаёт разделы и подразделы с id = Date.now(), и сервер их
+сохраняет (на них уже ссылаются задания, обсуждения и файлы подразделов).
+Такие id больше 2^31 и не помещаются в Integer на Postgres. В SQLite
+INTEGER и так 64-битный — там миграция ничего не делает.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# (таблица, столбец) — первичные ключи раньше ссылок на них
+COLUMNS = [
+    ("course_sections", "id"),
+    ("course_subsections", "id"),
+    ("course_subsections", "section_id"),
+    ("assignments", "subsection_id"),
+    ("discussion_comments", "subsection_id"),
+    ("subsection_files", "subsection_id"),
+]
+
+
+def _set_sequences(type_name: str) -> None:
+    # у serial-столбца своя последовательность с типом integer (Postgres 10+)
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for table in ("course_sections", "course_subsections"):
+        sequence = bind.exec_driver_sql(f"SELECT pg_get_serial_sequence('{table}', 'id')").scalar()
+        if sequence:
+            op.execute(f"ALTER SEQUENCE {sequence} AS {type_name}")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        return
+    for table, column in COLUMNS:
+        op.alter_column(table, column, type_=sa.BigInteger(), existing_type=sa.Integer())
+    _set_sequences("bigint")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        return
+    _set_sequences("integer")
+    for table, column in reversed(COLUMNS):
+        op.alter_column(table, column, type_=sa.Integer(), existing_type=sa.BigInteger())
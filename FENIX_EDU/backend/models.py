@@ -2,21 +2,30 @@ import enum
 from datetime import datetime
 
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
     Boolean,
     DateTime,
     ForeignKey,
+    Index,
     Enum as SQLEnum,
     Text,
     JSON,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 
 from database import Base
 
 
+# id разделов и подразделов приходят и от клиента (Date.now() во фронтенде),
+# они не помещаются в 32-битный Integer. В SQLite INTEGER и так 64-битный и
+# только он даёт автоинкремент для первичного ключа.
+StructureId = BigInteger().with_variant(Integer, "sqlite")
+
+
 # -------- enums --------
 
 class UserRole(str, enum.Enum):
@@ -82,7 +91,7 @@ class Course(Base):
     description = Column(Text, nullable=True)
 
     # группа, для которой предназначен курс (используется в /api/courses для студентов)
-    target_group = Column(String, nullable=True)
+    target_group = Column(String, nullable=True, index=True)
 
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
@@ -123,19 +132,77 @@ class CourseStructureModel(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"), unique=True, nullable=False)
+    # до перехода на course_sections/course_subsections дерево хранилось здесь целиком
     data = Column(JSON, default=dict, nullable=False)
+    # растёт при каждом изменении структуры (оптимистичная блокировка)
+    version = Column(Integer, default=1, nullable=False)
+    # растёт при загрузке/удалении файлов подразделов: меняет ответ (кеш, ETag),
+    # но не version — иначе несохранённая правка в редакторе получила бы 409
+    files_version = Column(Integer, default=0, nullable=False)
 
     course = relationship("Course", back_populates="structures")
 
 
+class CourseSection(Base):
+    __tablename__ = "course_sections"
+    __table_args__ = (Index("ix_course_sections_course_position", "course_id", "position"),)
+
+    # id может прийти от клиента: на него ссылаются фронтенд и подразделы
+    id = Column(StructureId, primary_key=True, index=True)
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
+
+    number = Column(Integer, nullable=False)
+    title = Column(String, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "number": self.number,
+            "title": self.title,
+            "subsections": [],
+        }
+
+
+class CourseSubsection(Base):
+    __tablename__ = "course_subsections"
+    __table_args__ = (
+        Index("ix_course_subsections_course_section_position", "course_id", "section_id", "position"),
+    )
+
+    # id подраздела используют задания, обсуждения и файлы подразделов
+    id = Column(StructureId, primary_key=True, index=True)
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
+    section_id = Column(StructureId, ForeignKey("course_sections.id"), nullable=False)
+
+    icon = Column(String, nullable=False, default="")
+    title = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="")
+    status_icon = Column(String, nullable=False, default="")
+    position = Column(Integer, nullable=False, default=0)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "icon": self.icon,
+            "title": self.title,
+            "status": self.status,
+            "statusIcon": self.status_icon,
+            "files": [],
+        }
+
+
 # -------- discussions --------
 
 class DiscussionComment(Base):
     __tablename__ = "discussion_comments"
+    __table_args__ = (
+        Index("ix_discussion_comments_course_sub_created", "course_id", "subsection_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
-    subsection_id = Column(Integer, nullable=False)
+    subsection_id = Column(StructureId, nullable=False)
 
     author_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     content = Column(Text, nullable=False)
@@ -149,6 +216,7 @@ class DiscussionComment(Base):
 
 class DiscussionReply(Base):
     __tablename__ = "discussion_replies"
+    __table_args__ = (Index("ix_discussion_replies_comment_created_id", "comment_id", "created_at", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     comment_id = Column(Integer, ForeignKey("discussion_comments.id"), nullable=False)
@@ -164,10 +232,12 @@ class DiscussionReply(Base):
 
 class Assignment(Base):
     __tablename__ = "assignments"
+    # задания подраздела, новые сверху
+    __table_args__ = (Index("ix_assignments_course_sub_created", "course_id", "subsection_id", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
-    subsection_id = Column(Integer, nullable=False)
+    subsection_id = Column(StructureId, nullable=False)
 
     title = Column(String(200), nullable=False)
     description = Column(Text, nullable=True)
@@ -184,6 +254,11 @@ class Assignment(Base):
 
 class AssignmentSubmission(Base):
     __tablename__ = "assignment_submissions"
+    # одна сдача на студента: повторная сдача обновляет строку (upsert) и
+    # добавляет версию в assignment_submission_versions
+    __table_args__ = (
+        UniqueConstraint("assignment_id", "student_id", name="uq_submission_assignment_student"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     assignment_id = Column(Integer, ForeignKey("assignments.id"), nullable=False)
@@ -194,12 +269,20 @@ class AssignmentSubmission(Base):
 
     grade = Column(Integer, nullable=True)
     teacher_comment = Column(Text, nullable=True)
+    # номер текущей версии (последняя строка в versions)
+    version = Column(Integer, default=1, nullable=False)
 
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     assignment = relationship("Assignment", back_populates="submissions")
     student = relationship("User")
+    versions = relationship(
+        "AssignmentSubmissionVersion",
+        back_populates="submission",
+        cascade="all, delete-orphan",
+        order_by="AssignmentSubmissionVersion.version",
+    )
 
     def to_dict(self) -> dict:
         return {
@@ -211,11 +294,42 @@ class AssignmentSubmission(Base):
             "file_url": self.file_url,
             "grade": self.grade,
             "teacher_comment": self.teacher_comment,
+            "version": self.version,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
         }
 
 
+class AssignmentSubmissionVersion(Base):
+    """Неизменяемая история сдач: каждая (пере)сдача — новая строка"""
+
+    __tablename__ = "assignment_submission_versions"
+    __table_args__ = (
+        UniqueConstraint("submission_id", "version", name="uq_submission_version"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    submission_id = Column(Integer, ForeignKey("assignment_submissions.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+
+    content = Column(Text, nullable=True)
+    file_url = Column(String, nullable=True)
+
+    submitted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    submission = relationship("AssignmentSubmission", back_populates="versions")
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "submission_id": self.submission_id,
+            "version": self.version,
+            "content": self.content,
+            "file_url": self.file_url,
+            "submitted_at": self.submitted_at,
+        }
+
+
 class AssignmentAttachment(Base):
     __tablename__ = "assignment_attachments"
 
@@ -225,28 +339,110 @@ class AssignmentAttachment(Base):
     name = Column(String, nullable=False)
     size = Column(Integer, nullable=False)
     url = Column(String, nullable=False)
+    # содержимое в хранилище файлов (None — старый файл с именем по времени)
+    blob_sha256 = Column(String(64), ForeignKey("file_blobs.sha256"), nullable=True)
 
     uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     assignment = relationship("Assignment", back_populates="attachments")
 
 
+# -------- files --------
+
+class FileBlob(Base):
+    """Содержимое файла в хранилище uploads/blobs, адресуемое по SHA-256"""
+
+    __tablename__ = "file_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)  # относительно uploads/, например blobs/ab/<sha256>.pdf
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, default=0, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class SubsectionFile(Base):
+    """Файл, прикреплённый к подразделу структуры курса"""
+
+    __tablename__ = "subsection_files"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subsection_id = Column(StructureId, nullable=False, index=True)
+
+    name = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    url = Column(String, nullable=False)
+    blob_sha256 = Column(String(64), ForeignKey("file_blobs.sha256"), nullable=True)
+    uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    uploaded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "size": self.size,
+            "url": self.url,
+        }
+
+
+# -------- idempotency --------
+
+class IdempotencyKey(Base):
+    """Сохранённый ответ на запрос с заголовком Idempotency-Key"""
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    # sha256 метода, пути и тела: тот же ключ с другим запросом — ошибка клиента
+    fingerprint = Column(String(64), nullable=False)
+
+    status_code = Column(Integer, nullable=False)
+    response = Column(JSON, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
 # -------- messenger --------
 
 class MessageThread(Base):
     __tablename__ = "message_threads"
+    # диалоги участника (без архивных) по времени последнего сообщения
+    __table_args__ = (
+        Index("ix_message_threads_student_archived_last", "student_id", "is_archived", "last_message_at"),
+        Index("ix_message_threads_teacher_archived_last", "teacher_id", "is_archived", "last_message_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     student_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     teacher_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
     last_message_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    unread_count = Column(Integer, default=0, nullable=False)
+    # непрочитанные считаются отдельно для каждого участника диалога
+    student_unread_count = Column(Integer, default=0, nullable=False)
+    teacher_unread_count = Column(Integer, default=0, nullable=False)
+    # id последнего прочитанного сообщения (отметки о прочтении для собеседника)
+    student_last_read_id = Column(Integer, default=0, nullable=False)
+    teacher_last_read_id = Column(Integer, default=0, nullable=False)
     is_archived = Column(Boolean, default=False, nullable=False)
 
     student = relationship("User", foreign_keys=[student_id])
     teacher = relationship("User", foreign_keys=[teacher_id])
 
+    def unread_count_for(self, user_id: int) -> int:
+        if user_id == self.student_id:
+            return self.student_unread_count
+        return self.teacher_unread_count
+
+    def partner_last_read_id(self, user_id: int) -> int:
+        if user_id == self.student_id:
+            return self.teacher_last_read_id
+        return self.student_last_read_id
+
     def to_dict(self, current_user_id: int) -> dict:
         partner = self.teacher if current_user_id == self.student_id else self.student
         # аватарки пока нет — отдаём пустую строку (чтобы фронт не падал)
@@ -263,13 +459,20 @@ class MessageThread(Base):
             "partner_avatar": partner_avatar,
             "partner_id": partner.id if partner else 0,
             "last_message_at": self.last_message_at,
-            "unread_count": self.unread_count,
+            "unread_count": self.unread_count_for(current_user_id),
+            "partner_last_read_id": self.partner_last_read_id(current_user_id),
             "is_archived": self.is_archived,
         }
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # курсорная пагинация по (created_at, id) внутри диалога
+        Index("ix_messages_thread_created_id", "thread_id", "created_at", "id"),
+        # чужие непрочитанные сообщения диалога (прочтение, пересчёт счётчиков)
+        Index("ix_messages_thread_read_sender", "thread_id", "is_read", "sender_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     thread_id = Column(Integer, ForeignKey("message_threads.id"), nullable=False)
@@ -292,4 +495,32 @@ class Message(Base):
             "content": self.content,
             "is_read": self.is_read,
             "created_at": self.created_at,
-        }
\ No newline at end of file
+        }
+
+
+class ArchivedMessage(Base):
+    """Холодная копия сообщения, перенесённого из messages (см. message_archive.py).
+
+    id сохраняется прежним, поэтому курсоры ленты и отметки прочтения
+    остаются действительными.
+    """
+
+    __tablename__ = "archived_messages"
+    __table_args__ = (
+        # прокрутка истории диалога; других индексов у архива нет
+        Index("ix_archived_messages_thread_created_id", "thread_id", "created_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    thread_id = Column(Integer, ForeignKey("message_threads.id"), nullable=False)
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    content = Column(Text, nullable=False)
+    is_read = Column(Boolean, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    sender = relationship("User")
+
+    # в ленте архивное сообщение выглядит так же, как обычное
+    to_dict = Message.to_dict
\ No newline at end of file
@@ -0,0 +1,53 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from config import settings
+from settings import pwd_context
+
+
+class PasswordHashPool:
+    """Отдельный ограниченный пул для хеширования паролей.
+
+    pbkdf2 в hashlib отпускает GIL, поэтому хватает потоков. Пул не даёт
+    массовому входу (начало семестра) занять весь общий threadpool, а при
+    переполнении очереди запрос сразу получает 503 вместо долгого ожидания.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.max_pending = max_pending
+        # меняется только из event loop, блокировка не нужна
+        self.pending = 0
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервер перегружен, повторите попытку через несколько секунд",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+password_pool = PasswordHashPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
+
+
+async def hash_password_async(password: str) -> str:
+    return await password_pool.run(pwd_context.hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Проверить пароль; второй элемент — новый хеш, если параметры хеширования
+    изменились и пароль нужно перехешировать"""
+    return await password_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
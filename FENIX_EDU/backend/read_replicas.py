@@ -0,0 +1,236 @@
+import asyncio
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from broker import broker
+from config import settings
+from database import SQLALCHEMY_DATABASE_URL, AsyncSessionLocal, create_async_db_engine
+from settings import decode_token
+
+logger = logging.getLogger("fenix.db")
+
+# канал, по которому воркеры сообщают друг другу, что пользователь что-то изменил
+USER_WRITES_CHANNEL = "users:wrote"
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+# -------- read-your-writes --------
+
+
+class RecentWriters:
+    """Пользователи, недавно менявшие данные: их чтения идут на primary.
+
+    Реплика может отставать, и без этого пользователь не увидел бы только
+    что отправленное сообщение или сданное задание.
+    """
+
+    def __init__(self, window_seconds: float, max_size: int = 10000):
+        self.window_seconds = window_seconds
+        self.max_size = max_size
+        self._until: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, user_id: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._until[user_id] = now + self.window_seconds
+            if len(self._until) > self.max_size:
+                self._until = {uid: until for uid, until in self._until.items() if until > now}
+
+    def is_recent(self, user_id: int) -> bool:
+        with self._lock:
+            until = self._until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._until.clear()
+
+
+recent_writers = RecentWriters(settings.REPLICA_STICKY_SECONDS)
+
+
+def _token_user_id(authorization: Optional[str]) -> Optional[int]:
+    # только для выбора базы: токен проверяют зависимости авторизации
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return None
+    payload = decode_token(authorization[7:])
+    if not payload or payload.get("type") != "access":
+        return None
+    return payload.get("user_id")
+
+
+async def listen_for_writes() -> None:
+    async with broker.subscription(USER_WRITES_CHANNEL) as queue:
+        while True:
+            message = json.loads(await queue.get())
+            recent_writers.mark(message["user_id"])
+
+
+# -------- реплики --------
+
+
+class Replica:
+    __slots__ = ("name", "url", "engine", "sessionmaker", "healthy")
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.engine = create_async_db_engine(url, name=name)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=False)
+        self.healthy = True
+
+
+class ReplicaSet:
+    """Реплики только для чтения: выбор по кругу среди здоровых"""
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(f"replica-{i + 1}", url) for i, url in enumerate(urls)]
+        self._next = itertools.count()
+        self.reads = {"replica": 0, "primary": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def pick(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def mark_down(self, replica: Replica, error: BaseException) -> None:
+        if replica.healthy:
+            logger.warning("реплика %s недоступна, чтение идёт с primary: %s", replica.name, error)
+        replica.healthy = False
+
+    async def check(self, replica: Replica) -> None:
+        try:
+            async with replica.engine.connect() as conn:
+                await asyncio.wait_for(
+                    conn.execute(text("SELECT 1")), settings.REPLICA_HEALTH_TIMEOUT_SECONDS
+                )
+        except (exc.DBAPIError, OSError, asyncio.TimeoutError) as e:
+            self.mark_down(replica, e)
+            return
+        if not replica.healthy:
+            logger.warning("реплика %s снова доступна", replica.name)
+        replica.healthy = True
+
+    def render_metrics(self) -> str:
+        """Состояние реплик и счётчик чтений в формате Prometheus (дополняет metrics.render)"""
+        if not self.enabled:
+            return ""
+        lines = [
+            "# HELP fenix_db_replica_up Реплика прошла последнюю проверку",
+            "# TYPE fenix_db_replica_up gauge",
+        ]
+        lines += [f'fenix_db_replica_up{{replica="{r.name}"}} {int(r.healthy)}' for r in self.replicas]
+        lines += [
+            "# HELP fenix_db_read_sessions_total Сессии get_read_db по базе",
+            "# TYPE fenix_db_read_sessions_total counter",
+        ]
+        lines += [f'fenix_db_read_sessions_total{{target="{target}"}} {n}' for target, n in self.reads.items()]
+        return "\n".join(lines) + "\n"
+
+    async def monitor(self) -> None:
+        """Фоновая проверка реплик раз в REPLICA_HEALTH_CHECK_SECONDS"""
+        while True:
+            await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+            await asyncio.sleep(settings.REPLICA_HEALTH_CHECK_SECONDS)
+
+
+replica_set = ReplicaSet(settings.DATABASE_REPLICA_URLS)
+
+
+async def get_read_db(request: Request) -> AsyncIterator[AsyncSession]:
+    """Async-сессия для GET-обработчиков, которые только читают.
+
+    Реплика — если она есть и здорова, а пользователь не менял данные в
+    последние REPLICA_STICKY_SECONDS; иначе primary. Реплика, к которой не
+    удалось подключиться, исключается до следующей успешной проверки.
+    """
+    replica = None
+    if replica_set.enabled:
+        user_id = _token_user_id(request.headers.get("authorization"))
+        if user_id is None or not recent_writers.is_recent(user_id):
+            replica = replica_set.pick()
+
+    if replica is not None:
+        async with replica.sessionmaker() as db:
+            try:
+                await db.connection()
+            except (exc.DBAPIError, OSError) as e:
+                replica_set.mark_down(replica, e)
+            else:
+                replica_set.reads["replica"] += 1
+                yield db
+                return
+
+    replica_set.reads["primary"] += 1
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """Отмечает пользователя после успешного изменяющего запроса.
+
+    Отметка ставится до отправки ответа — следующий запрос клиента уже уйдёт
+    на primary; остальные воркеры узнают о ней через брокер.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or not replica_set.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        written: List[int] = []
+
+        async def send_marking_writer(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = dict(scope["headers"])
+                user_id = _token_user_id(headers.get(b"authorization", b"").decode("latin-1"))
+                if user_id is not None:
+                    recent_writers.mark(user_id)
+                    written.append(user_id)
+            await send(message)
+
+        await self.app(scope, receive, send_marking_writer)
+        for user_id in written:
+            await broker.publish(USER_WRITES_CHANNEL, {"user_id": user_id})
+
+
+# -------- локальная проверка на SQLite --------
+
+
+def copy_sqlite_replicas() -> List[str]:
+    """Скопировать primary-базу SQLite в файлы реплик (имитация репликации)"""
+    source = make_url(SQLALCHEMY_DATABASE_URL)
+    if source.get_backend_name() != "sqlite":
+        raise ValueError("Копирование реплик поддерживается только для SQLite")
+
+    copied = []
+    with closing(sqlite3.connect(source.database)) as primary:
+        for replica in replica_set.replicas:
+            target = make_url(replica.url)
+            if target.get_backend_name() != "sqlite" or target.database in (None, "", ":memory:"):
+                continue
+            with closing(sqlite3.connect(target.database)) as copy:
+                primary.backup(copy)
+            copied.append(target.database)
+    return copied
@@ -74,6 +74,7 @@ class DiscussionReplyCreate(BaseModel):
 
 class DiscussionReplyOut(BaseModel):
     id: int
+    comment_id: Optional[int] = None
     author_name: str
     author_role: UserRole
     content: str
@@ -86,7 +87,17 @@ class DiscussionCommentOut(BaseModel):
     author_role: UserRole
     content: str
     created_at: datetime
+    # первые ответы (превью); остальные — GET /api/discussions/{id}/replies
     replies: List[DiscussionReplyOut] = []
+    replies_total: int = 0
+
+
+class DiscussionUpdates(BaseModel):
+    comments: List[DiscussionCommentOut] = []
+    replies: List[DiscussionReplyOut] = []
+    # курсоры для следующего запроса обновлений
+    last_comment_id: int
+    last_reply_id: int
 
 from datetime import datetime
 from pydantic import BaseModel, Field
@@ -125,6 +136,30 @@ class SubmissionGrade(BaseModel):
     grade: int = Field(ge=0, le=100)
     teacher_comment: Optional[str] = None
 
+class SubmissionVersionOut(BaseModel):
+    id: int
+    submission_id: int
+    version: int
+    content: Optional[str]
+    file_url: Optional[str]
+    submitted_at: datetime
+
+
+class SubmissionGradeItem(SubmissionGrade):
+    submission_id: int
+
+class BulkGradeRequest(BaseModel):
+    items: List[SubmissionGradeItem] = Field(min_length=1, max_length=1000)
+
+class BulkGradeItemResult(BaseModel):
+    submission_id: Optional[int] = None
+    success: bool
+    error: Optional[str] = None
+
+class BulkGradeResponse(BaseModel):
+    updated: int
+    results: List[BulkGradeItemResult]
+
 class SubmissionOut(BaseModel):
     id: int
     assignment_id: int
@@ -134,6 +169,7 @@ class SubmissionOut(BaseModel):
     file_url: Optional[str]
     grade: Optional[int]
     teacher_comment: Optional[str]
+    version: int = 1
     created_at: datetime
     updated_at: datetime
 
@@ -171,6 +207,7 @@ class ThreadResponse(BaseModel):
     partner_id: int  # ID собеседника
     last_message_at: datetime
     unread_count: int
+    partner_last_read_id: int = 0  # до какого сообщения собеседник прочитал диалог
     is_archived: bool
     last_message: Optional[MessageResponse] = None
     
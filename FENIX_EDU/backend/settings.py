@@ -5,12 +5,17 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from config import settings
-from models import UserRole, UserStatus
+from models import User, UserRole, UserStatus
 
 
+# min/max = default: хеш с другим числом итераций считается устаревшим
+# и обновляется при входе (verify_and_update)
 pwd_context = CryptContext(
     schemes=["pbkdf2_sha256"],
     deprecated="auto",
+    pbkdf2_sha256__default_rounds=settings.PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__max_rounds=settings.PASSWORD_HASH_ROUNDS,
 )
 
 
@@ -22,6 +27,17 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def user_claims(user: User) -> Dict[str, Any]:
+    """Данные пользователя для токенов; role и status — справочно для клиента,
+    права проверяются по актуальной записи пользователя"""
+    return {
+        "user_id": user.id,
+        "email": user.email,
+        "role": user.role.value,
+        "status": user.status.value,
+    }
+
+
 def create_access_token(
     data: Dict[str, Any],
     expires_delta: Optional[timedelta] = None,
@@ -60,7 +76,10 @@ def decode_token(token: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def refresh_access_token(refresh_token: str) -> Optional[Dict[str, str]]:
+def refresh_access_token(
+    refresh_token: str,
+    claims: Optional[Dict[str, Any]] = None,
+) -> Optional[Dict[str, str]]:
     payload = decode_token(refresh_token)
     if not payload or payload.get("type") != "refresh":
         return None
@@ -71,7 +90,11 @@ def refresh_access_token(refresh_token: str) -> Optional[Dict[str, str]]:
     if not user_id or not email:
         return None
 
+    access_claims = {"user_id": user_id, "email": email}
+    if claims and claims.get("user_id") == user_id:
+        access_claims.update(claims)
+
     return {
-        "access_token": create_access_token({"user_id": user_id, "email": email}),
+        "access_token": create_access_token(access_claims),
         "refresh_token": refresh_token,
     }
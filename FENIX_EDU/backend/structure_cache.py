@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+from config import settings
+
+
+# -------- кеш ответа GET /api/courses/{id}/structure --------
+#
+# Ключ — (course_id, version, files_version): любая правка структуры
+# увеличивает version (course_structure.bump_version), а загрузка или удаление
+# файла подраздела — files_version (course_structure.touch_subsection), поэтому
+# записи не нужно инвалидировать — устаревшие версии просто вытесняются из LRU /
+# истекают в Redis.
+
+Key = Tuple[int, int, int]
+
+
+def structure_etag(course_id: int, version: int, files_version: int) -> str:
+    return f'"structure-{course_id}-v{version}-f{files_version}"'
+
+
+class RedisTier:
+    """Общий для всех воркеров уровень кеша"""
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "fenix:structure:"):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = ttl_seconds
+        self._prefix = prefix
+
+    def _key(self, key: Key) -> str:
+        return self._prefix + ":".join(map(str, key))
+
+    def get(self, key: Key) -> Optional[bytes]:
+        return self._redis.get(self._key(key))
+
+    def set(self, key: Key, body: bytes) -> None:
+        self._redis.set(self._key(key), body, ex=self._ttl)
+
+
+class StructureCache:
+    """LRU сериализованных ответов в процессе + необязательный общий уровень"""
+
+    def __init__(self, max_size: int, shared=None):
+        self.max_size = max_size
+        self.shared = shared
+        self._items: "OrderedDict[Key, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_errors = 0
+
+    def _get_local(self, key: Key) -> Optional[bytes]:
+        with self._lock:
+            body = self._items.get(key)
+            if body is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return body
+
+    def _put_local(self, key: Key, body: bytes) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = body
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def _get_shared(self, key: Key) -> Optional[bytes]:
+        if self.shared is None:
+            return None
+        try:
+            return self.shared.get(key)
+        except Exception:
+            # недоступный Redis не должен ломать чтение структуры
+            self.shared_errors += 1
+            return None
+
+    def _put_shared(self, key: Key, body: bytes) -> None:
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(key, body)
+        except Exception:
+            self.shared_errors += 1
+
+    def get_or_build(self, key: Key, build: Callable[[], bytes]) -> bytes:
+        body = self._get_local(key)
+        if body is not None:
+            return body
+
+        body = self._get_shared(key)
+        if body is not None:
+            with self._lock:
+                self.shared_hits += 1
+        else:
+            with self._lock:
+                self.misses += 1
+            body = build()
+            self._put_shared(key, body)
+
+        self._put_local(key, body)
+        return body
+
+    async def aget_or_build(self, key: Key, build: Callable[[], Awaitable[bytes]]) -> bytes:
+        """get_or_build для async-обработчиков: build — корутина, Redis — в потоке"""
+        body = self._get_local(key)
+        if body is not None:
+            return body
+
+        body = await asyncio.to_thread(self._get_shared, key) if self.shared is not None else None
+        if body is not None:
+            with self._lock:
+                self.shared_hits += 1
+        else:
+            with self._lock:
+                self.misses += 1
+            body = await build()
+            if self.shared is not None:
+                await asyncio.to_thread(self._put_shared, key, body)
+
+        self._put_local(key, body)
+        return body
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "shared_errors": self.shared_errors,
+                "shared_tier": self.shared is not None,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+def _create_shared_tier():
+    if settings.REDIS_URL and settings.STRUCTURE_CACHE_REDIS_TTL_SECONDS > 0:
+        return RedisTier(settings.REDIS_URL, settings.STRUCTURE_CACHE_REDIS_TTL_SECONDS)
+    return None
+
+
+structure_cache = StructureCache(settings.STRUCTURE_CACHE_MAX_SIZE, _create_shared_tier())
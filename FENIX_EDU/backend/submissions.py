@@ -0,0 +1,91 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import AssignmentSubmission, AssignmentSubmissionVersion
+
+
+# -------- сдача задания одним upsert --------
+
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _upsert_row(db: Session, values: dict) -> AssignmentSubmission:
+    insert = _UPSERT_DIALECTS[db.get_bind().dialect.name]
+    stmt = insert(AssignmentSubmission).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AssignmentSubmission.assignment_id, AssignmentSubmission.student_id],
+        set_={
+            "content": stmt.excluded.content,
+            "file_url": stmt.excluded.file_url,
+            "updated_at": stmt.excluded.updated_at,
+            "version": AssignmentSubmission.version + 1,
+        },
+    ).returning(AssignmentSubmission)
+    return db.scalars(stmt, execution_options={"populate_existing": True}).one()
+
+
+def _locked_row(db: Session, values: dict) -> AssignmentSubmission:
+    # прочие СУБД: блокировка строки, гонку первой вставки ловит уникальный индекс
+    sub = (
+        db.query(AssignmentSubmission)
+        .filter(AssignmentSubmission.assignment_id == values["assignment_id"])
+        .filter(AssignmentSubmission.student_id == values["student_id"])
+        .with_for_update()
+        .first()
+    )
+    if sub is None:
+        sub = AssignmentSubmission(**values)
+        db.add(sub)
+    else:
+        sub.content = values["content"]
+        sub.file_url = values["file_url"]
+        sub.updated_at = values["updated_at"]
+        sub.version = AssignmentSubmission.version + 1
+    db.flush()
+    db.refresh(sub)
+    return sub
+
+
+def upsert_submission(
+    db: Session,
+    assignment_id: int,
+    student_id: int,
+    content: Optional[str],
+    file_url: Optional[str],
+) -> AssignmentSubmission:
+    """Создать сдачу или пересдать: INSERT ... ON CONFLICT DO UPDATE + версия.
+
+    Уникальный индекс (assignment_id, student_id) исключает дубли при двойном
+    клике, конфликтующая строка блокируется до commit, поэтому номера версий
+    одной сдачи не пересекаются. Оценка при пересдаче сохраняется.
+    """
+    now = datetime.utcnow()
+    values = {
+        "assignment_id": assignment_id,
+        "student_id": student_id,
+        "content": content,
+        "file_url": file_url,
+        "version": 1,
+        "created_at": now,
+        "updated_at": now,
+    }
+    if db.get_bind().dialect.name in _UPSERT_DIALECTS:
+        sub = _upsert_row(db, values)
+    else:
+        sub = _locked_row(db, values)
+
+    db.add(
+        AssignmentSubmissionVersion(
+            submission_id=sub.id,
+            version=sub.version,
+            content=content,
+            file_url=file_url,
+            submitted_at=now,
+        )
+    )
+    db.flush()
+    return sub
@@ -0,0 +1,94 @@
+"""Общие фикстуры: временная SQLite-база по миграциям и приложение поверх неё"""
+import os
+import sys
+import tempfile
+import uuid
+
+# настройки читаются при импорте модулей бэкенда — база задаётся до них
+_db_dir = tempfile.mkdtemp(prefix="fenix-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from db_migrations import upgrade_database  # noqa: E402
+
+upgrade_database()
+
+from database import SessionLocal, async_engine, engine  # noqa: E402
+from models import User, UserRole, UserStatus  # noqa: E402
+from settings import create_access_token, user_claims  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_user(db):
+    """Активный пользователь с уникальным email"""
+
+    def make(role: UserRole = UserRole.STUDENT, group: str = None) -> User:
+        user = User(
+            email=f"{role.value}-{uuid.uuid4().hex[:12]}@fenixedu.ru",
+            full_name=role.value,
+            hashed_password="-",
+            role=role,
+            status=UserStatus.ACTIVE,
+            group=group,
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user
+
+    return make
+
+
+@pytest.fixture
+def auth_headers():
+    def headers(user: User) -> dict:
+        return {"Authorization": f"Bearer {create_access_token(user_claims(user))}"}
+
+    return headers
+
+
+class QueryCounter:
+    """Число SQL-запросов к базе (sync- и async-движок) внутри with"""
+
+    def __init__(self):
+        self.count = 0
+
+    def _count(self, *_):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        for counted in (engine, async_engine.sync_engine):
+            event.listen(counted, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        for counted in (engine, async_engine.sync_engine):
+            event.remove(counted, "before_cursor_execute", self._count)
+
+
+@pytest.fixture
+def queries():
+    return QueryCounter()
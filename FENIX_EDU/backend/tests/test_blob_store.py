@@ -0,0 +1,120 @@
+import hashlib
+import os
+import threading
+import time
+
+import pytest
+
+import blob_store
+from blob_store import migrate_legacy_uploads, release_blob, remove_blob_file, store_blob
+from database import SessionLocal
+from models import Assignment, AssignmentAttachment, Course, FileBlob, UserRole
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def content(text: str):
+    data = text.encode()
+    return hashlib.sha256(data).hexdigest(), data
+
+
+def writer(data: bytes):
+    def place(abs_path):
+        with open(abs_path, "wb") as f:
+            f.write(data)
+
+    return place
+
+
+def blob_exists(upload_dir, sha256) -> bool:
+    return os.path.exists(os.path.join(upload_dir, blob_store.blob_relpath(sha256, ".txt")))
+
+
+def test_rollback_removes_placed_file(db, upload_dir):
+    sha256, data = content("rollback")
+    store_blob(db, sha256, len(data), ".txt", writer(data))
+    assert blob_exists(upload_dir, sha256)
+
+    db.rollback()
+    assert not blob_exists(upload_dir, sha256)
+    assert db.get(FileBlob, sha256) is None
+
+
+def test_last_reference_removes_file(db, upload_dir):
+    sha256, data = content("release")
+    store_blob(db, sha256, len(data), ".txt", writer(data))
+    db.commit()
+
+    path = release_blob(db, sha256)
+    db.commit()
+    remove_blob_file(path)
+    assert not blob_exists(upload_dir, sha256)
+    assert db.get(FileBlob, sha256) is None
+
+
+def test_reupload_between_release_and_unlink_keeps_file(db, upload_dir):
+    sha256, data = content("reupload")
+    store_blob(db, sha256, len(data), ".txt", writer(data))
+    db.commit()
+    path = release_blob(db, sha256)
+    db.commit()
+
+    # та же загрузка успевает между commit удаления и удалением файла
+    other = SessionLocal()
+    try:
+        store_blob(other, sha256, len(data), ".txt", writer(data))
+        other.commit()
+    finally:
+        other.close()
+
+    remove_blob_file(path)
+    assert blob_exists(upload_dir, sha256)
+    assert db.get(FileBlob, sha256).ref_count == 1
+
+
+def test_unlink_waits_for_uncommitted_upload(db, upload_dir):
+    sha256, data = content("concurrent")
+    path = blob_store.blob_relpath(sha256, ".txt")
+
+    # загрузка вставила строку и положила файл, но ещё не сделала commit
+    store_blob(db, sha256, len(data), ".txt", writer(data))
+    remover = threading.Thread(target=remove_blob_file, args=(path,))
+    remover.start()
+    time.sleep(0.3)
+    db.commit()
+    remover.join(timeout=30)
+
+    assert not remover.is_alive()
+    assert blob_exists(upload_dir, sha256)
+
+
+def test_migration_leaves_unreferenced_legacy_files(db, upload_dir, make_user):
+    teacher = make_user(UserRole.TEACHER)
+    course = Course(name="legacy")
+    db.add(course)
+    db.flush()
+    assignment = Assignment(course_id=course.id, subsection_id=1, title="legacy", created_by=teacher.id)
+    db.add(assignment)
+    db.flush()
+    att = AssignmentAttachment(assignment_id=assignment.id, name="a.txt", size=4, url="/uploads/1700000001.txt")
+    db.add(att)
+    db.commit()
+    (upload_dir / "1700000001.txt").write_bytes(b"used")
+    (upload_dir / "1700000002.txt").write_bytes(b"orphan")
+    orphan_sha256 = hashlib.sha256(b"orphan").hexdigest()
+
+    report = migrate_legacy_uploads(db, dry_run=True)
+    assert report["unreferenced_files"] == ["1700000002.txt"]
+
+    stats = migrate_legacy_uploads(db)
+    assert (stats["attachments"], stats["unreferenced"]) == (1, 1)
+    db.refresh(att)
+    assert att.blob_sha256 == hashlib.sha256(b"used").hexdigest()
+    # файл без ссылок не перенесён: ни строки с ref_count=0, ни удаления
+    assert db.get(FileBlob, orphan_sha256) is None
+    assert (upload_dir / "1700000002.txt").read_bytes() == b"orphan"
+    assert not (upload_dir / "1700000001.txt").exists()
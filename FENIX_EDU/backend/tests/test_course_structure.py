@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import BigInteger
+from sqlalchemy.dialects import postgresql
+
+from models import Course, CourseSection, CourseStructureModel, CourseSubsection, UserRole
+
+CLIENT_ID = 1_760_000_000_000  # Date.now() во фронтенде — больше 2^31
+
+
+@pytest.fixture
+def teacher_headers(make_user, auth_headers):
+    return auth_headers(make_user(UserRole.TEACHER))
+
+
+@pytest.mark.parametrize("method, path", [
+    ("patch", "/structure/sections/1"),
+    ("delete", "/structure/sections/1"),
+    ("post", "/structure/sections/1/subsections"),
+    ("patch", "/structure/subsections/1"),
+    ("delete", "/structure/subsections/1"),
+])
+def test_node_edits_of_missing_course_do_not_create_structure(client, db, teacher_headers, method, path):
+    course_id = 999_999
+    kwargs = {"json": {"title": "x"}} if method != "delete" else {}
+    response = getattr(client, method)(f"/api/courses/{course_id}{path}", headers=teacher_headers, **kwargs)
+
+    assert response.status_code == 404
+    assert response.json()["error"] == "Курс не найден"
+    assert db.query(CourseStructureModel).filter_by(course_id=course_id).count() == 0
+
+
+def test_client_ids_round_trip(client, db, teacher_headers):
+    course = Course(name="structure")
+    db.add(course)
+    db.commit()
+
+    section = client.post(
+        f"/api/courses/{course.id}/structure/sections",
+        json={"id": CLIENT_ID, "title": "Раздел"},
+        headers=teacher_headers,
+    )
+    assert section.status_code == 200
+    sub = client.post(
+        f"/api/courses/{course.id}/structure/sections/{CLIENT_ID}/subsections",
+        json={"id": CLIENT_ID + 1, "title": "Подраздел"},
+        headers=teacher_headers,
+    )
+    assert sub.status_code == 200
+
+    structure = client.get(f"/api/courses/{course.id}/structure", headers=teacher_headers).json()
+    assert structure["sections"][0]["id"] == CLIENT_ID
+    assert structure["sections"][0]["subsections"][0]["id"] == CLIENT_ID + 1
+
+
+@pytest.mark.parametrize("table, column", [
+    (CourseSection.__table__, "id"),
+    (CourseSubsection.__table__, "id"),
+    (CourseSubsection.__table__, "section_id"),
+])
+def test_structure_ids_are_bigint_on_postgres(table, column):
+    assert isinstance(table.c[column].type.dialect_impl(postgresql.dialect()), BigInteger)
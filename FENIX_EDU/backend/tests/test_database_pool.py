@@ -0,0 +1,110 @@
+"""Пул соединений под параллельной нагрузкой (create_db_engine)"""
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import exc
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+from database import Base, create_db_engine
+from messenger import register_incoming_message
+from models import Assignment, Course, Message, MessageThread, User, UserRole, UserStatus
+from submissions import upsert_submission
+
+WORKERS = 16
+OPERATIONS = 15
+
+
+@pytest.fixture
+def small_pool(tmp_path, monkeypatch):
+    """Движок к отдельной базе с пулом меньше числа потоков"""
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 2)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 1)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT_SECONDS", 10)
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0)  # ожидание блокировок здесь ожидаемо
+
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'pool.db'}", name="test-pool")
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+def _seed(Session) -> dict:
+    db = Session()
+    try:
+        teacher = User(
+            email="t@pool.fenixedu.ru", full_name="t", hashed_password="-",
+            role=UserRole.TEACHER, status=UserStatus.ACTIVE,
+        )
+        students = [
+            User(
+                email=f"s{i}@pool.fenixedu.ru", full_name=f"s{i}", hashed_password="-",
+                role=UserRole.STUDENT, status=UserStatus.ACTIVE,
+            )
+            for i in range(WORKERS)
+        ]
+        course = Course(name="pool")
+        db.add_all([teacher, course, *students])
+        db.flush()
+        assignment = Assignment(course_id=course.id, subsection_id=1, title="pool", created_by=teacher.id)
+        threads = [MessageThread(student_id=s.id, teacher_id=teacher.id) for s in students]
+        db.add_all([assignment, *threads])
+        db.commit()
+        return {"assignment_id": assignment.id, "threads": {t.student_id: t.id for t in threads}}
+    finally:
+        db.close()
+
+
+def _operation(Session, data: dict, student_id: int, kind: int) -> None:
+    # то же, что обработчики в час пик: ответ в диалог, сдача задания, список диалогов
+    db = Session()
+    try:
+        if kind == 0:
+            thread = db.get(MessageThread, data["threads"][student_id])
+            db.add(Message(thread_id=thread.id, sender_id=student_id, content="ответ"))
+            register_incoming_message(thread, student_id)
+            thread.last_message_at = datetime.utcnow()
+            db.commit()
+        elif kind == 1:
+            upsert_submission(db, data["assignment_id"], student_id, "решение", None)
+            db.commit()
+        else:
+            db.query(MessageThread).filter(MessageThread.student_id == student_id).all()
+    finally:
+        db.close()
+
+
+def test_concurrent_sessions_do_not_time_out_on_small_pool(small_pool):
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=small_pool)
+    data = _seed(Session)
+    errors = []
+
+    def worker(student_id: int) -> None:
+        for i in range(OPERATIONS):
+            try:
+                _operation(Session, data, student_id, i % 3)
+            except (exc.TimeoutError, exc.OperationalError) as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(sid,)) for sid in data["threads"]]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    pool = small_pool.pool
+    assert errors == []
+    assert pool.capacity == 3
+    assert pool.timeouts == 0
+    assert pool.wait.count >= WORKERS * OPERATIONS
+    # каждое ожидание соединения — не дольше половины pool_timeout
+    assert pool.wait.counts[pool.wait.buckets.index(5.0)] == pool.wait.count
+
+    db = Session()
+    try:
+        assert db.query(Message).count() == WORKERS * len(range(0, OPERATIONS, 3))
+    finally:
+        db.close()
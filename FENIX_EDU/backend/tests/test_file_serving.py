@@ -0,0 +1,47 @@
+import gzip
+
+import pytest
+
+import file_serving
+
+TEXT = b"fenix " * 2000
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_serving, "UPLOAD_DIR", str(tmp_path))
+    blobs = tmp_path / "blobs" / "ab"
+    blobs.mkdir(parents=True)
+    (blobs / "abcdef.txt").write_bytes(TEXT)
+    (blobs / "abcdef.txt.gz").write_bytes(gzip.compress(TEXT))
+    (tmp_path / ".upload-123.part").write_bytes(b"half")
+    (blobs / "abcdef.txt.br.part").write_bytes(b"half")
+    (tmp_path / "1700000000.tar.gz").write_bytes(gzip.compress(b"archive"))
+    return tmp_path
+
+
+@pytest.mark.parametrize("path", [
+    "/uploads/.upload-123.part",
+    "/uploads/blobs/ab/abcdef.txt.br.part",
+    "/uploads/blobs/ab/abcdef.txt.gz",
+])
+def test_service_files_are_not_served(client, upload_dir, path):
+    assert client.get(path).status_code == 404
+
+
+def test_precompressed_variant_only_through_accept_encoding(client, upload_dir):
+    response = client.get("/uploads/blobs/ab/abcdef.txt", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.content == TEXT
+
+    plain = client.get("/uploads/blobs/ab/abcdef.txt", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in plain.headers
+    assert plain.content == TEXT
+
+
+def test_uploaded_gzip_archive_is_served(client, upload_dir):
+    # .gz без оригинала рядом — это сам загруженный файл, а не сжатый вариант
+    response = client.get("/uploads/1700000000.tar.gz", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert gzip.decompress(response.content) == b"archive"
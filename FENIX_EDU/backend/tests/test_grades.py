@@ -0,0 +1,78 @@
+import pytest
+
+from broker import broker
+from messenger import user_channel
+from models import Assignment, AssignmentSubmission, Course, UserRole
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+
+    async def publish(channel, event):
+        events.append((channel, event))
+
+    monkeypatch.setattr(broker, "publish", publish)
+    return events
+
+
+@pytest.fixture
+def graded_assignment(db, make_user):
+    teacher = make_user(UserRole.TEACHER)
+    course = Course(name="grades")
+    db.add(course)
+    db.flush()
+    a = Assignment(course_id=course.id, subsection_id=1, title="grades", created_by=teacher.id)
+    db.add(a)
+    db.flush()
+    students = [make_user(), make_user()]
+    subs = [AssignmentSubmission(assignment_id=a.id, student_id=s.id, content="-") for s in students]
+    db.add_all(subs)
+    db.commit()
+    return teacher, a, subs
+
+
+def test_bulk_grades_reach_student_and_teacher_channels(client, auth_headers, published, graded_assignment):
+    teacher, a, subs = graded_assignment
+    response = client.post(
+        f"/api/assignments/{a.id}/grades",
+        json={"items": [
+            {"submission_id": subs[0].id, "grade": 90, "teacher_comment": " хорошо "},
+            {"submission_id": subs[1].id, "grade": 75},
+            {"submission_id": subs[1].id, "grade": 80},
+        ]},
+        headers=auth_headers(teacher),
+    )
+    assert response.status_code == 200
+    assert response.json()["updated"] == 2
+    assert [r["success"] for r in response.json()["results"]] == [True, True, False]
+
+    by_channel = {channel: event["submission_ids"] for channel, event in published}
+    assert by_channel == {
+        user_channel(subs[0].student_id): [subs[0].id],
+        user_channel(subs[1].student_id): [subs[1].id],
+        user_channel(teacher.id): [subs[0].id, subs[1].id],
+    }
+    assert all(event["type"] == "grades.updated" for _, event in published)
+
+
+def test_single_grade_reaches_student_channel(client, auth_headers, published, graded_assignment):
+    teacher, _, subs = graded_assignment
+    response = client.put(
+        f"/api/submissions/{subs[0].id}/grade", json={"grade": 50}, headers=auth_headers(teacher)
+    )
+    assert response.status_code == 200
+    assert {channel for channel, _ in published} == {
+        user_channel(subs[0].student_id), user_channel(teacher.id),
+    }
+
+
+def test_bulk_grades_validate_items(client, auth_headers, published, graded_assignment):
+    teacher, a, subs = graded_assignment
+    response = client.post(
+        f"/api/assignments/{a.id}/grades",
+        json={"items": [{"submission_id": subs[0].id, "grade": 101}]},
+        headers=auth_headers(teacher),
+    )
+    assert response.status_code == 422
+    assert published == []
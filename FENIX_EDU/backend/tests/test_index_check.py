@@ -0,0 +1,33 @@
+"""Горячие запросы идут по индексам (EXPLAIN QUERY PLAN на базе по миграциям)"""
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, pool, text
+from sqlalchemy.orm import sessionmaker
+
+from db_migrations import alembic_config, upgrade_database
+from index_check import check_indexes
+
+
+def test_hot_queries_use_indexes(db):
+    assert check_indexes(db) == []
+
+
+def test_missing_indexes_are_reported(tmp_path):
+    # без составных индексов 0003 проверка обязана заметить полные просмотры
+    url = f"sqlite:///{tmp_path / 'no-indexes.db'}"
+    upgrade_database(url)
+    engine = create_engine(url, poolclass=pool.NullPool)
+    indexes = ScriptDirectory.from_config(alembic_config(url)).get_revision("0003").module.INDEXES
+    with engine.begin() as conn:
+        for name, _table, _columns in indexes:
+            conn.execute(text(f"DROP INDEX {name}"))
+
+    db = sessionmaker(bind=engine)()
+    try:
+        problems = check_indexes(db)
+    finally:
+        db.close()
+        engine.dispose()
+
+    scanned = {problem.split("\n")[0] for problem in problems}
+    assert "диалоги студента: полный просмотр message_threads" in scanned
+    assert "курсы группы: полный просмотр courses" in scanned
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from database import SessionLocal
+from message_archive import archive_messages
+from messenger import message_page
+from models import ArchivedMessage, Message, MessageThread, UserRole
+
+
+@pytest.fixture
+def thread(db, make_user):
+    student, teacher = make_user(UserRole.STUDENT), make_user(UserRole.TEACHER)
+    thread = MessageThread(student_id=student.id, teacher_id=teacher.id)
+    db.add(thread)
+    db.flush()
+    now = datetime.utcnow()
+    for i in range(120):
+        db.add(Message(
+            thread_id=thread.id,
+            sender_id=student.id if i % 2 else teacher.id,
+            content=str(i),
+            # каждое десятое непрочитано и останется в messages среди архивных
+            is_read=i % 10 != 0,
+            created_at=now - timedelta(days=400 - i * 3),
+        ))
+    db.commit()
+    return thread
+
+
+def pages(db, thread_id):
+    numbered = [message_page(db, thread_id, page, 25, None, None) for page in range(1, 7)]
+    scroll, cursor = [], None
+    while True:
+        messages, cursor = message_page(db, thread_id, 1, 17, cursor, None)
+        scroll = [m["id"] for m in messages] + scroll
+        if cursor is None:
+            break
+    after = message_page(db, thread_id, 1, 30, None, scroll[10])
+    return numbered, scroll, after
+
+
+def test_archive_is_transparent_to_message_pages(db, thread):
+    before = pages(db, thread.id)
+    result = archive_messages(db, older_than_days=180, batch_size=25)
+
+    assert result["messages"] > 0
+    assert db.query(ArchivedMessage).filter(ArchivedMessage.thread_id == thread.id).count() == result["messages"]
+    assert db.query(ArchivedMessage).filter(ArchivedMessage.is_read == False).count() == 0
+    assert pages(db, thread.id) == before
+
+
+def test_numbered_page_loads_only_one_page(db, thread):
+    archive_messages(db, older_than_days=180)
+    loaded = []
+
+    def count(target, context):
+        loaded.append(target.id)
+
+    for model in (Message, ArchivedMessage):
+        event.listen(model, "load", count)
+    # отдельная сессия: каждое сообщение загружается заново и попадает в счёт
+    fresh = SessionLocal()
+    try:
+        messages, _ = message_page(fresh, thread.id, 4, 25, None, None)
+    finally:
+        fresh.close()
+        for model in (Message, ArchivedMessage):
+            event.remove(model, "load", count)
+
+    assert len(messages) == 25
+    assert sorted(loaded) == sorted(m["id"] for m in messages)
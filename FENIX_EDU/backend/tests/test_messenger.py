@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from models import Message, MessageThread, UserRole
+
+
+def seed_threads(db, make_user, teacher, count):
+    now = datetime.utcnow()
+    for i in range(count):
+        student = make_user(UserRole.STUDENT)
+        thread = MessageThread(student_id=student.id, teacher_id=teacher.id, last_message_at=now - timedelta(minutes=i))
+        db.add(thread)
+        db.flush()
+        db.add_all([
+            Message(thread_id=thread.id, sender_id=student.id, content="вопрос"),
+            Message(thread_id=thread.id, sender_id=teacher.id, content="ответ"),
+        ])
+    db.commit()
+
+
+def test_thread_list_query_count_does_not_grow_with_threads(client, db, make_user, auth_headers, queries):
+    counts = {}
+    for threads in (5, 50):
+        teacher = make_user(UserRole.TEACHER)
+        seed_threads(db, make_user, teacher, threads)
+
+        with queries:
+            response = client.get("/api/messenger/threads", headers=auth_headers(teacher))
+        assert response.status_code == 200
+        assert len(response.json()) == threads
+        assert all(thread["last_message"]["content"] == "ответ" for thread in response.json())
+        counts[threads] = queries.count
+
+    assert counts[5] == counts[50]
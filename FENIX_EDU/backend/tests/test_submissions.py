@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Assignment, AssignmentSubmission, AssignmentSubmissionVersion, Course, UserRole
+
+DEADLINE = datetime(2026, 9, 1, 12, 0)
+
+
+@pytest.fixture
+def assignment(db, make_user):
+    teacher = make_user(UserRole.TEACHER)
+    course = Course(name="submissions")
+    db.add(course)
+    db.flush()
+    a = Assignment(course_id=course.id, subsection_id=1, title="submissions", created_by=teacher.id, deadline=DEADLINE)
+    db.add(a)
+    db.commit()
+    a.teacher = teacher
+    return a
+
+
+def submit(db, assignment, student, *times):
+    """Сдача с версиями в моменты times (первая — исходная сдача)"""
+    sub = AssignmentSubmission(
+        assignment_id=assignment.id, student_id=student.id, content="-",
+        version=len(times), created_at=times[0], updated_at=times[-1],
+    )
+    db.add(sub)
+    db.flush()
+    db.add_all([
+        AssignmentSubmissionVersion(submission_id=sub.id, version=i + 1, content="-", submitted_at=at)
+        for i, at in enumerate(times)
+    ])
+    db.commit()
+    return sub
+
+
+def test_submissions_are_not_paginated_without_limit(client, db, make_user, auth_headers, assignment):
+    for _ in range(60):
+        submit(db, assignment, make_user(), DEADLINE - timedelta(hours=1))
+    url = f"/api/assignments/{assignment.id}/submissions"
+
+    response = client.get(url, headers=auth_headers(assignment.teacher))
+    assert response.status_code == 200
+    assert len(response.json()) == 60
+    assert response.headers["X-Total-Count"] == "60"
+
+    page = client.get(url, params={"page": 2, "limit": 25}, headers=auth_headers(assignment.teacher))
+    assert len(page.json()) == 25
+    assert page.headers["X-Total-Count"] == "60"
+
+
+def test_late_only_counts_late_resubmissions(client, db, make_user, auth_headers, assignment):
+    on_time = submit(db, assignment, make_user(), DEADLINE - timedelta(days=1))
+    late = submit(db, assignment, make_user(), DEADLINE + timedelta(hours=1))
+    resubmitted = submit(db, assignment, make_user(), DEADLINE - timedelta(days=1), DEADLINE + timedelta(days=1))
+
+    response = client.get(
+        f"/api/assignments/{assignment.id}/submissions",
+        params={"late_only": True},
+        headers=auth_headers(assignment.teacher),
+    )
+    ids = {item["id"] for item in response.json()}
+    assert ids == {late.id, resubmitted.id}
+    assert on_time.id not in ids
@@ -0,0 +1,114 @@
+import asyncio
+import os
+
+import pytest
+from fastapi import HTTPException
+
+import blob_store
+import main
+from config import settings
+from models import Assignment, AssignmentAttachment, Course, UserRole
+from uploads import receive_uploads
+
+BOUNDARY = "fenix-test-boundary"
+CHUNK = 64 * 1024
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(blob_store, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "UPLOAD_MAX_FILE_MB", 1)
+    monkeypatch.setattr(settings, "UPLOAD_MAX_REQUEST_MB", 2)
+    return tmp_path
+
+
+def multipart_body(*files) -> bytes:
+    body = b""
+    for name, data in files:
+        body += (
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+class StreamingRequest:
+    """Запрос без Content-Length: тело приходит кусками, прочитанные считаются"""
+
+    def __init__(self, body: bytes):
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+        self.chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)]
+        self.read = 0
+
+    async def stream(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+def leftovers(upload_dir):
+    return [name for name in os.listdir(upload_dir) if name.endswith(".part")]
+
+
+def test_receive_uploads_hashes_and_sizes_files(upload_dir):
+    request = StreamingRequest(multipart_body(("a.txt", b"a" * 200_000), ("empty.txt", b"")))
+    staged = asyncio.run(receive_uploads(request, str(upload_dir)))
+    try:
+        assert [(item.filename, item.size) for item in staged] == [("a.txt", 200_000), ("empty.txt", 0)]
+        with open(staged[0].temp_path, "rb") as f:
+            assert f.read() == b"a" * 200_000
+    finally:
+        for item in staged:
+            item.discard()
+
+
+@pytest.mark.parametrize("files", [
+    [("big.bin", b"x" * 5 * 1024 * 1024)],  # один файл больше UPLOAD_MAX_FILE_MB
+    [(f"{i}.bin", b"x" * 900 * 1024) for i in range(6)],  # в сумме больше UPLOAD_MAX_REQUEST_MB
+])
+def test_chunked_body_is_cut_off_at_limit(upload_dir, files):
+    request = StreamingRequest(multipart_body(*files))
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(receive_uploads(request, str(upload_dir)))
+
+    assert e.value.status_code == 413
+    # тело дочитано только до превышения лимита, временных файлов не осталось
+    assert request.read <= (2 * 1024 * 1024) // CHUNK + 1
+    assert request.read < len(request.chunks)
+    assert leftovers(upload_dir) == []
+
+
+def test_upload_attachments_endpoint(client, db, make_user, auth_headers, upload_dir):
+    teacher = make_user(UserRole.TEACHER)
+    course = Course(name="uploads")
+    db.add(course)
+    db.flush()
+    assignment = Assignment(course_id=course.id, subsection_id=1, title="uploads", created_by=teacher.id)
+    db.add(assignment)
+    db.commit()
+
+    response = client.post(
+        f"/api/assignments/{assignment.id}/attachments",
+        files=[("files", ("notes.txt", b"notes", "text/plain"))],
+        headers=auth_headers(teacher),
+    )
+    assert response.status_code == 200
+    assert [(item["name"], item["size"]) for item in response.json()] == [("notes.txt", 5)]
+    assert db.query(AssignmentAttachment).filter_by(assignment_id=assignment.id).count() == 1
+
+    too_large = client.post(
+        f"/api/assignments/{assignment.id}/attachments",
+        files=[("files", ("big.bin", b"x" * (1024 * 1024 + 1), "application/octet-stream"))],
+        headers=auth_headers(teacher),
+    )
+    assert too_large.status_code == 413
+    assert leftovers(upload_dir) == []
+
+    missing = client.post(
+        "/api/assignments/999999/attachments",
+        files=[("files", ("notes.txt", b"notes", "text/plain"))],
+        headers=auth_headers(teacher),
+    )
+    assert missing.status_code == 404
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, Request, status
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from config import settings
+
+
+CHUNK_SIZE = 1024 * 1024  # 1 МБ
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+
+
+def check_upload_size(request: Request) -> None:
+    """Зависимость: отклонить запрос сразу по Content-Length, не читая тело.
+
+    Запросы без Content-Length ограничивает receive_uploads по ходу чтения.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > settings.UPLOAD_MAX_REQUEST_MB * 1024 * 1024:
+            raise _too_large(f"Размер запроса превышает {settings.UPLOAD_MAX_REQUEST_MB} МБ")
+
+
+class StagedUpload:
+    """Загруженный во временный файл и ещё не опубликованный файл"""
+
+    def __init__(self, filename: str, temp_path: str, size: int, sha256: str):
+        self.filename = filename
+        self.temp_path = temp_path
+        self.size = size
+        self.sha256 = sha256
+
+    @property
+    def ext(self) -> str:
+        return os.path.splitext(self.filename or "")[1].lower()
+
+    def move_to(self, path: str) -> None:
+        # os.replace атомарен в пределах одной файловой системы:
+        # по итоговому пути никогда не окажется недописанный файл
+        os.replace(self.temp_path, path)
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+class _Part:
+    """Файловая часть multipart-тела, которая сейчас пишется во временный файл"""
+
+    def __init__(self, filename: str, directory: str):
+        self.filename = filename
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+        os.close(fd)
+        self.out = None
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    async def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > settings.UPLOAD_MAX_FILE_MB * 1024 * 1024:
+            raise _too_large(f"Файл {self.filename} больше {settings.UPLOAD_MAX_FILE_MB} МБ")
+        if self.out is None:
+            self.out = await anyio.open_file(self.temp_path, "wb")
+        self.digest.update(chunk)
+        await self.out.write(chunk)
+
+    async def finish(self) -> StagedUpload:
+        if self.out is not None:
+            await self.out.aclose()
+        return StagedUpload(self.filename, self.temp_path, self.size, self.digest.hexdigest())
+
+    async def abort(self) -> None:
+        if self.out is not None:
+            await self.out.aclose()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+async def receive_uploads(request: Request, directory: str, field: str = "files") -> List[StagedUpload]:
+    """Разобрать multipart-тело по мере поступления и записать файлы поля field
+    во временные файлы кусками, как они приходят.
+
+    Размер и SHA-256 считаются по ходу записи. Лимиты на файл и на весь запрос
+    проверяются на каждом куске тела, поэтому и запрос без Content-Length
+    (chunked) обрывается с 413 сразу после превышения, а не когда всё тело уже
+    на диске. При ошибке ни один файл не остаётся на диске.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ожидается multipart/form-data")
+
+    events: List[Tuple[str, bytes]] = []
+
+    def on(kind: str):
+        def callback(data: bytes = b"", start: int = 0, end: int = 0) -> None:
+            events.append((kind, data[start:end]))
+        return callback
+
+    parser = MultipartParser(boundary, callbacks={
+        "on_part_begin": on("begin"),
+        "on_header_field": on("header_field"),
+        "on_header_value": on("header_value"),
+        "on_header_end": on("header_end"),
+        "on_headers_finished": on("headers_finished"),
+        "on_part_data": on("data"),
+        "on_part_end": on("end"),
+    })
+
+    max_request_bytes = settings.UPLOAD_MAX_REQUEST_MB * 1024 * 1024
+    received = 0
+    staged: List[StagedUpload] = []
+    part: Optional[_Part] = None
+    header_field, header_value, headers = b"", b"", {}
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise _too_large(f"Размер запроса превышает {settings.UPLOAD_MAX_REQUEST_MB} МБ")
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректное multipart-тело")
+
+            for kind, data in events:
+                if kind == "begin":
+                    header_field, header_value, headers = b"", b"", {}
+                elif kind == "header_field":
+                    header_field += data
+                elif kind == "header_value":
+                    header_value += data
+                elif kind == "header_end":
+                    headers[header_field.lower()] = header_value
+                    header_field, header_value = b"", b""
+                elif kind == "headers_finished":
+                    _, options = parse_options_header(headers.get(b"content-disposition", b""))
+                    name = options.get(b"name", b"").decode("utf-8", "replace")
+                    filename = options.get(b"filename")
+                    if name == field and filename is not None:
+                        part = _Part(filename.decode("utf-8", "replace"), directory)
+                elif kind == "data":
+                    # прочие поля формы не нужны — их данные пропускаются
+                    if part is not None:
+                        await part.write(data)
+                elif kind == "end" and part is not None:
+                    staged.append(await part.finish())
+                    part = None
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        if part is not None:
+            await part.abort()
+        for item in staged:
+            item.discard()
+        raise
+
+    if not staged:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Не выбраны файлы")
+    return staged
+
+
+# тело разбирается потоково (receive_uploads), без параметра File(...) —
+# схему формы для документации API описываем вручную
+FILES_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                },
+            },
+        },
+    },
+}
@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import BackgroundTasks
+
+from broker import broker
+from config import settings
+from models import User
+
+
+# канал, по которому воркеры сообщают друг другу об изменении пользователя
+USER_INVALIDATION_CHANNEL = "users:invalidate"
+
+
+class UserCache:
+    """Кеш пользователей для авторизации: LRU с ограничением размера и TTL.
+
+    Хранит отсоединённые от сессии объекты User, поэтому обработчики могут
+    читать их атрибуты, но не должны их изменять.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, user_id: int) -> Optional[User]:
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None:
+                return None
+            user, expires_at = item
+            if expires_at < time.monotonic():
+                del self._items[user_id]
+                return None
+            self._items.move_to_end(user_id)
+            return user
+
+    def put(self, user: User) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._items[user.id] = (user, time.monotonic() + self.ttl_seconds)
+            self._items.move_to_end(user.id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._items.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+user_cache = UserCache(settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(background_tasks: BackgroundTasks, user_id: int) -> None:
+    """Сбросить пользователя из кеша здесь и (через брокер) в остальных воркерах"""
+    user_cache.invalidate(user_id)
+    background_tasks.add_task(broker.publish, USER_INVALIDATION_CHANNEL, {"user_id": user_id})
+
+
+async def listen_for_invalidations() -> None:
+    async with broker.subscription(USER_INVALIDATION_CHANNEL) as queue:
+        while True:
+            message = json.loads(await queue.get())
+            user_cache.invalidate(message["user_id"])
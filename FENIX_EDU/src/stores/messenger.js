@@ -1,5 +1,6 @@
 import { defineStore } from "pinia";
 import { ref, computed } from "vue";
+import { useAuthStore } from "./auth";
 
 const API_URL = "http://127.0.0.1:8000";
 
@@ -119,6 +120,164 @@ export const useMessengerStore = defineStore("messenger", () => {
     }
   };
 
+  // ---------- push-канал (WebSocket) ----------
+  // Сервер сам присылает новые сообщения, прочтения и изменения счетчиков,
+  // поэтому после действий не нужно заново запрашивать unread-count и threads.
+  // Пока канал не подключен, работает прежний опрос раз в 30 секунд.
+  const POLL_INTERVAL = 30000;
+  let socket = null;
+  let realtimeEnabled = false;
+  let reconnectTimer = null;
+  let reconnectDelay = 1000;
+  let pollTimer = null;
+  let tokenRefreshed = false;
+
+  const addMessage = (message) => {
+    if (!currentThread.value || currentThread.value.id !== message.thread_id) {
+      return;
+    }
+    if (!messages.value.some((m) => m.id === message.id)) {
+      messages.value.push(message);
+    }
+  };
+
+  const handleRealtimeEvent = (event) => {
+    const thread = threads.value.find((t) => t.id === event.thread_id);
+
+    switch (event.type) {
+      case "message.new":
+        addMessage(event.message);
+        if (thread) {
+          thread.last_message = event.message;
+          thread.last_message_at = event.message.created_at;
+        } else {
+          // новый диалог — подтягиваем список целиком
+          fetchThreads().catch(() => {});
+        }
+        break;
+      case "unread.delta":
+        totalUnread.value = Math.max(0, totalUnread.value + event.delta);
+        if (thread) {
+          thread.unread_count = Math.max(0, thread.unread_count + event.delta);
+        }
+        break;
+      case "thread.read":
+        // собеседник прочитал наши сообщения до last_read_id включительно
+        if (thread) {
+          thread.partner_last_read_id = event.last_read_id;
+        }
+        if (currentThread.value && currentThread.value.id === event.thread_id) {
+          messages.value.forEach((m) => {
+            if (m.sender_id !== event.reader_id && m.id <= event.last_read_id) {
+              m.is_read = true;
+            }
+          });
+        }
+        break;
+    }
+  };
+
+  const startPolling = () => {
+    if (pollTimer) {
+      return;
+    }
+    pollTimer = setInterval(() => {
+      fetchUnreadCount().catch(() => {});
+      // без fetchThreads: тот переключает isLoading и мигает индикатором
+      apiRequest("GET", "/api/messenger/threads")
+        .then((response) => {
+          threads.value = response;
+        })
+        .catch(() => {});
+    }, POLL_INTERVAL);
+  };
+
+  const stopPolling = () => {
+    if (pollTimer) {
+      clearInterval(pollTimer);
+      pollTimer = null;
+    }
+  };
+
+  const scheduleReconnect = () => {
+    if (reconnectTimer) {
+      return;
+    }
+    reconnectTimer = setTimeout(() => {
+      reconnectTimer = null;
+      connectRealtime();
+    }, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+  };
+
+  const connectRealtime = () => {
+    realtimeEnabled = true;
+    if (socket) {
+      return;
+    }
+    const token = localStorage.getItem("access_token");
+    if (!token) {
+      // токен могут как раз обновлять — пробуем позже (до disconnectRealtime)
+      scheduleReconnect();
+      return;
+    }
+
+    const wsUrl = API_URL.replace(/^http/, "ws");
+    socket = new WebSocket(
+      `${wsUrl}/api/messenger/ws?token=${encodeURIComponent(token)}`,
+    );
+
+    socket.onopen = () => {
+      reconnectDelay = 1000;
+      tokenRefreshed = false;
+      stopPolling();
+      // после (пере)подключения сверяем состояние один раз
+      fetchUnreadCount().catch(() => {});
+    };
+
+    socket.onmessage = (message) => {
+      try {
+        handleRealtimeEvent(JSON.parse(message.data));
+      } catch (error) {
+        console.error("Ошибка обработки события мессенджера:", error);
+      }
+    };
+
+    socket.onclose = async (event) => {
+      socket = null;
+      startPolling();
+      // 1008 — токен истёк или не принят: обновляем его один раз и
+      // переподключаемся; если и новый не принят, остаются опрос и
+      // попытки переподключения с растущей паузой
+      if (event.code === 1008 && !tokenRefreshed) {
+        tokenRefreshed = true;
+        try {
+          await useAuthStore().refreshToken();
+        } catch (error) {
+          // refreshToken при ошибке сам выходит из аккаунта
+          return;
+        }
+      }
+      if (realtimeEnabled) {
+        scheduleReconnect();
+      }
+    };
+  };
+
+  const disconnectRealtime = () => {
+    realtimeEnabled = false;
+    stopPolling();
+    if (reconnectTimer) {
+      clearTimeout(reconnectTimer);
+      reconnectTimer = null;
+    }
+    if (socket) {
+      socket.onclose = null;
+      socket.close();
+      socket = null;
+    }
+  };
+
   // Отправить сообщение
   const sendMessage = async (teacherId, content) => {
     try {
@@ -126,8 +285,6 @@ export const useMessengerStore = defineStore("messenger", () => {
         teacher_id: teacherId,
         content: content,
       });
-      // Обновляем счетчик непрочитанных
-      await fetchUnreadCount();
       return response;
     } catch (error) {
       console.error("Ошибка отправки сообщения:", error);
@@ -145,10 +302,8 @@ export const useMessengerStore = defineStore("messenger", () => {
           content: content,
         },
       );
-      // Добавляем сообщение в список
-      messages.value.push(response);
-      // Обновляем счетчик непрочитанных
-      await fetchUnreadCount();
+      // Добавляем сообщение в список (push-событие с тем же id будет пропущено)
+      addMessage(response);
       return response;
     } catch (error) {
       console.error("Ошибка отправки ответа:", error);
@@ -159,14 +314,8 @@ export const useMessengerStore = defineStore("messenger", () => {
   // Пометить диалог как прочитанный
   const markAsRead = async (threadId) => {
     try {
+      // Счетчики обновит событие unread.delta из push-канала
       await apiRequest("POST", `/api/messenger/threads/${threadId}/read`);
-      // Обновляем счетчик непрочитанных
-      await fetchUnreadCount();
-      // Обновляем локальный список диалогов
-      const thread = threads.value.find((t) => t.id === threadId);
-      if (thread) {
-        thread.unread_count = 0;
-      }
     } catch (error) {
       console.error("Ошибка отметки как прочитанного:", error);
       throw error;
@@ -209,6 +358,8 @@ export const useMessengerStore = defineStore("messenger", () => {
     sendReply,
     markAsRead,
     archiveThread,
+    connectRealtime,
+    disconnectRealtime,
     getAvatarInitials,
   };
 });